@@ -0,0 +1,240 @@
+# admission.py - 识别/匹配流水线的准入控制与降载
+"""
+每个阶段 (asr / match) 使用独立、有界的线程池：
+
+  - 排队数达到上限时直接拒绝 (Overloaded)，不再无限堆积
+  - 每段语音带一个截止时间 (Deadline)，开始执行时已过期的任务直接丢弃
+  - 匹配阶段积压或延迟过高时进入降级模式，改用廉价的字面匹配，恢复后自动退出
+
+所有计数和延迟分位数通过 snapshot() 汇报，由 /metrics 接口输出。
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from app_logger import get_logger
+
+logger = get_logger("admission")
+
+STAGE_ASR = 'asr'
+STAGE_MATCH = 'match'
+
+
+class Overloaded(Exception):
+    """阶段排队已满，任务被拒绝"""
+
+
+class DeadlineExceeded(Exception):
+    """任务开始执行前已超过截止时间"""
+
+
+class Deadline:
+    """一段语音从到达起必须在多长时间内给出答案"""
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget_ms / 1000
+
+    def elapsed_ms(self) -> float:
+        """从语音段到达至今的毫秒数"""
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    def remaining(self) -> float:
+        """剩余秒数 (可能为负)"""
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+class StageExecutor:
+    """单个阶段的有界线程池"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, latency_window: int = 200):
+        """
+        Args:
+            name: 阶段名称
+            max_workers: 线程数
+            max_queue: 允许排队等待的任务数 (不含正在执行的)
+            latency_window: 统计延迟分位数时保留的最近样本数
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"stage-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self._latencies = deque(maxlen=latency_window)
+        self.stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'expired': 0, 'failed': 0}
+
+    def has_capacity(self) -> bool:
+        return self.queued < self.max_queue
+
+    async def run(self, fn: Callable, *args, deadline: Optional[Deadline] = None):
+        """
+        在本阶段线程池中执行 fn(*args)
+
+        Raises:
+            Overloaded: 排队已满
+            DeadlineExceeded: 提交时或轮到执行时已过截止时间
+        """
+        with self._lock:
+            if deadline is not None and deadline.expired():
+                self.stats['expired'] += 1
+                raise DeadlineExceeded(self.name)
+            if self.queued >= self.max_queue:
+                self.stats['rejected'] += 1
+                raise Overloaded(self.name)
+            self.queued += 1
+            self.stats['submitted'] += 1
+
+        submitted_at = time.perf_counter()
+        # 与 asyncio.to_thread 一样把上下文 (会话号等) 带入工作线程
+        context = contextvars.copy_context()
+        expired = object()
+
+        def job():
+            with self._lock:
+                self.queued -= 1
+                if deadline is not None and deadline.expired():
+                    self.stats['expired'] += 1
+                    return expired
+                self.running += 1
+            try:
+                return context.run(fn, *args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, job)
+        except Exception:
+            self.stats['failed'] += 1
+            raise
+        if result is expired:
+            raise DeadlineExceeded(self.name)
+        self.stats['completed'] += 1
+        self._latencies.append((time.perf_counter() - submitted_at) * 1000)
+        return result
+
+    def latency_percentile(self, q: float) -> float:
+        """最近任务 (含排队时间) 的延迟分位数，毫秒"""
+        if not self._latencies:
+            return 0.0
+        return float(np.percentile(np.fromiter(self._latencies, dtype=np.float64), q))
+
+    def snapshot(self) -> Dict:
+        return dict(self.stats, workers=self.max_workers, max_queue=self.max_queue,
+                    queued=self.queued, running=self.running,
+                    p50_ms=round(self.latency_percentile(50), 1),
+                    p95_ms=round(self.latency_percentile(95), 1))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AdmissionController:
+    """
+    整条流水线的准入控制
+
+    用法:
+        deadline = admission.new_deadline()
+        result = await admission.run(STAGE_ASR, recognizer.finalize, deadline=deadline)
+
+    同一会话的语音段由会话的接收循环依次处理，不需要再做会话级并发限制。
+    """
+
+    def __init__(self, asr_workers: int = 2, asr_queue: int = 8, match_workers: int = 2,
+                 match_queue: int = 16, deadline_ms: float = 4000, degrade_latency_ms: float = 800):
+        """
+        Args:
+            asr_workers / asr_queue: 识别阶段的线程数和排队上限
+            match_workers / match_queue: 匹配阶段的线程数和排队上限
+            deadline_ms: 一段语音从到达到给出答案的时间预算
+            degrade_latency_ms: 匹配阶段p95延迟超过该值时进入降级模式
+        """
+        self.stages = {
+            STAGE_ASR: StageExecutor(STAGE_ASR, asr_workers, asr_queue),
+            STAGE_MATCH: StageExecutor(STAGE_MATCH, match_workers, match_queue),
+        }
+        self.deadline_ms = deadline_ms
+        self.degrade_latency_ms = degrade_latency_ms
+        self.degraded = False
+        self.stats = {'segments_dropped': 0, 'degraded_entered': 0,
+                      'degraded_matches': 0, 'speculation_skipped': 0}
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        """从环境变量读取配置"""
+        cpus = os.cpu_count() or 2
+        env = os.environ.get
+        return cls(
+            asr_workers=int(env('INTERVIEW_ASR_WORKERS', max(1, cpus // 2))),
+            asr_queue=int(env('INTERVIEW_ASR_QUEUE', 8)),
+            match_workers=int(env('INTERVIEW_MATCH_WORKERS', 2)),
+            match_queue=int(env('INTERVIEW_MATCH_QUEUE', 16)),
+            deadline_ms=float(env('INTERVIEW_DEADLINE_MS', 4000)),
+            degrade_latency_ms=float(env('INTERVIEW_DEGRADE_LATENCY_MS', 800)),
+        )
+
+    def new_deadline(self) -> Deadline:
+        return Deadline(self.deadline_ms)
+
+    async def run(self, stage: str, fn: Callable, *args, deadline: Optional[Deadline] = None):
+        return await self.stages[stage].run(fn, *args, deadline=deadline)
+
+    async def try_run(self, stage: str, fn: Callable, *args):
+        """尽力执行的任务 (如中间结果)，排队已满时直接跳过并返回None"""
+        try:
+            return await self.stages[stage].run(fn, *args)
+        except Overloaded:
+            return None
+
+    def record_drop(self, reason: str) -> None:
+        self.stats['segments_dropped'] += 1
+        logger.warning("✗ 丢弃语音段: %s", reason)
+
+    def check_degraded(self) -> bool:
+        """根据匹配阶段的积压和延迟更新降级状态 (带回差，避免频繁切换)"""
+        match = self.stages[STAGE_MATCH]
+        p95 = match.latency_percentile(95)
+        if not self.degraded:
+            if match.queued >= max(1, match.max_queue // 2) or p95 > self.degrade_latency_ms:
+                self.degraded = True
+                self.stats['degraded_entered'] += 1
+                logger.warning("⚠ 匹配负载过高 (排队 %d, p95 %.0fms)，进入降级模式", match.queued, p95)
+        elif match.queued == 0 and p95 < self.degrade_latency_ms / 2:
+            self.degraded = False
+            logger.info("✓ 匹配负载恢复，退出降级模式")
+        return self.degraded
+
+    def allow_speculation(self) -> bool:
+        """预判匹配是锦上添花，有积压或降级时最先被舍弃"""
+        match = self.stages[STAGE_MATCH]
+        if self.degraded or match.queued > 0:
+            self.stats['speculation_skipped'] += 1
+            return False
+        return True
+
+    def snapshot(self) -> Dict:
+        return {
+            'degraded': self.degraded,
+            'deadline_ms': self.deadline_ms,
+            'stages': {name: stage.snapshot() for name, stage in self.stages.items()},
+            **self.stats,
+        }
+
+    def shutdown(self) -> None:
+        for stage in self.stages.values():
+            stage.shutdown()
+
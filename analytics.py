@@ -0,0 +1,195 @@
+# analytics.py - 汇总语音段记录：实时率、识别延迟、端到端延迟SLO与低置信度语音段
+"""
+读取 INTERVIEW_SEGMENT_LOG 写出的JSONL (见 segment_metrics.py)，按时间分桶输出:
+
+  - 实时率 (识别计算耗时 / 音频时长) 的分位数，用于评估硬件能承载多少并发
+  - 识别延迟 (句末到拿到最终识别结果，含排队) 与端到端延迟的分位数
+  - 端到端延迟满足SLO的比例 (因过载、超时或出错被放弃的语音段计为未满足)、匹配率
+  - 平均词置信度最低的语音段；没有词置信度的语音段 (如开启n-best时) 单独计数
+
+用法:
+
+    python analytics.py segments.jsonl --bucket 60 --slo-ms 800 --since 2024-05-01
+    python analytics.py segments.jsonl --json > summary.json
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from segment_metrics import LOW_CONFIDENCE
+
+PERCENTILES = (50, 95, 99)
+
+
+def load_segments(paths: Iterable[str], since: Optional[float] = None,
+                  until: Optional[float] = None) -> List[Dict]:
+    """读取语音段记录 (跳过无法解析的行)，按时间排序"""
+    segments = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                ts = record.get('ts', 0)
+                if (since is None or ts >= since) and (until is None or ts < until):
+                    segments.append(record)
+    segments.sort(key=lambda r: r.get('ts', 0))
+    return segments
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {f'p{q}': None for q in PERCENTILES}
+    result = np.percentile(np.asarray(values, dtype=np.float64), PERCENTILES)
+    return {f'p{q}': round(float(v), 3) for q, v in zip(PERCENTILES, result)}
+
+
+def summarize(segments: List[Dict], slo_ms: float = 800.0,
+              low_confidence: float = LOW_CONFIDENCE) -> Dict:
+    """
+    一组语音段的汇总
+
+    Returns:
+        segments、dropped (被放弃的语音段数)、audio_minutes、rtf / decode_lag_ms / total_ms 的分位数
+        (total_ms 只统计完成的语音段)、slo_ratio (端到端延迟不超过 slo_ms 的比例，被放弃的计为未满足)、
+        match_rate、low_conf_ratio、no_conf (有识别文本但没有词置信度的语音段数)
+    """
+    completed = [s for s in segments if not s.get('dropped')]
+    dropped = len(segments) - len(completed)
+    measured = [t for t in (s.get('stages', {}).get('total') for s in completed) if t is not None]
+    texts = [s for s in segments if s.get('text')]
+    confident = [s for s in segments if s.get('mean_conf') is not None]
+    slo_total = len(measured) + dropped
+    audio_ms = sum(s.get('audio_ms') or 0 for s in segments)
+    decode_ms = sum(s.get('decode_ms') or 0 for s in segments)
+    return {
+        'segments': len(segments),
+        'dropped': dropped,
+        'audio_minutes': round(audio_ms / 60000, 2),
+        # 总体实时率按时长加权，长句不会被大量短句稀释
+        'rtf_overall': round(decode_ms / audio_ms, 4) if audio_ms else None,
+        'rtf': _percentiles([s.get('rtf') for s in segments]),
+        'decode_lag_ms': _percentiles([s.get('decode_lag_ms') for s in segments]),
+        'total_ms': _percentiles(measured),
+        'slo_ratio': round(sum(1 for t in measured if t <= slo_ms) / slo_total, 4) if slo_total else None,
+        'match_rate': round(sum(1 for s in texts if s.get('matched') is not None) / len(texts), 4) if texts else None,
+        'low_conf_ratio': round(sum(1 for s in confident if s['mean_conf'] < low_confidence) / len(confident), 4)
+        if confident else None,
+        'no_conf': len(texts) - sum(1 for s in texts if s.get('mean_conf') is not None),
+    }
+
+
+def bucketize(segments: List[Dict], bucket_minutes: int) -> List[Dict]:
+    """按结束时间分桶，返回 [{'start': 桶起始时间戳, 'segments': [...]}]"""
+    width = bucket_minutes * 60
+    buckets: Dict[int, List[Dict]] = {}
+    for segment in segments:
+        start = int(segment.get('ts', 0) // width * width)
+        buckets.setdefault(start, []).append(segment)
+    return [{'start': start, 'segments': items} for start, items in sorted(buckets.items())]
+
+
+def low_confidence_segments(segments: List[Dict], limit: int = 20,
+                            low_confidence: float = LOW_CONFIDENCE) -> List[Dict]:
+    """平均词置信度低于阈值的语音段，最低的在前"""
+    low = [s for s in segments if s.get('mean_conf') is not None and s['mean_conf'] < low_confidence]
+    low.sort(key=lambda s: s['mean_conf'])
+    return low[:limit]
+
+
+def _format_time(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M')
+
+
+def _parse_time(text: str) -> float:
+    """'2024-05-01'、'2024-05-01 09:30' 或时间戳"""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(datetime.strptime(text, fmt).timetuple())
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"无法解析的时间: {text}")
+
+
+def _fmt(value: Optional[float], digits: int = 0) -> str:
+    return '-' if value is None else f"{value:.{digits}f}"
+
+
+def print_summary(summary: Dict, slo_ms: float) -> None:
+    print(f"语音段: {summary['segments']} (被放弃 {summary['dropped']})，音频 {summary['audio_minutes']} 分钟，"
+          f"总体实时率 {_fmt(summary['rtf_overall'], 3)}")
+    rtf, lag, total = summary['rtf'], summary['decode_lag_ms'], summary['total_ms']
+    print(f"  实时率      p50 {_fmt(rtf['p50'], 3)}  p95 {_fmt(rtf['p95'], 3)}  p99 {_fmt(rtf['p99'], 3)}")
+    print(f"  识别延迟    p50 {_fmt(lag['p50'])}ms  p95 {_fmt(lag['p95'])}ms  p99 {_fmt(lag['p99'])}ms")
+    print(f"  端到端延迟  p50 {_fmt(total['p50'])}ms  p95 {_fmt(total['p95'])}ms  p99 {_fmt(total['p99'])}ms")
+    slo = summary['slo_ratio']
+    match_rate = summary['match_rate']
+    low = summary['low_conf_ratio']
+    print(f"  {slo_ms:.0f}ms 内完成 {_fmt(slo * 100 if slo is not None else None, 1)}%，"
+          f"匹配率 {_fmt(match_rate * 100 if match_rate is not None else None, 1)}%，"
+          f"低置信度语音段 {_fmt(low * 100 if low is not None else None, 1)}%")
+    if summary['no_conf']:
+        print(f"  {summary['no_conf']} 个有识别文本的语音段没有词置信度 (开启n-best时Vosk不输出)，未计入低置信度统计")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语音段延迟与识别质量分析")
+    parser.add_argument('paths', nargs='+', help='语音段记录文件 (INTERVIEW_SEGMENT_LOG)')
+    parser.add_argument('--bucket', type=int, default=60, help='分桶宽度 (分钟)，0 表示不分桶')
+    parser.add_argument('--slo-ms', type=float, default=800.0, help='端到端延迟SLO (毫秒)')
+    parser.add_argument('--low-conf', type=float, default=LOW_CONFIDENCE, help='低置信度阈值 (平均词置信度)')
+    parser.add_argument('--top', type=int, default=10, help='列出最多几个低置信度语音段')
+    parser.add_argument('--since', type=_parse_time, default=None, help='起始时间 (含)')
+    parser.add_argument('--until', type=_parse_time, default=None, help='结束时间 (不含)')
+    parser.add_argument('--json', action='store_true', help='输出JSON')
+    args = parser.parse_args()
+
+    segments = load_segments(args.paths, args.since, args.until)
+    overall = summarize(segments, args.slo_ms, args.low_conf)
+    buckets = [dict(start=b['start'], **summarize(b['segments'], args.slo_ms, args.low_conf))
+               for b in bucketize(segments, args.bucket)] if args.bucket > 0 else []
+    low = low_confidence_segments(segments, args.top, args.low_conf)
+
+    if args.json:
+        print(json.dumps({'overall': overall, 'buckets': buckets,
+                          'low_confidence': [{k: s.get(k) for k in ('ts', 'session', 'text', 'mean_conf', 'min_conf')}
+                                             for s in low]}, ensure_ascii=False, indent=2))
+        return
+
+    if not segments:
+        print("没有语音段记录")
+        return
+    print_summary(overall, args.slo_ms)
+
+    if buckets:
+        print(f"\n按 {args.bucket} 分钟分桶:")
+        print(f"  {'时间':<16} {'段数':>5} {'放弃':>5} {'实时率p95':>9} {'识别p95':>8} {'端到端p95':>9} {'SLO':>7} {'低置信':>7}")
+        for b in buckets:
+            slo = b['slo_ratio']
+            low_ratio = b['low_conf_ratio']
+            print(f"  {_format_time(b['start']):<16} {b['segments']:>5} {b['dropped']:>5} {_fmt(b['rtf']['p95'], 3):>9} "
+                  f"{_fmt(b['decode_lag_ms']['p95']):>8} {_fmt(b['total_ms']['p95']):>9} "
+                  f"{_fmt(slo * 100 if slo is not None else None, 1):>6}% "
+                  f"{_fmt(low_ratio * 100 if low_ratio is not None else None, 1):>6}%")
+
+    if low:
+        print(f"\n平均词置信度低于 {args.low_conf} 的语音段 (最低 {len(low)} 个):")
+        for s in low:
+            words = ' '.join(f"{w[0]}({w[3]:.2f})" for w in s.get('words', []) if w[3] is not None)
+            print(f"  {_format_time(s.get('ts', 0))} [{s.get('session') or '-'}] "
+                  f"平均 {s['mean_conf']:.2f} 最低 {_fmt(s.get('min_conf'), 2)}  {words}")
+
+
+if __name__ == "__main__":
+    main()
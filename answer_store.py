@@ -0,0 +1,216 @@
+# answer_store.py - 按需从磁盘读取答案，内存中只保留热点答案
+"""
+答案文件 (.answers) 格式，小端序:
+
+    头部      magic 'IAAS', 版本 u16, 是否压缩 u8, 保留 u8, 答案数 u32, 块数 u32, 来源指纹 20字节
+    答案索引  每个答案: 块号 u32, 块内偏移 u32, 长度 u32
+    块索引    每块: 文件偏移 u64, 存储长度 u32, 原始长度 u32
+    数据块    若干答案的UTF-8拼接，可选zlib逐块压缩
+
+文件通过mmap打开，读取某个答案只需解压它所在的块；最近使用的答案和块
+分别放在小型LRU中。
+"""
+import glob
+import mmap
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+MAGIC = b'IAAS'
+VERSION = 1
+HEADER = struct.Struct('<4sHBBII20s')
+INDEX_DTYPE = np.dtype([('block', '<u4'), ('offset', '<u4'), ('length', '<u4')])
+BLOCK_DTYPE = np.dtype([('file_offset', '<u8'), ('stored', '<u4'), ('raw', '<u4')])
+
+
+def build_answer_store(answers: Iterable[str], path: str, fingerprint: bytes = b'',
+                       compress: bool = True, block_size: int = 64 * 1024) -> str:
+    """
+    将答案流式写入答案文件
+
+    Args:
+        answers: 答案迭代器
+        path: 输出路径
+        fingerprint: 来源指纹 (如知识库源文件SHA1)，用于判断是否需要重建
+        compress: 是否对每块做zlib压缩
+        block_size: 每块的目标原始字节数，越大压缩率越高，随机读取代价也越高
+    """
+    index = []
+    blocks = []
+    data_tmp = path + '.data.tmp'
+    with open(data_tmp, 'wb') as data_file:
+        pending = bytearray()
+        file_offset = 0
+
+        def flush_block():
+            nonlocal file_offset
+            stored = zlib.compress(bytes(pending), 6) if compress else bytes(pending)
+            data_file.write(stored)
+            blocks.append((file_offset, len(stored), len(pending)))
+            file_offset += len(stored)
+            pending.clear()
+
+        for answer in answers:
+            encoded = answer.encode('utf-8')
+            if pending and len(pending) + len(encoded) > block_size:
+                flush_block()
+            index.append((len(blocks), len(pending), len(encoded)))
+            pending.extend(encoded)
+        if pending or not blocks:
+            flush_block()
+
+    index_bytes = np.array(index, dtype=INDEX_DTYPE).tobytes()
+    data_start = HEADER.size + len(index_bytes) + len(blocks) * BLOCK_DTYPE.itemsize
+    block_array = np.array(blocks, dtype=BLOCK_DTYPE)
+    block_array['file_offset'] += data_start
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as out, open(data_tmp, 'rb') as data_file:
+        out.write(HEADER.pack(MAGIC, VERSION, int(compress), 0, len(index), len(blocks),
+                              fingerprint[:20].ljust(20, b'\0')))
+        out.write(index_bytes)
+        out.write(block_array.tobytes())
+        while True:
+            chunk = data_file.read(1 << 20)
+            if not chunk:
+                break
+            out.write(chunk)
+    os.remove(data_tmp)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_store_fingerprint(path: str) -> Optional[bytes]:
+    """读取答案文件记录的来源指纹，文件不存在或损坏时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(HEADER.size)
+        magic, version, _, _, _, _, fingerprint = HEADER.unpack(head)
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or version != VERSION:
+        return None
+    return fingerprint
+
+
+def versioned_store_path(stem: str, fingerprint: bytes) -> str:
+    """
+    按来源指纹命名的答案文件路径 <stem>.<sha1前12位>.answers
+
+    知识库变化时写入新文件而不是覆盖仍被mmap的旧文件 (Windows 上无法替换已映射的文件)
+    """
+    return f"{stem}.{fingerprint[:20].hex()[:12]}.answers"
+
+
+def remove_stale_stores(stem: str, keep: str):
+    """尽力删除同一知识库的旧版本答案文件，仍被映射 (Windows) 等无法删除的留待下次"""
+    # 只匹配12位十六进制指纹，避免误删名为 <stem>.xxx 的其它知识库的答案文件
+    stale = glob.glob(glob.escape(stem) + '.' + '[0-9a-f]' * 12 + '.answers') + [stem + '.answers']
+    for path in stale:
+        if os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class AnswerStore:
+    """
+    只读的答案存储，支持按下标访问，用法与列表相同：store[i]、len(store)
+    """
+
+    def __init__(self, path: str, cache_size: int = 256, block_cache_size: int = 8):
+        """
+        Args:
+            path: 答案文件路径
+            cache_size: 答案LRU容量
+            block_cache_size: 解压块LRU容量
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.block_cache_size = block_cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._block_cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'block_reads': 0}
+        # mmap 持有自己的文件描述符，打开后即可关闭文件；不再使用的存储由垃圾回收释放映射
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, compressed, _, count, n_blocks, self.fingerprint = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"答案文件格式不匹配: {path}")
+        self.compressed = bool(compressed)
+        self._count = count
+        self._index = np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=count, offset=HEADER.size)
+        self._blocks = np.frombuffer(self._mm, dtype=BLOCK_DTYPE, count=n_blocks,
+                                     offset=HEADER.size + count * INDEX_DTYPE.itemsize)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i) -> str:
+        i = int(i)
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(f"答案下标越界: {i}")
+
+        with self._lock:
+            answer = self._cache.get(i)
+            if answer is not None:
+                self._cache.move_to_end(i)
+                self.stats['hits'] += 1
+                return answer
+            self.stats['misses'] += 1
+
+            block_id, offset, length = (int(v) for v in self._index[i])
+            block = self._read_block(block_id)
+            answer = bytes(block[offset:offset + length]).decode('utf-8')
+
+            self._cache[i] = answer
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return answer
+
+    def _read_block(self, block_id: int):
+        block = self._block_cache.get(block_id)
+        if block is not None:
+            self._block_cache.move_to_end(block_id)
+            return block
+
+        file_offset, stored, _ = (int(v) for v in self._blocks[block_id])
+        raw = self._mm[file_offset:file_offset + stored]
+        block = zlib.decompress(raw) if self.compressed else raw
+        self.stats['block_reads'] += 1
+        self._block_cache[block_id] = block
+        if len(self._block_cache) > self.block_cache_size:
+            self._block_cache.popitem(last=False)
+        return block
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    @property
+    def resident_bytes(self) -> int:
+        """LRU中常驻的答案与解压块的大致字节数"""
+        answers = sum(len(a) * 3 for a in self._cache.values())
+        blocks = sum(len(b) for b in self._block_cache.values())
+        return answers + blocks
+
+    def close(self) -> None:
+        self._index = None
+        self._blocks = None
+        self._cache.clear()
+        self._block_cache.clear()
+        try:
+            self._mm.close()
+        except BufferError:
+            # 仍有numpy视图引用mmap时交给垃圾回收
+            pass
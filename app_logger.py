@@ -0,0 +1,220 @@
+# app_logger.py - 基于队列的非阻塞结构化日志
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Dict, Optional
+
+LOGGER_NAME = "interview"
+
+# 当前会话ID，asyncio.to_thread 会复制上下文，因此工作线程中的日志也能带上会话ID
+session_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("session_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+class SessionFilter(logging.Filter):
+    """为每条日志注入当前会话ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "session"):
+            record.session = session_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按事件名对高频日志采样
+
+    Args:
+        rates: 事件名 -> 保留比例 (0~1)，未配置的事件全部保留
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1:
+            return True
+        return random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    非阻塞的队列Handler：队列满时直接丢弃并计数，绝不阻塞事件循环。
+    不在调用线程中格式化消息，格式化工作全部交给后台监听线程。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """输出单行JSON，结构化字段平铺在顶层"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event:
+            payload["event"] = event
+        session = getattr(record, "session", None)
+        if session:
+            payload["session"] = session
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """人类可读格式，结构化字段以 key=value 形式附在末尾"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extras = []
+        session = getattr(record, "session", None)
+        if session:
+            extras.append(f"session={session}")
+        fields = getattr(record, "fields", None)
+        if fields:
+            extras.extend(f"{k}={v}" for k, v in fields.items())
+        return f"{text} [{' '.join(extras)}]" if extras else text
+
+
+def _parse_sample_rates(spec: str) -> Dict[str, float]:
+    """解析 'audio_received=0.1,partial=0.05' 形式的采样配置"""
+    rates = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def setup_logging(level: Optional[str] = None, json_format: Optional[bool] = None,
+                  log_file: Optional[str] = None, sample_rates: Optional[Dict[str, float]] = None,
+                  queue_size: int = 10000) -> logging.Logger:
+    """
+    配置日志系统：调用方只把记录放入有界队列，由后台线程负责格式化和写出
+
+    Args:
+        level: 日志级别，默认读取环境变量 INTERVIEW_LOG_LEVEL (INFO)
+        json_format: 是否输出JSON，默认读取 INTERVIEW_LOG_JSON
+        log_file: 额外写入的日志文件，默认读取 INTERVIEW_LOG_FILE
+        sample_rates: 事件采样比例，默认读取 INTERVIEW_LOG_SAMPLE
+        queue_size: 队列容量，满时丢弃新日志
+
+    Returns:
+        应用根日志器
+    """
+    global _listener, _queue_handler
+
+    level = level or os.environ.get("INTERVIEW_LOG_LEVEL", "INFO")
+    if json_format is None:
+        json_format = os.environ.get("INTERVIEW_LOG_JSON", "0") in ("1", "true", "yes")
+    log_file = log_file or os.environ.get("INTERVIEW_LOG_FILE")
+    if sample_rates is None:
+        sample_rates = _parse_sample_rates(os.environ.get("INTERVIEW_LOG_SAMPLE", ""))
+
+    shutdown_logging()
+
+    formatter = JsonFormatter() if json_format else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(sample_rates))
+    _queue_handler.addFilter(SessionFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [_queue_handler]
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return logger
+
+
+def shutdown_logging() -> None:
+    """停止后台线程并刷新队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_count() -> int:
+    """返回因队列已满而被丢弃的日志条数"""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def get_logger(name: Optional[str] = None) -> logging.Logger:
+    """获取应用日志器的子日志器"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def log_event(logger: logging.Logger, level: int, event: str, msg: str = "", **fields) -> None:
+    """
+    记录一条结构化事件；级别未开启时直接返回，不产生任何格式化开销
+
+    Args:
+        logger: 日志器
+        level: logging级别
+        event: 事件名 (用于采样和检索)
+        msg: 可读消息
+        **fields: 结构化字段，例如 stage、latency_ms
+    """
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, msg or event, extra={"event": event, "fields": fields})
+
+
+class Timer:
+    """简单的阶段计时器，返回毫秒"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+
+    def ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 2)
+
+
+atexit.register(shutdown_logging)
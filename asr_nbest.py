@@ -0,0 +1,83 @@
+# asr_nbest.py - Vosk n-best识别结果：多个候选识别文本及其相对置信度
+"""
+识别错一两个字 (如"进程"识别成"近程") 就可能匹配不到问题。开启 n-best 后 Vosk 的结果是
+
+    {"alternatives": [{"text": "...", "confidence": 312.4}, {"text": "...", "confidence": 309.8}, ...]}
+
+confidence 是解码得分 (越大越好，量纲不固定)，这里按 softmax(得分 / temperature)
+换算为候选之间的相对置信度。清洗后的各个候选一次批量编码，再按
+相似度 - weight x (1 - 置信度) 选出最佳的 (候选, 问题) 组合 (见 matcher.match_hypotheses)。
+"""
+import math
+from typing import Dict, List, Tuple
+
+
+def configure_recognizer(recognizer, max_alternatives: int, words: bool = False) -> None:
+    """max_alternatives 大于1时让识别器输出 n-best 结果；words 为True时输出词级时间戳和置信度"""
+    if max_alternatives > 1:
+        recognizer.SetMaxAlternatives(max_alternatives)
+    if words:
+        recognizer.SetWords(True)
+
+
+def top_text(result: Dict) -> str:
+    """识别结果中最佳候选的文本 (兼容普通结果和 n-best 结果)"""
+    alternatives = result.get('alternatives')
+    if alternatives:
+        return alternatives[0].get('text', '')
+    return result.get('text', '')
+
+
+def join_segments(result: Dict, segments: List[str]) -> Dict:
+    """
+    把句中已经结束的片段 (Vosk检测到的句内停顿) 拼到最终结果的每个候选前面
+
+    Returns:
+        带 'text' (最佳候选的完整文本) 的结果；n-best 结果的每个候选也补全为完整文本
+    """
+    alternatives = result.get('alternatives')
+    if alternatives:
+        for alternative in alternatives:
+            alternative['text'] = ' '.join(segments + ([alternative['text']] if alternative.get('text') else []))
+    else:
+        text = result.get('text')
+        result['text'] = ' '.join(segments + ([text] if text else []))
+    if alternatives:
+        result['text'] = alternatives[0]['text']
+    return result
+
+
+def hypotheses(result: Dict, temperature: float = 5.0) -> List[Tuple[str, float]]:
+    """
+    提取候选识别文本 (已去掉空格) 及相对置信度
+
+    Returns:
+        [(文本, 置信度)]，按识别器给出的顺序 (最佳在前)，空文本和重复文本已去除，
+        置信度之和为1；普通结果只有一个置信度为1的候选
+    """
+    alternatives = result.get('alternatives')
+    if not alternatives:
+        text = result.get('text', '').replace(' ', '')
+        return [(text, 1.0)] if text else []
+
+    scores: Dict[str, float] = {}
+    for alternative in alternatives:
+        text = alternative.get('text', '').replace(' ', '')
+        # 去掉空格后相同的候选 (只是分词不同) 保留得分最高的一个
+        if text and text not in scores:
+            scores[text] = float(alternative.get('confidence', 0.0))
+    if not scores:
+        return []
+    best = max(scores.values())
+    weights = {text: math.exp((score - best) / temperature) for text, score in scores.items()}
+    total = sum(weights.values())
+    return [(text, weight / total) for text, weight in weights.items()]
+
+
+def merge_cleaned(cleaned: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+    """清洗后相同的候选合并为一个，置信度相加；顺序保持首次出现的顺序"""
+    merged: Dict[str, float] = {}
+    for text, confidence in cleaned:
+        if text:
+            merged[text] = merged.get(text, 0.0) + confidence
+    return list(merged.items())
@@ -0,0 +1,121 @@
+# asr_stream.py - 基于环形缓冲区的流式Vosk识别
+import json
+import time
+from typing import Dict, List
+
+from vosk import KaldiRecognizer
+
+from asr_nbest import configure_recognizer, join_segments, top_text
+from segment_metrics import extract_words
+from ring_buffer import AudioRingBuffer, OVERFLOW_DROP_OLDEST
+
+
+class StreamingRecognizer:
+    """
+    每个会话一个：网络收到的PCM写入环形缓冲区，识别阶段直接从缓冲区
+    读取连续片段送入 AcceptWaveform，不再拼接整句音频。
+
+    注意：Vosk识别器不是线程安全的，同一会话的 drain()/finalize() 需串行调用。
+    """
+
+    def __init__(self, model, sample_rate: int = 16000, capacity_seconds: int = 30,
+                 overflow: str = OVERFLOW_DROP_OLDEST, chunk_ms: int = 250, max_alternatives: int = 1,
+                 words: bool = False):
+        """
+        Args:
+            model: 已加载的 vosk.Model
+            sample_rate: 输入采样率
+            capacity_seconds: 环形缓冲区可容纳的音频时长
+            overflow: 识别跟不上时的溢出策略
+            chunk_ms: 每次送入识别器的音频时长
+            max_alternatives: 大于1时句末输出 n-best 候选 (句内已结束的片段只保留最佳候选)
+            words: 是否输出词级时间戳和置信度
+        """
+        self.sample_rate = sample_rate
+        self.ring = AudioRingBuffer(capacity=sample_rate * 2 * capacity_seconds, overflow=overflow)
+        self.chunk_bytes = sample_rate * 2 * chunk_ms // 1000
+        self._rec = KaldiRecognizer(model, sample_rate)
+        configure_recognizer(self._rec, max_alternatives, words)
+        self._segments: List[str] = []
+        self._words: List[Dict] = []
+        # 当前句子已送入的音频字节数和识别计算耗时，用于计算实时率
+        self._audio_bytes = 0
+        self._decode_seconds = 0.0
+        # 某些vosk版本的cffi绑定只接受bytes，首次失败后退回拷贝
+        self._needs_bytes = False
+
+    def write(self, pcm) -> int:
+        """写入PCM (bytes或memoryview)，返回实际写入的字节数"""
+        return self.ring.write(pcm)
+
+    def _accept(self, chunk: memoryview) -> None:
+        start = time.perf_counter()
+        self._audio_bytes += len(chunk)
+        if not self._needs_bytes:
+            try:
+                endpoint = self._rec.AcceptWaveform(chunk)
+            except TypeError:
+                self._needs_bytes = True
+                endpoint = self._rec.AcceptWaveform(bytes(chunk))
+        else:
+            endpoint = self._rec.AcceptWaveform(bytes(chunk))
+
+        # Vosk内部检测到句尾时必须立刻取走结果，否则会被后续音频覆盖
+        if endpoint:
+            result = json.loads(self._rec.Result())
+            text = top_text(result)
+            if text:
+                self._segments.append(text)
+                self._words.extend(extract_words(result))
+        self._decode_seconds += time.perf_counter() - start
+
+    def drain(self) -> None:
+        """把缓冲区中已收到的音频全部送入识别器 (同步，在工作线程中调用)"""
+        for chunk in self.ring.read_chunks(self.chunk_bytes):
+            self._accept(chunk)
+
+    def partial(self) -> str:
+        """当前句子到目前为止的中间识别结果"""
+        partial = json.loads(self._rec.PartialResult()).get('partial', '')
+        return ' '.join(self._segments + ([partial] if partial else []))
+
+    def drain_partial(self) -> str:
+        """送入已收到的音频并返回中间结果，减少一次线程切换"""
+        self.drain()
+        return self.partial()
+
+    def finalize(self) -> Dict:
+        """
+        结束当前句子，返回与 KaldiRecognizer.FinalResult 相同结构的结果
+
+        'text' 总是整句的最佳识别文本；n-best 时 'alternatives' 中的每个候选也是整句文本。
+        另外带 'audio_ms' (本句音频时长) 和 'decode_ms' (识别计算耗时)，开启词级输出时
+        'result' 为整句的词列表。
+        """
+        self.drain()
+        start = time.perf_counter()
+        final = json.loads(self._rec.FinalResult())
+        self._decode_seconds += time.perf_counter() - start
+        if self._words:
+            final['result'] = self._words + extract_words(final)
+        final = join_segments(final, self._segments)
+        final['audio_ms'] = round(self._audio_bytes * 1000 / (self.sample_rate * 2))
+        final['decode_ms'] = round(self._decode_seconds * 1000, 2)
+        self._reset_segment()
+        return final
+
+    def _reset_segment(self) -> None:
+        self._segments = []
+        self._words = []
+        self._audio_bytes = 0
+        self._decode_seconds = 0.0
+
+    def discard(self) -> None:
+        """丢弃当前句子已收到的音频和识别状态 (语音段因超时或过载被丢弃时调用)"""
+        self.ring.clear()
+        self._rec.Reset()
+        self._reset_segment()
+
+    @property
+    def stats(self) -> Dict:
+        return dict(self.ring.stats)
@@ -0,0 +1,235 @@
+# audio_protocol.py - 面试官端二进制分帧音频协议
+"""
+帧格式 (小端序，头部固定20字节):
+
+    magic       2s   b'IA'
+    version     u8   协议版本，当前为1
+    msg_type    u8   MSG_AUDIO / MSG_ACK
+    codec       u8   CODEC_PCM16 / CODEC_PCM16_DELTA_ZLIB
+    flags       u8   FLAG_END_OF_UTTERANCE 等
+    session     u32  客户端生成的会话号
+    seq         u32  帧序号，从0开始递增
+    sample_rate u16  采样率
+    length      u32  负载字节数
+
+负载为编码后的16位单声道音频 (解码后长度必须是2的倍数)，每帧最长 MAX_FRAME_MS 毫秒，
+采样率必须是 SAMPLE_RATES 之一。服务端按序号去重、重排后解码，并回复 MSG_ACK 帧
+（seq 为已连续收到的最大序号）。负载损坏、超长或采样率不支持的帧按空音频处理 (保留断句标记)，
+不影响后续帧。
+"""
+import struct
+import zlib
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b'IA'
+VERSION = 1
+HEADER = struct.Struct('<2sBBBBIIHI')
+
+MSG_AUDIO = 1
+MSG_ACK = 2
+
+CODEC_PCM16 = 0
+CODEC_PCM16_DELTA_ZLIB = 1
+
+FLAG_END_OF_UTTERANCE = 0x01
+
+# 最多缓存多少个乱序帧，超过后视为丢帧直接跳过缺口
+MAX_REORDER_FRAMES = 64
+# 支持的采样率；头部采样率为0表示沿用之前的值
+SAMPLE_RATES = (8000, 16000, 22050, 32000, 44100, 48000)
+# 单帧最长时长，解码后的PCM不能超过 采样率 x 2字节 x 该时长 (防止小压缩包解压出巨量数据)
+MAX_FRAME_MS = 1000
+
+
+def max_frame_bytes(sample_rate: int) -> int:
+    """该采样率下一帧解码后PCM的最大字节数"""
+    return sample_rate * 2 * MAX_FRAME_MS // 1000
+
+
+class ProtocolError(ValueError):
+    """帧格式错误或不支持的编码"""
+
+
+def is_framed(data: bytes) -> bool:
+    """判断一条二进制消息是否为分帧协议（否则按旧版整段WAV处理）"""
+    return len(data) >= HEADER.size and data[:2] == MAGIC
+
+
+def encode_pcm16(pcm: bytes, codec: int) -> bytes:
+    """将16位PCM编码为指定格式的负载"""
+    if codec == CODEC_PCM16:
+        return pcm
+    if codec == CODEC_PCM16_DELTA_ZLIB:
+        samples = np.frombuffer(pcm, dtype='<i2')
+        # 相邻采样差分后数值集中在0附近，zlib压缩率明显提高；int16溢出回绕可无损还原
+        delta = np.diff(samples, prepend=np.int16(0)).astype('<i2')
+        return zlib.compress(delta.tobytes(), 6)
+    raise ProtocolError(f"不支持编码的格式: {codec}")
+
+
+def _check_pcm(pcm) -> None:
+    # 奇数长度的PCM写入缓冲区后，之后所有采样都会错开一个字节
+    if len(pcm) % 2:
+        raise ProtocolError(f"PCM长度不是2的倍数: {len(pcm)}")
+
+
+def decode_payload(payload: bytes, codec: int, max_bytes: int = max_frame_bytes(max(SAMPLE_RATES))) -> bytes:
+    """将负载解码为16位PCM；负载损坏或解码后超过 max_bytes 时抛出 ProtocolError"""
+    if codec == CODEC_PCM16:
+        if len(payload) > max_bytes:
+            raise ProtocolError(f"帧过长: {len(payload)} 字节")
+        _check_pcm(payload)
+        return payload
+    if codec == CODEC_PCM16_DELTA_ZLIB:
+        decompressor = zlib.decompressobj()
+        try:
+            # 限制输出长度：多解出1字节用于判断是否超长
+            raw = decompressor.decompress(payload, max_bytes + 1)
+        except zlib.error as e:
+            raise ProtocolError(f"压缩负载损坏: {e}") from e
+        if len(raw) > max_bytes or decompressor.unconsumed_tail:
+            raise ProtocolError(f"帧解压后超过 {max_bytes} 字节")
+        if not decompressor.eof:
+            raise ProtocolError("压缩负载不完整")
+        _check_pcm(raw)
+        delta = np.frombuffer(raw, dtype='<i2')
+        return np.cumsum(delta, dtype='<i2').tobytes()
+    raise ProtocolError(f"未知的音频编码: {codec}")
+
+
+def pack_frame(session: int, seq: int, payload: bytes, codec: int = CODEC_PCM16,
+               sample_rate: int = 16000, flags: int = 0, msg_type: int = MSG_AUDIO) -> bytes:
+    """打包一帧"""
+    header = HEADER.pack(MAGIC, VERSION, msg_type, codec, flags,
+                         session & 0xFFFFFFFF, seq & 0xFFFFFFFF, sample_rate, len(payload))
+    return header + payload
+
+
+def unpack_frame(data: bytes) -> Tuple[dict, memoryview]:
+    """解析一帧，返回 (头部字典, 负载视图)"""
+    if len(data) < HEADER.size:
+        raise ProtocolError("帧长度不足")
+    magic, version, msg_type, codec, flags, session, seq, sample_rate, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ProtocolError("帧头标识错误")
+    if version != VERSION:
+        raise ProtocolError(f"不支持的协议版本: {version}")
+    payload = memoryview(data)[HEADER.size:]
+    if len(payload) != length:
+        raise ProtocolError(f"负载长度不符: 声明 {length}，实际 {len(payload)}")
+    header = {
+        'msg_type': msg_type, 'codec': codec, 'flags': flags, 'session': session,
+        'seq': seq, 'sample_rate': sample_rate,
+    }
+    return header, payload
+
+
+def pack_ack(session: int, seq: int) -> bytes:
+    """打包确认帧"""
+    return pack_frame(session, seq, b'', msg_type=MSG_ACK, sample_rate=0)
+
+
+def split_into_frames(pcm: bytes, session: int, start_seq: int, codec: int = CODEC_PCM16,
+                      sample_rate: int = 16000, frame_ms: int = 500,
+                      end_of_utterance: bool = True) -> List[bytes]:
+    """将一段PCM切成若干帧，最后一帧带断句标记；供客户端和回放工具使用"""
+    step = sample_rate * frame_ms // 1000 * 2
+    chunks = [pcm[i:i + step] for i in range(0, len(pcm), step)] or [b'']
+    frames = []
+    for i, chunk in enumerate(chunks):
+        flags = FLAG_END_OF_UTTERANCE if end_of_utterance and i == len(chunks) - 1 else 0
+        frames.append(pack_frame(session, start_seq + i, encode_pcm16(chunk, codec),
+                                 codec=codec, sample_rate=sample_rate, flags=flags))
+    return frames
+
+
+class AudioStreamDecoder:
+    """
+    服务端的单连接解码状态：按序号去重、重排，解码后写入缓冲区
+
+    每收到一帧调用 feed()，返回按顺序解码出的 (PCM, 是否断句) 列表；
+    调用方应在收到交付结果后立即回复 ack_frame()。
+    """
+
+    def __init__(self):
+        self.session: Optional[int] = None
+        self.sample_rate = 16000
+        self.expected_seq = 0
+        # 已解码、等待按序交付的帧：序号 -> (PCM, 是否断句)
+        self._reorder: Dict[int, Tuple[bytes, bool]] = {}
+        self.stats = {'frames': 0, 'duplicates': 0, 'reordered': 0, 'gaps': 0, 'corrupt': 0,
+                      'wire_bytes': 0, 'pcm_bytes': 0}
+
+    def _reset(self, session: int, first_seq: int):
+        # 重连后客户端会从未确认的帧继续发送，以首帧序号作为起点
+        self.session = session
+        self.expected_seq = first_seq
+        self._reorder.clear()
+
+    def _decode(self, header: dict, payload) -> bytes:
+        codec = header['codec']
+        sample_rate = header['sample_rate'] or self.sample_rate
+        if sample_rate not in SAMPLE_RATES:
+            raise ProtocolError(f"不支持的采样率: {sample_rate}")
+        pcm = decode_payload(bytes(payload) if codec != CODEC_PCM16 else payload, codec,
+                             max_frame_bytes(sample_rate))
+        self.sample_rate = sample_rate
+        self.stats['pcm_bytes'] += len(pcm)
+        return pcm
+
+    def feed(self, data: bytes) -> List[Tuple[bytes, bool]]:
+        """
+        处理一帧，返回可按序交付的 (PCM, 是否断句) 列表
+
+        负载损坏时抛出 ProtocolError；该帧按空音频占位 (保留断句标记)，不会阻塞后续帧，
+        调用方可以随后用 take_ready() 取出因此变为可交付的帧。
+        """
+        header, payload = unpack_frame(data)
+        if header['msg_type'] != MSG_AUDIO:
+            return []
+
+        self.stats['frames'] += 1
+        self.stats['wire_bytes'] += len(data)
+
+        if header['session'] != self.session:
+            self._reset(header['session'], header['seq'])
+
+        seq = header['seq']
+        if seq < self.expected_seq or seq in self._reorder:
+            # 客户端重连后重发的帧
+            self.stats['duplicates'] += 1
+            return []
+        if seq > self.expected_seq:
+            self.stats['reordered'] += 1
+
+        end_of_utterance = bool(header['flags'] & FLAG_END_OF_UTTERANCE)
+        try:
+            self._reorder[seq] = (self._decode(header, payload), end_of_utterance)
+        except ProtocolError:
+            self.stats['corrupt'] += 1
+            self._reorder[seq] = (b'', end_of_utterance)
+            raise
+        return self.take_ready()
+
+    def take_ready(self) -> List[Tuple[bytes, bool]]:
+        """取出所有可按序交付的帧"""
+        if self.expected_seq not in self._reorder and len(self._reorder) > MAX_REORDER_FRAMES:
+            # 缺口迟迟补不上，跳到最早的缓存帧
+            self.stats['gaps'] += 1
+            self.expected_seq = min(self._reorder)
+        delivered = []
+        while self.expected_seq in self._reorder:
+            delivered.append(self._reorder.pop(self.expected_seq))
+            self.expected_seq += 1
+        return delivered
+
+    def ack_frame(self) -> bytes:
+        """回复给客户端的确认帧，seq 为已连续收到的最大序号"""
+        return pack_ack(self.session or 0, max(self.expected_seq - 1, 0))
+
+    @property
+    def compression_ratio(self) -> float:
+        if not self.stats['wire_bytes']:
+            return 1.0
+        return self.stats['pcm_bytes'] / self.stats['wire_bytes']
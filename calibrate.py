@@ -0,0 +1,203 @@
+# calibrate.py - 根据评测集和线上日志离线校准逐题匹配阈值
+"""
+用法:
+
+    python calibrate.py --kb knowledge_base.xlsx --eval eval.csv --logs interview.log
+
+评测集 (CSV/JSONL/Excel) 两列:
+    text      识别并清洗后的提问文本
+    expected  应当匹配的知识库问题原文；留空表示不应匹配任何问题
+
+日志为 INTERVIEW_LOG_JSON=1 时输出的JSON行，取其中 matched / no_match 事件的 cleaned 字段
+作为无标注查询，用来估计每道题面对"无关提问"时的分数分布。
+
+校准方法:
+  1. 背景分布：每道题对所有查询的相似度均值和标准差 (分块计算，不保存完整矩阵)，
+     均值+k倍标准差作为该题的下限——泛泛的问题 (如"介绍一下你自己") 会得到更高的阈值
+  2. 有标注的题目：在其正例 (应匹配) 与负例 (被误匹配) 分数之间选F1最高的阈值，
+     并按样本数向全局阈值收缩，样本少时不会被个别样本带偏
+  3. 阈值限制在 全局阈值 ± max_shift 之内，结果以"分数偏移"保存到向量索引目录，
+     运行时一次向量加法即可应用
+"""
+import argparse
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_cache import logged_queries
+from kb_registry import matcher_options_from_env
+from kb_store import iter_source_rows
+from matcher import SemanticQuestionMatcher, CALIBRATION_NAME
+
+
+def load_eval_set(path: str) -> List[Tuple[str, str]]:
+    """读取评测集，返回 (文本, 期望问题) 列表"""
+    columns, rows = iter_source_rows(path)
+    if 'text' not in columns:
+        raise ValueError("评测集必须包含 'text' 列 (可选 'expected' 列)")
+    pairs = []
+    for row in rows:
+        text = str(row.get('text') or '').strip()
+        expected = row.get('expected')
+        expected = '' if expected is None or expected != expected else str(expected).strip()
+        if text:
+            pairs.append((text, expected))
+    return pairs
+
+
+def best_f1_threshold(positives: np.ndarray, negatives: np.ndarray) -> float:
+    """在候选切分点中选F1最高的阈值 (分数 > 阈值 视为匹配)"""
+    scores = np.concatenate([positives, negatives])
+    labels = np.concatenate([np.ones(len(positives), bool), np.zeros(len(negatives), bool)])
+    order = np.argsort(-scores, kind='stable')
+    scores, labels = scores[order], labels[order]
+    # 阈值取在第i个分数之下：前 i+1 个被判为匹配
+    tp = np.cumsum(labels)
+    fp = np.cumsum(~labels)
+    f1 = 2 * tp / (tp + fp + len(positives))
+    i = int(np.argmax(f1))
+    below = scores[i + 1] if i + 1 < len(scores) else scores[i] - 0.05
+    return float((scores[i] + below) / 2)
+
+
+class Calibrator:
+    """汇总背景分布和标注样本，拟合逐题阈值"""
+
+    def __init__(self, entries: int, reference: float = 0.6, k: float = 3.0,
+                 max_shift: float = 0.15, prior_weight: float = 5.0):
+        """
+        Args:
+            entries: 知识库条目数
+            reference: 全局参考阈值 (运行时 match 使用的阈值)
+            k: 背景下限 = 均值 + k * 标准差
+            max_shift: 逐题阈值相对参考阈值的最大偏移
+            prior_weight: 向参考阈值收缩的先验样本数
+        """
+        self.reference = reference
+        self.k = k
+        self.max_shift = max_shift
+        self.prior_weight = prior_weight
+        self._count = 0
+        self._sum = np.zeros(entries, dtype=np.float64)
+        self._sumsq = np.zeros(entries, dtype=np.float64)
+        self.positives: Dict[int, List[float]] = {}
+        self.negatives: Dict[int, List[float]] = {}
+
+    def add_background(self, scores: np.ndarray) -> None:
+        """累计一批 (查询数 x 条目数) 分数的一阶、二阶矩"""
+        self._count += scores.shape[0]
+        self._sum += scores.sum(axis=0)
+        self._sumsq += np.square(scores, dtype=np.float64).sum(axis=0)
+
+    def add_labeled(self, scores: np.ndarray, expected: List[Optional[int]], threshold: float) -> None:
+        """
+        记录标注样本：期望条目的分数为正例；被排在第一且超过阈值的错误条目为负例
+        """
+        top = np.argmax(scores, axis=1)
+        for row, target in enumerate(expected):
+            if target is not None:
+                self.positives.setdefault(target, []).append(float(scores[row, target]))
+            wrong = int(top[row])
+            if wrong != target and scores[row, wrong] > threshold - self.max_shift:
+                self.negatives.setdefault(wrong, []).append(float(scores[row, wrong]))
+
+    def fit(self) -> Tuple[np.ndarray, Dict]:
+        """返回 (逐题阈值, 统计信息)"""
+        entries = len(self._sum)
+        thresholds = np.full(entries, self.reference, dtype=np.float64)
+        if self._count > 1:
+            mean = self._sum / self._count
+            std = np.sqrt(np.maximum(self._sumsq / self._count - mean ** 2, 0))
+            thresholds = np.maximum(thresholds, mean + self.k * std)
+
+        fitted = 0
+        for entry in set(self.positives) | set(self.negatives):
+            pos = np.asarray(self.positives.get(entry, []), dtype=np.float64)
+            neg = np.asarray(self.negatives.get(entry, []), dtype=np.float64)
+            if len(pos) and len(neg):
+                estimate = best_f1_threshold(pos, neg)
+            elif len(neg):
+                estimate = float(neg.max()) + 0.01  # 只有误匹配：阈值抬到最高误匹配之上
+            else:
+                estimate = min(float(pos.min()) - 0.01, self.reference)  # 只有正例：必要时放宽
+            n = len(pos) + len(neg)
+            weight = n / (n + self.prior_weight)
+            shrunk = weight * estimate + (1 - weight) * self.reference
+            # 有正例时以标注为准；只有误匹配时不低于背景下限
+            thresholds[entry] = shrunk if len(pos) else max(shrunk, thresholds[entry])
+            fitted += 1
+
+        thresholds = np.clip(thresholds, self.reference - self.max_shift, self.reference + self.max_shift)
+        info = {
+            'background_queries': self._count,
+            'labeled_entries': fitted,
+            'raised': int(np.sum(thresholds > self.reference + 1e-6)),
+            'lowered': int(np.sum(thresholds < self.reference - 1e-6)),
+        }
+        return thresholds.astype(np.float32), info
+
+
+def evaluate(scores: np.ndarray, expected: List[Optional[int]], offsets: np.ndarray, threshold: float) -> float:
+    """top-1 决策准确率 (不应匹配的样本判为未匹配也算正确)"""
+    adjusted = scores + offsets
+    top = np.argmax(adjusted, axis=1)
+    matched = adjusted[np.arange(len(top)), top] > threshold
+    correct = [(m and t == e) or (not m and e is None) for m, t, e in zip(matched, top, expected)]
+    return float(np.mean(correct)) if correct else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线校准逐题匹配阈值")
+    parser.add_argument('--kb', default='knowledge_base.xlsx', help='知识库文件')
+    parser.add_argument('--cache-dir', default='./cache/default', help='与服务端一致的缓存目录 (cache/<知识库名称>)')
+    parser.add_argument('--eval', help='标注评测集 (text, expected)')
+    parser.add_argument('--logs', nargs='*', default=[], help='JSON格式的服务日志')
+    parser.add_argument('--threshold', type=float, default=0.6, help='运行时使用的全局阈值')
+    parser.add_argument('--k', type=float, default=3.0, help='背景下限的标准差倍数')
+    parser.add_argument('--max-shift', type=float, default=0.15, help='逐题阈值最大偏移')
+    parser.add_argument('--batch-size', type=int, default=512)
+    args = parser.parse_args()
+
+    if not args.eval and not args.logs:
+        parser.error("至少需要 --eval 或 --logs 之一")
+
+    # 与服务端相同的匹配器选项 (同一组环境变量)，校准结果才会落在服务端加载的索引上
+    matcher = SemanticQuestionMatcher(args.kb, cache_dir=args.cache_dir,
+                                      **matcher_options_from_env(with_reranker=False))
+    index_of = {q: i for i, q in enumerate(matcher.questions)}
+    calibrator = Calibrator(len(matcher.questions), args.threshold, args.k, args.max_shift)
+
+    labeled = load_eval_set(args.eval) if args.eval else []
+    unknown = [e for _, e in labeled if e and e not in index_of]
+    if unknown:
+        print(f"警告：{len(unknown)} 条评测样本的期望问题不在知识库中，按不应匹配处理，例如: {unknown[0]}")
+    expected = [index_of.get(e) if e else None for _, e in labeled]
+    queries = [t for t, _ in labeled] + logged_queries(args.logs)
+    print(f"标注样本 {len(labeled)} 条，查询总数 {len(queries)} 条")
+
+    labeled_scores = []
+    for start in range(0, len(queries), args.batch_size):
+        scores = matcher.raw_scores(queries[start:start + args.batch_size])
+        calibrator.add_background(scores)
+        if start < len(labeled):
+            n = min(len(labeled) - start, len(scores))
+            labeled_scores.append(scores[:n])
+            calibrator.add_labeled(scores[:n], expected[start:start + n], args.threshold)
+
+    thresholds, info = calibrator.fit()
+    offsets = (args.threshold - thresholds).astype(np.float32)
+    path = matcher.vector_store.save_arrays(CALIBRATION_NAME, offsets=offsets, thresholds=thresholds,
+                                            reference=np.float32(args.threshold))
+    print(f"✓ 校准完成: {info}")
+    print(f"  结果已保存到 {path}，重启服务或重新加载知识库后生效")
+
+    if labeled_scores:
+        scores = np.concatenate(labeled_scores)
+        before = evaluate(scores, expected, np.zeros_like(offsets), args.threshold)
+        after = evaluate(scores, expected, offsets, args.threshold)
+        print(f"  评测集top-1准确率: 校准前 {before:.3f} -> 校准后 {after:.3f} (同一数据上的拟合结果，仅供参考)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# clustering.py - 知识库问题的语义聚类与两级检索
+"""
+对向量索引中的每一行 (问题说法) 做球面 k-means：
+
+  - 检索时先与聚类中心比较，只在最接近的 n_probe 个聚类内逐行计算相似度，
+    计算量约为 行数 * n_probe / 聚类数，随知识库增长的延迟更可控
+  - 聚类结果可供浏览主题分布，并在同一聚类内查找近似重复的问题
+
+聚类结果以附属数组保存在向量索引目录中 (clusters.npz)，索引重建后自动失效。
+
+用法:
+
+    python clustering.py --kb knowledge_base.xlsx --cache-dir cache/default
+    python clustering.py --kb knowledge_base.xlsx --duplicates 0.92
+"""
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_store import VectorStore, normalize_rows
+
+CLUSTERS_NAME = 'clusters'
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 20, sample_size: Optional[int] = None,
+           chunk_rows: int = 8192, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    球面 k-means (向量已归一化，按余弦相似度分配)
+
+    Args:
+        vectors: 已归一化的 (行数 x 维度) 矩阵，可以是mmap
+        k: 聚类数
+        iterations: 最大迭代次数
+        sample_size: 用于训练中心的采样行数，默认 k*256；训练后再对全部行分配
+        chunk_rows: 分块计算相似度的行数，避免生成完整的 行数 x k 矩阵
+        seed: 随机种子，保证同一份向量得到同样的聚类
+
+    Returns:
+        (中心矩阵 k x 维度, 每行的聚类编号)
+    """
+    n = vectors.shape[0]
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+    sample_size = min(n, sample_size or k * 256)
+    sample_rows = np.sort(rng.choice(n, sample_size, replace=False)) if sample_size < n else np.arange(n)
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    labels = None
+    for _ in range(iterations):
+        new_labels, best = _assign(sample, centroids, chunk_rows)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=k)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            # 空聚类用离当前中心最远的样本重新播种
+            sums[empty] = sample[np.argsort(best)[:len(empty)]]
+        centroids = normalize_rows(sums)
+
+    labels, _ = _assign(vectors, centroids, chunk_rows)
+    return centroids, labels
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """分块计算每行最近的中心，返回 (聚类编号, 与该中心的相似度)"""
+    n = vectors.shape[0]
+    labels = np.empty(n, dtype=np.int32)
+    best = np.empty(n, dtype=np.float32)
+    for start in range(0, n, chunk_rows):
+        block = np.asarray(vectors[start:start + chunk_rows], dtype=np.float32) @ centroids.T
+        labels[start:start + len(block)] = np.argmax(block, axis=1)
+        best[start:start + len(block)] = block[np.arange(len(block)), labels[start:start + len(block)]]
+    return labels, best
+
+
+class ClusterIndex:
+    """
+    聚类中心 + 按聚类排序的行号，提供两级检索
+
+    order 中同一聚类的行连续存放，bounds[c]:bounds[c+1] 为聚类c的行号区间。
+    """
+
+    def __init__(self, store: VectorStore, centroids: np.ndarray, labels: np.ndarray):
+        self.store = store
+        self.centroids = centroids.astype(np.float32, copy=False)
+        self.labels = labels.astype(np.int32, copy=False)
+        self.order = np.argsort(self.labels, kind='stable')
+        self.bounds = np.concatenate([[0], np.cumsum(np.bincount(self.labels, minlength=len(self.centroids)))])
+        # 行号 -> 条目下标
+        if store.entry_offsets is None:
+            self.row_entries = np.arange(len(store), dtype=np.int64)
+        else:
+            sizes = np.diff(np.append(store.entry_offsets, len(store)))
+            self.row_entries = np.repeat(np.arange(store.entry_count), sizes)
+
+    @classmethod
+    def build(cls, store: VectorStore, k: Optional[int] = None, **kmeans_options) -> 'ClusterIndex':
+        """训练聚类并保存到索引目录；k 默认取 sqrt(行数)"""
+        k = k or max(1, int(round(np.sqrt(len(store)))))
+        centroids, labels = kmeans(store.vectors, k, **kmeans_options)
+        store.save_arrays(CLUSTERS_NAME, centroids=centroids, labels=labels)
+        return cls(store, centroids, labels)
+
+    @classmethod
+    def load(cls, store: VectorStore) -> Optional['ClusterIndex']:
+        """读取已保存的聚类，不存在或与索引不匹配时返回None"""
+        arrays = store.load_arrays(CLUSTERS_NAME)
+        if arrays is None or len(arrays.get('labels', ())) != len(store):
+            return None
+        return cls(store, arrays['centroids'], arrays['labels'])
+
+    @classmethod
+    def load_or_build(cls, store: VectorStore, k: Optional[int] = None) -> 'ClusterIndex':
+        index = cls.load(store)
+        if index is None or (k is not None and len(index) != k):
+            index = cls.build(store, k)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.centroids)
+
+    def cluster_rows(self, cluster: int) -> np.ndarray:
+        """聚类包含的行号"""
+        return self.order[self.bounds[cluster]:self.bounds[cluster + 1]]
+
+    def probe(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        """与查询最接近的 n_probe 个聚类"""
+        return self.store.top_k(self.centroids @ query, n_probe)
+
+    def search_entries(self, query: np.ndarray, n_probe: int, fill: float = -1.0) -> np.ndarray:
+        """
+        两级检索：只计算最近几个聚类内各行的相似度，再按条目取最大值
+
+        Args:
+            query: 已归一化的一维查询向量
+            n_probe: 检索的聚类数
+            fill: 未被检索到的条目的分数 (余弦相似度下限)
+
+        Returns:
+            与 VectorStore.search_entries 形状相同的条目相似度
+        """
+        clusters = self.probe(query, n_probe)
+        rows = np.sort(np.concatenate([self.cluster_rows(c) for c in clusters]))
+        scores = np.full(self.store.entry_count, fill, dtype=np.float32)
+        if len(rows):
+            np.maximum.at(scores, self.row_entries[rows], self.store.vectors[rows] @ query)
+        return scores
+
+    def summary(self, texts: List[str], per_cluster: int = 3) -> List[Dict]:
+        """
+        每个聚类的大小和最接近中心的几个说法，按大小降序，供浏览主题分布
+        """
+        sizes = np.diff(self.bounds)
+        result = []
+        for cluster in np.argsort(-sizes, kind='stable'):
+            rows = self.cluster_rows(cluster)
+            if len(rows) == 0:
+                continue
+            closeness = self.store.vectors[rows] @ self.centroids[cluster]
+            nearest = rows[np.argsort(-closeness, kind='stable')[:per_cluster]]
+            result.append({
+                'cluster': int(cluster),
+                'size': int(len(rows)),
+                'entries': int(len(np.unique(self.row_entries[rows]))),
+                'examples': [texts[i] for i in nearest],
+            })
+        return result
+
+    def duplicate_pairs(self, threshold: float = 0.92, max_block: int = 4096) -> List[Tuple[int, int, float]]:
+        """
+        在每个聚类内部查找近似重复的条目对
+
+        只比较同一聚类内的行，代价约为 sum(聚类大小^2) 而不是 行数^2；
+        跨聚类的重复会漏掉少数，作为清理报告足够。
+
+        Returns:
+            [(条目a, 条目b, 相似度)]，a < b，按相似度降序；每对条目只出现一次
+        """
+        best: Dict[Tuple[int, int], float] = {}
+        for cluster in range(len(self)):
+            rows = np.sort(self.cluster_rows(cluster))
+            for start in range(0, len(rows), max_block):
+                block_rows = rows[start:start + max_block]
+                block = self.store.vectors[block_rows] @ self.store.vectors[rows].T
+                i, j = np.nonzero(block >= threshold)
+                a = self.row_entries[block_rows[i]]
+                b = self.row_entries[rows[j]]
+                keep = a < b  # 去掉同一条目的不同说法和对称的重复
+                for x, y, s in zip(a[keep], b[keep], block[i[keep], j[keep]]):
+                    key = (int(x), int(y))
+                    if s > best.get(key, -1.0):
+                        best[key] = float(s)
+        return sorted(((a, b, s) for (a, b), s in best.items()), key=lambda item: -item[2])
+
+
+def main():
+    from matcher import SemanticQuestionMatcher
+    from kb_registry import matcher_options_from_env
+
+    parser = argparse.ArgumentParser(description="知识库语义聚类与重复问题报告")
+    parser.add_argument('--kb', default='knowledge_base.xlsx', help='知识库文件')
+    parser.add_argument('--cache-dir', default='./cache/default', help='与服务端一致的缓存目录 (cache/<知识库名称>)')
+    parser.add_argument('--clusters', type=int, default=None, help='聚类数，默认 sqrt(说法数)')
+    parser.add_argument('--top', type=int, default=20, help='显示最大的几个聚类')
+    parser.add_argument('--duplicates', type=float, default=None, metavar='THRESHOLD',
+                        help='列出相似度不低于该值的近似重复问题')
+    args = parser.parse_args()
+
+    matcher = SemanticQuestionMatcher(args.kb, cache_dir=args.cache_dir,
+                                      **matcher_options_from_env(with_reranker=False))
+    clusters = matcher.get_clusters(args.clusters)
+    print(f"\n共 {len(clusters)} 个聚类，{len(matcher.variant_texts)} 个说法")
+    for item in clusters.summary(matcher.variant_texts)[:args.top]:
+        print(f"  [{item['cluster']:>4}] {item['size']:>5} 个说法 / {item['entries']:>5} 个问题  "
+              + ' | '.join(item['examples']))
+
+    if args.duplicates is not None:
+        pairs = clusters.duplicate_pairs(args.duplicates)
+        print(f"\n相似度 >= {args.duplicates} 的近似重复问题: {len(pairs)} 对")
+        for a, b, similarity in pairs:
+            print(f"  {similarity:.3f}  {matcher.questions[a]}  <->  {matcher.questions[b]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 # create_knowledge_base.py
 import pandas as pd
 import os
+import time
+
+from kb_store import compile_knowledge_base, compiled_path_for, read_compiled_meta
 
 def create_sample_knowledge_base():
     """创建示例知识库Excel文件"""
@@ -66,6 +69,7 @@ def create_sample_knowledge_base():
     
     print(f"✓ 知识库文件已创建: {filename}")
     print(f"✓ 包含 {len(sample_data)} 个问答对")
+    compile_existing_knowledge_base(filename)
     print("\n使用说明:")
     print("1. 打开 knowledge_base.xlsx 文件")
     print("2. 在 'question' 列添加面试问题")
@@ -111,17 +115,67 @@ def validate_knowledge_base(filename="knowledge_base.xlsx"):
         print(f"❌ 验证失败: {e}")
         return False
 
+def compile_existing_knowledge_base(filename="knowledge_base.xlsx", cache_dir="./cache"):
+    """
+    将知识库 (xlsx/csv/jsonl) 编译为快速加载的 .kbc 文件
+
+    输出到后端服务使用的缓存目录，服务启动时只要源文件未变化就直接读取编译产物，
+    不再解析Excel。CSV/JSONL 源文件逐行流式导入，适合很大的题库。
+    """
+    try:
+        if not os.path.exists(filename):
+            print(f"❌ 文件不存在: {filename}")
+            return None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        start = time.time()
+        output = compile_knowledge_base(filename, compiled_path_for(filename, cache_dir))
+        meta = read_compiled_meta(output)
+
+        print(f"✓ 编译完成: {output}")
+        print(f"✓ 有效问答对: {meta['rows']}，耗时 {time.time() - start:.2f} 秒")
+        return output
+
+    except Exception as e:
+        print(f"❌ 编译失败: {e}")
+        return None
+
+def deduplicate_knowledge_base(filename="knowledge_base.xlsx", threshold=0.95):
+    """
+    查找并合并重复/近似重复的问题，写出 <原名>_dedup 文件和合并报告
+
+    被合并的问题作为保留问题的其他说法 (variants 列)，不会丢失匹配能力。
+    """
+    try:
+        if not os.path.exists(filename):
+            print(f"❌ 文件不存在: {filename}")
+            return None
+        from dedup import deduplicate_file
+        return deduplicate_file(filename, threshold=threshold)
+    except Exception as e:
+        print(f"❌ 去重失败: {e}")
+        return None
+
 if __name__ == "__main__":
     print("=== 知识库管理工具 ===")
     print("1. 创建示例知识库")
     print("2. 验证现有知识库")
+    print("3. 编译知识库 (加快服务启动，支持xlsx/csv/jsonl)")
+    print("4. 合并重复问题")
     
-    choice = input("请选择操作 (1/2): ").strip()
+    choice = input("请选择操作 (1/2/3/4): ").strip()
     
     if choice == "1":
         create_sample_knowledge_base()
     elif choice == "2":
         validate_knowledge_base()
+    elif choice == "3":
+        filename = input("知识库文件路径 (默认 knowledge_base.xlsx): ").strip() or "knowledge_base.xlsx"
+        compile_existing_knowledge_base(filename)
+    elif choice == "4":
+        filename = input("知识库文件路径 (默认 knowledge_base.xlsx): ").strip() or "knowledge_base.xlsx"
+        threshold = input("相似度阈值 (默认 0.95): ").strip()
+        deduplicate_knowledge_base(filename, float(threshold) if threshold else 0.95)
     else:
         print("无效选择")
         
@@ -0,0 +1,369 @@
+# dedup.py - 构建知识库时查找并合并重复/近似重复的问题
+"""
+重复问题会让索引变大，并让 top-1 在几乎同分的条目之间摇摆。这里在构建阶段：
+
+  1. 规范化文本 (去空白、标点、大小写) 相同的问题直接视为重复
+  2. 问题向量分块两两比较 (每次只有 block_rows x block_rows 的相似度块在内存中)，
+     相似度不低于阈值的问题对用并查集合并成候选组；再按组内最早的问题为代表拆分，
+     只有与代表相似度不低于阈值的问题才并入，避免 A~B~C 链式合并把不相近的 A、C 并到一起
+  3. 每组保留最早出现的一行，其余问题并入该行的 variants 列，追问关系一并改写
+
+合并后只保留第一行的答案；各行答案不同的组会在报告中标出，便于人工复核。
+
+用法:
+
+    python dedup.py --kb knowledge_base.xlsx --threshold 0.95
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from kb_store import (CompiledKBWriter, read_compiled, read_compiled_meta, iter_source_rows, variant_columns,
+                      REQUIRED_COLUMNS, FOLLOW_UP_COLUMN, VARIANTS_COLUMN)
+
+DEDUP_SUFFIX = '.dedup.kbc'
+REPORT_SUFFIX = '.dedup.json'
+# 分组规则变化时递增，使已缓存的去重结果失效
+DEDUP_VERSION = 2
+_IGNORED_CHARS = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def _text(value) -> str:
+    """单元格文本 (空值、NaN 为空串)"""
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return str(value).strip()
+
+
+def text_key(text: str) -> str:
+    """用于判断完全重复的规范化文本"""
+    return _IGNORED_CHARS.sub('', text).lower()
+
+
+class UnionFind:
+    """按大小合并、路径压缩的并查集"""
+
+    def __init__(self, n: int):
+        self.parent = np.arange(n, dtype=np.int64)
+        self.size = np.ones(n, dtype=np.int64)
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return int(root)
+
+    def union(self, a: int, b: int) -> bool:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+    def groups(self) -> List[List[int]]:
+        """成员数大于1的组，组内和组间都按最小下标排序"""
+        members: Dict[int, List[int]] = {}
+        for i in range(len(self.parent)):
+            members.setdefault(self.find(i), []).append(i)
+        return sorted((g for g in members.values() if len(g) > 1), key=lambda g: g[0])
+
+
+def near_duplicate_pairs(vectors: np.ndarray, threshold: float,
+                         block_rows: int = 2048) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    分块计算上三角相似度，逐块产出相似度不低于阈值的 (行号i, 行号j, 相似度)，i < j
+
+    Args:
+        vectors: 已归一化的 (行数 x 维度) 矩阵
+        threshold: 相似度阈值
+        block_rows: 每块行数，内存占用约 block_rows^2 * 4 字节
+    """
+    n = vectors.shape[0]
+    for start_i in range(0, n, block_rows):
+        left = np.asarray(vectors[start_i:start_i + block_rows], dtype=np.float32)
+        for start_j in range(start_i, n, block_rows):
+            right = left if start_j == start_i else np.asarray(vectors[start_j:start_j + block_rows], dtype=np.float32)
+            block = left @ right.T
+            if start_j == start_i:
+                block = np.triu(block, k=1)
+            i, j = np.nonzero(block >= threshold)
+            if len(i):
+                yield i + start_i, j + start_j, block[i, j]
+
+
+def find_duplicate_groups(questions: List[str], vectors: Optional[np.ndarray], threshold: float,
+                          block_rows: int = 2048) -> Tuple[List[List[int]], Dict[Tuple[int, int], float]]:
+    """
+    Returns:
+        (重复组列表, {(代表行, 组内其他行): 相似度})；每组第一行是代表，其余行与它的相似度都不低于阈值。
+        vectors为None时只合并完全重复
+    """
+    uf = UnionFind(len(questions))
+    keys = [text_key(question) or question for question in questions]
+    first_of: Dict[str, int] = {}
+    for i, key in enumerate(keys):
+        if key in first_of:
+            uf.union(first_of[key], i)
+        else:
+            first_of[key] = i
+    if vectors is not None:
+        for rows_i, rows_j, _ in near_duplicate_pairs(vectors, threshold, block_rows):
+            for a, b in zip(rows_i.tolist(), rows_j.tolist()):
+                uf.union(a, b)
+
+    # 并查集得到的是单链连通分量，按代表拆分：剩余行中最早的一行做代表，与它足够相似的行并入
+    groups: List[List[int]] = []
+    similarities: Dict[Tuple[int, int], float] = {}
+    for component in uf.groups():
+        remaining = component
+        while len(remaining) > 1:
+            head = remaining[0]
+            if vectors is None:
+                sims = np.zeros(len(remaining), dtype=np.float32)
+            else:
+                rows = np.asarray(vectors[remaining], dtype=np.float32)
+                sims = rows @ rows[0]
+            group, rest = [head], []
+            for member, sim in zip(remaining[1:], sims[1:].tolist()):
+                if keys[member] == keys[head]:
+                    sim = 1.0
+                if sim >= threshold:
+                    group.append(member)
+                    similarities[(head, member)] = sim
+                else:
+                    rest.append(member)
+            if len(group) > 1:
+                groups.append(group)
+            remaining = rest
+    groups.sort(key=lambda g: g[0])
+    return groups, similarities
+
+
+def compact_rows(columns: List[str], rows: List[Dict[str, str]],
+                 groups: List[List[int]]) -> Tuple[List[str], List[Dict[str, str]], List[Dict]]:
+    """
+    把每个重复组合并到组内第一行
+
+    被合并行的问题及其说法写入保留行的 variants 列；追问列中指向被合并问题的引用改为保留的问题。
+
+    Returns:
+        (输出列名, 合并后的行, 每组的合并记录)
+    """
+    columns = list(columns)
+    if groups and VARIANTS_COLUMN not in columns:
+        columns.append(VARIANTS_COLUMN)
+    extra_columns = variant_columns(columns)
+    keep_of = {member: group[0] for group in groups for member in group[1:]}
+    canonical_question = {_text(rows[m].get('question')): _text(rows[k].get('question'))
+                          for m, k in keep_of.items()}
+
+    def texts_of(row: Dict[str, str]) -> List[str]:
+        texts = [_text(row.get('question'))]
+        for column in extra_columns:
+            texts.extend(v.strip() for v in _text(row.get(column)).split('|'))
+        return [t for t in texts if t]
+
+    def parents_of(row: Dict[str, str]) -> List[str]:
+        parents = (p.strip() for p in _text(row.get(FOLLOW_UP_COLUMN)).split('|'))
+        return [canonical_question.get(p, p) for p in parents if p]
+
+    merged_rows = {}
+    records = []
+    for group in groups:
+        keep = dict(rows[group[0]])
+        question = _text(keep.get('question'))
+        variants = []
+        seen = {question}
+        parents = []
+        for member in group:
+            for text in texts_of(rows[member]):
+                if text not in seen:
+                    seen.add(text)
+                    variants.append(text)
+            for parent in parents_of(rows[member]):
+                if parent != question and parent not in parents:
+                    parents.append(parent)
+        # 原有的 question_N 列已经汇总进 variants，清空避免重复
+        for column in extra_columns:
+            keep[column] = ''
+        keep[VARIANTS_COLUMN] = '|'.join(variants)
+        if FOLLOW_UP_COLUMN in columns:
+            keep[FOLLOW_UP_COLUMN] = '|'.join(parents)
+        merged_rows[group[0]] = keep
+        answers = {_text(rows[m].get('answer')) for m in group}
+        records.append({
+            'kept': question,
+            'merged': [_text(rows[m].get('question')) for m in group[1:]],
+            'answers_differ': len(answers) > 1,
+        })
+
+    output = []
+    for i, row in enumerate(rows):
+        if i in keep_of:
+            continue
+        row = merged_rows.get(i, row)
+        if FOLLOW_UP_COLUMN in columns and i not in merged_rows:
+            row = dict(row, **{FOLLOW_UP_COLUMN: '|'.join(parents_of(row))})
+        output.append(row)
+    return columns, output, records
+
+
+def deduplicate(columns: List[str], rows: List[Dict[str, str]], threshold: float,
+                encode: Optional[Callable[[List[str]], np.ndarray]] = None,
+                block_rows: int = 2048) -> Tuple[List[str], List[Dict[str, str]], Dict]:
+    """
+    对一张知识库表去重
+
+    Args:
+        encode: 文本 -> 已归一化向量 的函数；为None时只合并规范化后完全相同的问题
+        threshold: 合并的相似度阈值
+
+    Returns:
+        (输出列名, 合并后的行, 报告)
+    """
+    questions = [_text(row.get('question')) for row in rows]
+    vectors = encode(questions) if encode is not None and questions else None
+    groups, similarities = find_duplicate_groups(questions, vectors, threshold, block_rows)
+    columns, output, records = compact_rows(columns, rows, groups)
+    group_of = {member: g for g, group in enumerate(groups) for member in group}
+    lowest: Dict[int, float] = {}
+    for (a, _), s in similarities.items():
+        g = group_of[a]
+        lowest[g] = min(s, lowest.get(g, s))
+    for g, record in enumerate(records):
+        record['min_similarity'] = round(lowest[g], 4) if g in lowest else None
+    report = {
+        'threshold': threshold,
+        'rows_before': len(rows),
+        'rows_after': len(output),
+        'groups': len(groups),
+        'answers_differ': sum(r['answers_differ'] for r in records),
+        'merged': records,
+    }
+    return columns, output, report
+
+
+def dedup_fingerprint(source_sha1: bytes, threshold: float, model_name: str) -> bytes:
+    """去重产物的指纹：源内容、阈值、模型任一变化都需要重新去重"""
+    return hashlib.sha1(source_sha1 + f'|{threshold}|{model_name}|{DEDUP_VERSION}'.encode('utf-8')).digest()
+
+
+def ensure_deduplicated(compiled_path: str, threshold: float, model_name: str,
+                        encode: Callable[[List[str]], np.ndarray]) -> str:
+    """
+    为编译产物生成 (或复用) 去重后的 .dedup.kbc，报告写入同名 .dedup.json
+
+    去重产物头部记录的是 dedup_fingerprint，答案文件和向量索引据此随之重建。
+    """
+    base = compiled_path[:-len('.kbc')] if compiled_path.endswith('.kbc') else compiled_path
+    output_path = base + DEDUP_SUFFIX
+    fingerprint = dedup_fingerprint(read_compiled_meta(compiled_path)['source_sha1'], threshold, model_name)
+    if os.path.exists(output_path):
+        try:
+            if read_compiled_meta(output_path)['source_sha1'] == fingerprint:
+                return output_path
+        except (OSError, ValueError):
+            pass
+
+    table = read_compiled(compiled_path)
+    columns = list(table)
+    rows = [dict(zip(columns, values)) for values in zip(*table.values())]
+    columns, rows, report = deduplicate(columns, rows, threshold, encode)
+    writer = CompiledKBWriter(output_path, columns)
+    for row in rows:
+        writer.append(row)
+    meta = read_compiled_meta(compiled_path)
+    writer.close(meta['source_size'], meta['source_mtime_ns'], fingerprint)
+    write_report(report, base + REPORT_SUFFIX)
+    print(f"✓ 知识库去重: {report['rows_before']} -> {report['rows_after']} 个问题，"
+          f"合并 {report['groups']} 组 (报告: {base + REPORT_SUFFIX})")
+    return output_path
+
+
+def write_report(report: Dict, path: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def print_report(report: Dict, limit: int = 20) -> None:
+    print(f"问题数: {report['rows_before']} -> {report['rows_after']}，合并 {report['groups']} 组，"
+          f"其中答案不一致 {report['answers_differ']} 组")
+    for record in report['merged'][:limit]:
+        mark = ' [答案不同]' if record['answers_differ'] else ''
+        print(f"  保留: {record['kept']}{mark}")
+        for question in record['merged']:
+            print(f"    合并: {question}")
+    if len(report['merged']) > limit:
+        print(f"  ... 共 {len(report['merged'])} 组，完整列表见报告文件")
+
+
+def write_table(columns: List[str], rows: List[Dict[str, str]], path: str) -> None:
+    """按扩展名写出 xlsx/csv/jsonl"""
+    import pandas as pd
+    df = pd.DataFrame([{c: _text(row.get(c)) for c in columns} for row in rows], columns=columns)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+    elif ext in ('.jsonl', '.ndjson'):
+        df.to_json(path, orient='records', lines=True, force_ascii=False)
+    else:
+        df.to_excel(path, index=False, engine='openpyxl')
+
+
+def deduplicate_file(source_path: str, output_path: Optional[str] = None, threshold: float = 0.95,
+                     model_name: Optional[str] = 'shibing624/text2vec-base-chinese',
+                     report_path: Optional[str] = None) -> Dict:
+    """
+    对知识库源文件去重并写出新文件 (默认 <原名>_dedup.<扩展名>)
+
+    Args:
+        model_name: 语义模型名称；为None时只合并完全重复的问题
+    """
+    columns, rows = iter_source_rows(source_path)
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"知识库必须包含 'question' 和 'answer' 两列，缺少: {missing}")
+    rows = [r for r in rows if _text(r.get('question')) and _text(r.get('answer'))]
+
+    encode = None
+    if model_name:
+        from sentence_transformers import SentenceTransformer
+        from encoder import Encoder
+        print(f"正在加载语义模型 '{model_name}'...")
+        encode = Encoder(SentenceTransformer(model_name)).encode
+
+    columns, rows, report = deduplicate(columns, rows, threshold, encode)
+    root, ext = os.path.splitext(source_path)
+    output_path = output_path or f"{root}_dedup{ext}"
+    write_table(columns, rows, output_path)
+    report_path = report_path or f"{root}_dedup_report.json"
+    write_report(report, report_path)
+    print_report(report)
+    print(f"✓ 已写出: {output_path}")
+    print(f"✓ 报告: {report_path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库重复问题检测与合并")
+    parser.add_argument('--kb', default='knowledge_base.xlsx', help='知识库源文件')
+    parser.add_argument('--output', help='输出文件，默认 <原名>_dedup.<扩展名>')
+    parser.add_argument('--threshold', type=float, default=0.95, help='合并的相似度阈值')
+    parser.add_argument('--model', default='shibing624/text2vec-base-chinese', help='语义模型')
+    parser.add_argument('--exact-only', action='store_true', help='只合并规范化后完全相同的问题，不加载模型')
+    args = parser.parse_args()
+    deduplicate_file(args.kb, args.output, args.threshold, None if args.exact_only else args.model)
+
+
+if __name__ == "__main__":
+    main()
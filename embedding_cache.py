@@ -0,0 +1,251 @@
+# embedding_cache.py - 查询向量缓存：按清洗后的文本缓存，所有会话和知识库共享
+"""
+面试问题高度重复，不同候选人被问到的往往是同一批问题。清洗后的文本相同时，
+查询向量也相同，这里缓存下来，热门问题不再经过语义模型。
+
+两级缓存:
+  - 内存LRU：float32向量，容量 capacity
+  - 可选的SQLite持久层：float16向量 (体积减半，余弦相似度误差约1e-3)，
+    服务重启后仍然有效，多个worker进程共用一个文件
+
+缓存与模型绑定 (模型名称是主键的一部分)，换模型后旧的向量不会被误用。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+def logged_queries(paths: Iterable[str], limit: int = 20000) -> List[str]:
+    """
+    从 INTERVIEW_LOG_JSON=1 输出的日志中提取查询文本 (matched / no_match 事件的 cleaned 字段)
+
+    Returns:
+        去重后的文本，按出现次数降序，最多 limit 条
+    """
+    counts: Counter = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.startswith('{'):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                text = record.get('cleaned')
+                if record.get('event') in ('matched', 'no_match') and text:
+                    counts[text] += 1
+    return [text for text, _ in counts.most_common(limit)]
+
+
+class EmbeddingCache:
+    """线程安全的两级查询向量缓存"""
+
+    def __init__(self, model_name: str, capacity: int = 4096, path: Optional[str] = None,
+                 flush_every: int = 32):
+        """
+        Args:
+            model_name: 语义模型名称 (持久层按模型区分)
+            capacity: 内存LRU容量
+            path: SQLite文件路径；为None时只使用内存
+            flush_every: 新向量攒够多少条写一次磁盘
+        """
+        self.model_name = model_name
+        self.capacity = capacity
+        self.path = path
+        self.flush_every = flush_every
+        self._memory: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._pending: Dict[str, np.ndarray] = {}
+        self._pending_hits: Counter = Counter()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid = None
+        # 磁盘查询不持有全局锁，每个线程用自己的只读连接
+        self._local = threading.local()
+        # 各线程创建的查询连接 (创建时的pid, 连接)，由 _lock 保护，close() 时全部关闭
+        self._readers: List[tuple] = []
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0}
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """当前进程的连接；fork出的子进程不能沿用父进程的连接，按pid重新打开"""
+        if not self.path:
+            return None
+        if self._conn_pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS embeddings ('
+                         'model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, '
+                         'hits INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL, '
+                         'PRIMARY KEY (model, text))')
+            self._conn = conn
+            self._conn_pid = os.getpid()
+            self._pending = {}
+            self._pending_hits = Counter()
+        return self._conn
+
+    def _reader(self) -> Optional[sqlite3.Connection]:
+        """当前线程 (当前进程) 的查询连接"""
+        if not self.path:
+            return None
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # 只在本线程使用，但 close() 要从其它线程关闭它
+            local.conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            local.pid = os.getpid()
+            with self._lock:
+                self._readers.append((local.pid, local.conn))
+        return local.conn
+
+    @staticmethod
+    def _decode(blob: bytes) -> np.ndarray:
+        vector = np.frombuffer(blob, dtype='<f2').astype(np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _remember(self, text: str, vector: np.ndarray) -> None:
+        self._memory[text] = vector
+        self._memory.move_to_end(text)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """查找向量，依次查内存和磁盘；未命中返回None"""
+        return self._lookup(text, count=True)
+
+    def _lookup(self, text: str, count: bool) -> Optional[np.ndarray]:
+        """
+        count 为False时不计入命中统计 (预热时使用)
+
+        磁盘查询在锁外进行，命中次数先记在内存里，随下一次写盘批量更新。
+        """
+        with self._lock:
+            vector = self._memory.get(text)
+            if vector is not None:
+                self._memory.move_to_end(text)
+                if count:
+                    self.stats['hits'] += 1
+                return vector
+            vector = self._pending.get(text)
+
+        from_disk = False
+        reader = self._reader() if vector is None else None
+        if reader is not None:
+            try:
+                row = reader.execute('SELECT vector FROM embeddings WHERE model = ? AND text = ?',
+                                     (self.model_name, text)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                vector = self._decode(row[0])
+                from_disk = True
+
+        with self._lock:
+            if from_disk and self._connection() is not None:
+                self._pending_hits[text] += 1
+            if count:
+                self.stats['misses' if vector is None else 'disk_hits'] += 1
+            if vector is None:
+                return None
+            self._remember(text, vector)
+            return vector
+
+    def put(self, text: str, vector: np.ndarray) -> None:
+        """写入向量 (只读视图，调用方不应再修改)"""
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._remember(text, vector)
+            if self._connection() is not None:
+                self._pending[text] = vector
+                if len(self._pending) + len(self._pending_hits) >= self.flush_every:
+                    self._flush_locked()
+
+    def get_or_encode(self, text: str, encode: Callable[[str], np.ndarray]) -> np.ndarray:
+        vector = self.get(text)
+        if vector is None:
+            vector = encode(text)
+            self.put(text, vector)
+        return vector
+
+    def _flush_locked(self) -> None:
+        conn = self._connection()
+        if conn is None or not (self._pending or self._pending_hits):
+            return
+        now = time.time()
+        rows = [(self.model_name, text, vector.astype('<f2').tobytes(), now)
+                for text, vector in self._pending.items()]
+        hits = [(n, self.model_name, text) for text, n in self._pending_hits.items()]
+        try:
+            with conn:
+                conn.executemany('INSERT OR IGNORE INTO embeddings (model, text, vector, updated) '
+                                 'VALUES (?, ?, ?, ?)', rows)
+                conn.executemany('UPDATE embeddings SET hits = hits + ? WHERE model = ? AND text = ?', hits)
+            self.stats['writes'] += len(rows)
+            self._pending.clear()
+            self._pending_hits.clear()
+        except sqlite3.Error:
+            # 其他进程长时间占用写锁时保留待写数据，下次再试
+            pass
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def warm_from_disk(self, limit: Optional[int] = None) -> int:
+        """把持久层中命中次数最多的向量预先载入内存，返回载入条数"""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return 0
+            rows = conn.execute('SELECT text, vector FROM embeddings WHERE model = ? '
+                                'ORDER BY hits DESC, updated DESC LIMIT ?',
+                                (self.model_name, limit or self.capacity)).fetchall()
+            # 命中最多的最后放入，排在LRU最新的位置
+            for text, blob in reversed(rows):
+                self._remember(text, self._decode(blob))
+            return len(rows)
+
+    def warm(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> int:
+        """
+        预热：缓存中没有的文本批量编码后写入
+
+        Returns:
+            新编码的条数
+        """
+        missing = [t for t in dict.fromkeys(texts) if t and self._lookup(t, count=False) is None]
+        if missing:
+            for text, vector in zip(missing, encode(missing)):
+                self.put(text, vector)
+            self.flush()
+        return len(missing)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats, size=len(self._memory), capacity=self.capacity, pending=len(self._pending))
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 3) if lookups else None
+        stats['persistent'] = bool(self.path)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._conn_pid = None
+            # fork 继承来的父进程连接不能在子进程中关闭，只丢弃引用
+            for pid, conn in self._readers:
+                if pid == os.getpid():
+                    conn.close()
+            self._readers = []
+            self._local = threading.local()
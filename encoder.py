@@ -0,0 +1,121 @@
+# encoder.py - 语义模型的编码封装：按token长度分桶、按token预算组批
+"""
+sentence-transformers 按固定条数组批，批内所有文本被填充到最长文本的长度。问题长短差异
+很大时 (如"什么是TCP" 与一段完整的场景题)，短问题大部分计算都浪费在填充上。
+
+这里先统计每条文本的token数，按长度排序后组批，使每批 最长长度 x 条数 不超过token预算；
+编码后按原顺序还原。单条查询不组批，直接编码。
+
+分词本身不便宜，而 model.encode 还会再分一次词。条数不超过 max_batch 的小批量先按字符数
+估计 (BERT类分词器的token数不超过字符数+2)，估计值已在预算内时直接整批编码，不再预先分词。
+"""
+import threading
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+
+class Encoder:
+    """包装 SentenceTransformer，所有编码都返回L2归一化的float32向量"""
+
+    def __init__(self, model, max_tokens: int = 8192, max_batch: int = 256, threads: Optional[int] = None):
+        """
+        Args:
+            model: SentenceTransformer 实例 (可在多个知识库间共享)
+            max_tokens: 每批的token预算 (批内最长token数 x 条数)
+            max_batch: 每批最多条数
+            threads: 设置时调整PyTorch的线程数 (进程级设置)
+        """
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_batch = max_batch
+        self.max_length = getattr(model, 'max_seq_length', None) or 512
+        self._lock = threading.Lock()
+        self.stats = {'texts': 0, 'batches': 0, 'tokens': 0, 'padded_tokens': 0}
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+
+    def estimated_lengths(self, texts: Sequence[str]) -> np.ndarray:
+        """按字符数估计的token数上限 (字符数 + 2个特殊符号，截断到模型最大长度)"""
+        return np.minimum(np.fromiter((len(t) + 2 for t in texts), dtype=np.int64, count=len(texts)),
+                          self.max_length)
+
+    def token_lengths(self, texts: Sequence[str]) -> np.ndarray:
+        """每条文本的token数 (含特殊符号，截断到模型最大长度)；没有分词器时按字符数估计"""
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        if tokenizer is not None:
+            try:
+                ids = tokenizer(list(texts), add_special_tokens=True, truncation=True,
+                                max_length=self.max_length)['input_ids']
+                return np.fromiter((len(i) for i in ids), dtype=np.int64, count=len(texts))
+            except Exception:
+                pass
+        return self.estimated_lengths(texts)
+
+    def batches(self, lengths: np.ndarray) -> List[np.ndarray]:
+        """
+        按长度排序后组批：每批 最长长度 x 条数 不超过 max_tokens，条数不超过 max_batch
+
+        Returns:
+            每批在输入中的下标
+        """
+        order = np.argsort(lengths, kind='stable')
+        sorted_lengths = lengths[order]
+        batches = []
+        start = 0
+        for end in range(1, len(order) + 1):
+            size = end - start
+            # 长度已升序，批内最长即最后一条
+            if size > 1 and (sorted_lengths[end - 1] * size > self.max_tokens or size > self.max_batch):
+                batches.append(order[start:end - 1])
+                start = end - 1
+        if start < len(order):
+            batches.append(order[start:])
+        return batches
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True,
+                                 show_progress_bar=False, batch_size=len(texts)).astype(np.float32, copy=False)
+
+    def encode(self, texts: Union[str, Sequence[str]]) -> np.ndarray:
+        """
+        编码文本
+
+        Returns:
+            单条文本返回一维向量，列表返回 (条数 x 维度) 矩阵，顺序与输入一致
+        """
+        if isinstance(texts, str):
+            return self._encode_batch([texts])[0]
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        lengths = self.estimated_lengths(texts)
+        if len(texts) > self.max_batch or int(lengths.max()) * len(texts) > self.max_tokens:
+            lengths = self.token_lengths(texts)
+            batches = self.batches(lengths)
+        else:
+            # 估计值已在预算内：整批编码，统计中的token数为估计值
+            batches = [np.arange(len(texts))]
+        result = None
+        padded = 0
+        for batch in batches:
+            vectors = self._encode_batch([texts[i] for i in batch])
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[batch] = vectors
+            padded += int(lengths[batch].max()) * len(batch)
+        with self._lock:
+            self.stats['texts'] += len(texts)
+            self.stats['batches'] += len(batches)
+            self.stats['tokens'] += int(lengths.sum())
+            self.stats['padded_tokens'] += padded
+        return result
+
+    def get_stats(self) -> Dict:
+        """批量编码的统计；padding_efficiency 为有效token占填充后token的比例"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['padding_efficiency'] = round(stats['tokens'] / stats['padded_tokens'], 3) if stats['padded_tokens'] else None
+        return stats
@@ -0,0 +1,162 @@
+# index_builder.py - 分块、可断点续跑、多进程并行的向量索引构建
+"""
+大型知识库 (几十万个问题说法) 一次性编码既占内存，中途失败又要从头再来。这里：
+
+  - 把说法按 chunk_rows 切块，每块编码后立即写成一个分片 (<索引目录>.build/shard_XXXXX.npy)
+  - progress.json 记录内容指纹和已完成的块，中断后重新启动只编码剩余的块
+  - 块内由 encoder.Encoder 按token长度排序后按token预算组批，短问题不会被填充到批内最长问题的长度
+  - workers > 1 时用多个CPU进程各自加载模型并行编码，每个进程分到 核数/进程数 个线程
+  - 全部完成后把分片依次拷贝进最终的 embeddings.npy，内存中同一时间只有一个分片
+
+用法 (离线预先构建，服务启动时直接加载):
+
+    python index_builder.py --kb knowledge_base.xlsx --cache-dir cache/default --workers 4
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from encoder import Encoder
+from vector_store import VectorStore
+
+PROGRESS_FILE = 'progress.json'
+
+# 工作进程内的编码器，由 _init_worker 加载
+_worker_encoder = None
+
+
+def _init_worker(model_name: str, threads: int, max_tokens: int) -> None:
+    global _worker_encoder
+    from sentence_transformers import SentenceTransformer
+    _worker_encoder = Encoder(SentenceTransformer(model_name, device='cpu'), max_tokens=max_tokens, threads=threads)
+
+
+def _encode_chunk(texts: List[str]) -> np.ndarray:
+    """工作进程中编码一块"""
+    return _worker_encoder.encode(texts)
+
+
+class IndexBuilder:
+    """构建 VectorStore，进度保存在 <索引目录>.build 中"""
+
+    def __init__(self, directory: str, texts: List[str], fingerprint: str, model_name: str,
+                 entry_offsets: Optional[np.ndarray] = None, workers: int = 1, chunk_rows: int = 8192,
+                 max_tokens: int = 8192, encode: Optional[Callable[[List[str]], np.ndarray]] = None):
+        """
+        Args:
+            directory: 最终的向量索引目录
+            texts: 按行顺序排列的全部说法
+            fingerprint: 索引内容指纹，与进度文件中的不一致时丢弃旧进度
+            workers: 编码进程数；为1时在当前进程内用 encode 编码
+            chunk_rows: 每个分片的行数 (也是断点续跑的粒度)
+            max_tokens: 工作进程中单批的token预算 (批内最长token数 x 条数)
+            encode: 当前进程内的编码函数 (文本列表 -> 已归一化向量，如 Encoder.encode)，workers 为1时必需
+        """
+        self.directory = directory
+        self.texts = texts
+        self.fingerprint = fingerprint
+        self.model_name = model_name
+        self.entry_offsets = entry_offsets
+        self.workers = max(1, workers)
+        self.chunk_rows = chunk_rows
+        self.max_tokens = max_tokens
+        self.encode = encode
+        self.build_dir = directory + '.build'
+        self.chunks = (len(texts) + chunk_rows - 1) // chunk_rows
+
+    def _shard_path(self, chunk: int) -> str:
+        return os.path.join(self.build_dir, f'shard_{chunk:05d}.npy')
+
+    def _load_progress(self) -> set:
+        """读取已完成的块；指纹或分块方式变化时清空构建目录"""
+        path = os.path.join(self.build_dir, PROGRESS_FILE)
+        try:
+            with open(path, encoding='utf-8') as f:
+                progress = json.load(f)
+            if progress.get('fingerprint') == self.fingerprint and progress.get('chunk_rows') == self.chunk_rows:
+                return {c for c in progress.get('done', []) if os.path.exists(self._shard_path(c))}
+        except (OSError, ValueError):
+            pass
+        shutil.rmtree(self.build_dir, ignore_errors=True)
+        os.makedirs(self.build_dir)
+        return set()
+
+    def _save_progress(self, done: set) -> None:
+        path = os.path.join(self.build_dir, PROGRESS_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'chunk_rows': self.chunk_rows,
+                       'total': self.chunks, 'done': sorted(done)}, f)
+        os.replace(path + '.tmp', path)
+
+    def _chunk_texts(self, chunk: int) -> List[str]:
+        return self.texts[chunk * self.chunk_rows:(chunk + 1) * self.chunk_rows]
+
+    def _write_shard(self, chunk: int, vectors: np.ndarray, done: set) -> None:
+        path = self._shard_path(chunk)
+        np.save(path + '.tmp.npy', vectors)
+        os.replace(path + '.tmp.npy', path)
+        done.add(chunk)
+        self._save_progress(done)
+
+    def build(self) -> VectorStore:
+        """编码剩余的块并生成索引；中途失败时已完成的分片保留，下次从断点继续"""
+        done = self._load_progress()
+        pending = [c for c in range(self.chunks) if c not in done]
+        if done:
+            print(f"从断点继续构建向量索引：已完成 {len(done)}/{self.chunks} 块")
+        start = time.time()
+
+        if pending and self.workers == 1:
+            if self.encode is None:
+                raise ValueError("单进程构建需要提供 encode 函数")
+            for chunk in pending:
+                self._write_shard(chunk, self.encode(self._chunk_texts(chunk)), done)
+                self._report(len(done), start)
+        elif pending:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            with ProcessPoolExecutor(self.workers, mp_context=get_context('spawn'), initializer=_init_worker,
+                                     initargs=(self.model_name, threads, self.max_tokens)) as pool:
+                futures = {pool.submit(_encode_chunk, self._chunk_texts(c)): c for c in pending}
+                for future in as_completed(futures):
+                    self._write_shard(futures[future], future.result(), done)
+                    self._report(len(done), start)
+
+        store = VectorStore.create_from_shards(
+            self.directory, [self._shard_path(c) for c in range(self.chunks)], self.fingerprint,
+            self.model_name, entry_offsets=self.entry_offsets)
+        shutil.rmtree(self.build_dir, ignore_errors=True)
+        return store
+
+    def _report(self, done: int, start: float) -> None:
+        rows = min(done * self.chunk_rows, len(self.texts))
+        elapsed = time.time() - start
+        print(f"  已编码 {done}/{self.chunks} 块 ({rows} 个说法，{elapsed:.1f} 秒)")
+
+
+def main():
+    from matcher import SemanticQuestionMatcher
+    from kb_registry import matcher_options_from_env
+
+    parser = argparse.ArgumentParser(description="离线构建向量索引 (可中断后继续)")
+    parser.add_argument('--kb', default='knowledge_base.xlsx', help='知识库文件')
+    parser.add_argument('--cache-dir', default='./cache/default', help='与服务端一致的缓存目录 (cache/<知识库名称>)')
+    parser.add_argument('--model', default='shibing624/text2vec-base-chinese', help='语义模型')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='编码进程数')
+    parser.add_argument('--chunk-rows', type=int, default=8192, help='每个分片的行数')
+    args = parser.parse_args()
+
+    # 改写、去重、清洗等选项与服务端一致 (同一组环境变量)，生成的索引指纹才与服务端相同
+    options = matcher_options_from_env(with_reranker=False)
+    options.update(build_workers=args.workers, build_chunk_rows=args.chunk_rows)
+    SemanticQuestionMatcher(args.kb, model_name=args.model, cache_dir=args.cache_dir, **options)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import sys
 import asyncio
 import websockets
 import json
+import os
+from urllib.parse import quote
 from datetime import datetime
 try:
     from PyQt5.QtWidgets import (QApplication, QLabel, QVBoxLayout, QWidget,
@@ -17,6 +19,46 @@ except ImportError:
     import threading
     PYQT_AVAILABLE = False
 
+def build_uri():
+    """
+    服务端地址：环境变量 INTERVIEW_SERVER (默认 ws://localhost:8000)；
+    设置 INTERVIEW_ROOM 时附带房间号，多worker部署下与面试官端落在同一个worker
+    """
+    uri = os.environ.get('INTERVIEW_SERVER', 'ws://localhost:8000').rstrip('/') + '/ws/interviewee'
+    room = os.environ.get('INTERVIEW_ROOM')
+    if room:
+        uri += f'?room={quote(room)}'
+    return uri
+
+def parse_server_message(message):
+    """
+    解析服务器消息
+
+    普通答案是纯文本；预判答案相关消息是JSON:
+    {"type": "answer", "status": "provisional/confirmed/updated/retracted", "text": ...}
+
+    Returns:
+        (需要显示的文本或None, 需要更新的状态文本或None)
+    """
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return message, None
+    if not isinstance(data, dict) or data.get('type') != 'answer':
+        return message, None
+
+    status = data.get('status')
+    if status == 'provisional':
+        return f"[预判] {data.get('text', '')}", "⏳ 预判答案，等待面试官说完..."
+    if status == 'confirmed':
+        # 与已显示的预判答案一致，不重复显示
+        return None, "✓ 预判答案已确认"
+    if status == 'updated':
+        return f"[更正] {data.get('text', '')}", "✓ 答案已更正"
+    if status == 'retracted':
+        return f"[撤回] 上一条预判答案不准确: {data.get('question', '')}", "✗ 预判答案已撤回"
+    return data.get('text', message), None
+
 class AnswerDisplayWindow:
     def __init__(self):
         if PYQT_AVAILABLE:
@@ -247,7 +289,7 @@ class AnswerDisplayWindow:
 class WebSocketClientThread:
     def __init__(self, window):
         self.window = window
-        self.uri = "ws://localhost:8000/ws/interviewee"
+        self.uri = build_uri()
         self.running = False
 
     def start(self):
@@ -279,7 +321,11 @@ class WebSocketClientThread:
                                 continue
 
                             print(f"收到消息: {message}")
-                            self.window.add_message(message)
+                            display, status = parse_server_message(message)
+                            if display:
+                                self.window.add_message(display)
+                            if status:
+                                self.window.update_status(status, "#4CAF50")
 
                 except websockets.exceptions.ConnectionClosed:
                     print("连接已关闭")
@@ -329,7 +375,11 @@ class WebSocketQtThread(QThread):
                             continue
 
                         print(f"收到消息: {message}")
-                        self.message_received.emit(message)
+                        display, status = parse_server_message(message)
+                        if display:
+                            self.message_received.emit(display)
+                        if status:
+                            self.status_updated.emit(status, "#4CAF50")
 
             except websockets.exceptions.ConnectionClosed:
                 print("连接已关闭")
@@ -0,0 +1,208 @@
+# kb_registry.py - 多知识库注册表：共享一个语义模型，各自独立的索引和缓存
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from sentence_transformers import SentenceTransformer
+
+from app_logger import get_logger
+from matcher import SemanticQuestionMatcher
+from text_normalizer import processor_from_env
+
+logger = get_logger("registry")
+
+DEFAULT_KB_NAME = 'default'
+
+
+def load_kb_config(config_path: str) -> Dict[str, str]:
+    """
+    读取知识库配置文件 (JSON)，格式为 {"名称": "知识库文件路径", ...}
+
+    文件不存在时返回空字典；相对路径以配置文件所在目录为基准。
+    """
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    return {name: path if os.path.isabs(path) else os.path.join(base_dir, path)
+            for name, path in config.items()}
+
+
+def matcher_options_from_env(normalizer=None, with_reranker: bool = True) -> dict:
+    """
+    从环境变量读取匹配器的可选组件
+
+    INTERVIEW_RERANKER 指定交叉编码器模型 (如 BAAI/bge-reranker-base) 时启用重排，
+    INTERVIEW_RERANK_BUDGET_MS 为每次查询的重排时间预算 (默认150毫秒)；
+    INTERVIEW_PARAPHRASE=1 时构建索引时为每个问题自动生成常见说法；
+    说法数达到 INTERVIEW_CLUSTER_MIN_ROWS (默认20000) 时启用聚类两级检索，
+    每次检索 INTERVIEW_CLUSTER_PROBE (默认8) 个聚类；
+    设置 INTERVIEW_DEDUP (如0.95) 时加载前合并相似度不低于该值的重复问题；
+    INTERVIEW_BUILD_WORKERS 为重建向量索引时的编码进程数 (默认1，即在服务进程内编码)；
+    INTERVIEW_TORCH_THREADS 设置语义模型推理使用的线程数；
+    INTERVIEW_NORMALIZE_KB=1 时知识库问题先经过与识别文本相同的清洗 (同一个 processor) 再编码。
+    查询向量缓存见 main.embedding_cache_from_env。
+
+    改写、去重、清洗等选项决定向量索引的指纹，离线工具 (calibrate / clustering / index_builder)
+    也用这里的选项创建匹配器，否则会按另一个指纹重建并覆盖服务端的索引，保存的校准和聚类结果
+    服务端也不会加载。
+
+    Args:
+        normalizer: 已创建的文本清洗器 (服务端的 processor)；为None时按环境变量新建
+        with_reranker: 是否加载重排模型 (离线工具不需要)
+    """
+    options = {
+        'generate_paraphrases': os.environ.get('INTERVIEW_PARAPHRASE') == '1',
+        'cluster_min_rows': int(os.environ.get('INTERVIEW_CLUSTER_MIN_ROWS', 20000)),
+        'n_probe': int(os.environ.get('INTERVIEW_CLUSTER_PROBE', 8)),
+        'build_workers': int(os.environ.get('INTERVIEW_BUILD_WORKERS', 1)),
+    }
+    if os.environ.get('INTERVIEW_TORCH_THREADS'):
+        options['encoder_threads'] = int(os.environ['INTERVIEW_TORCH_THREADS'])
+    if os.environ.get('INTERVIEW_DEDUP'):
+        options['dedup_threshold'] = float(os.environ['INTERVIEW_DEDUP'])
+    if os.environ.get('INTERVIEW_NORMALIZE_KB') == '1':
+        options['normalizer'] = normalizer if normalizer is not None else processor_from_env()
+    reranker_name = os.environ.get('INTERVIEW_RERANKER')
+    if reranker_name and with_reranker:
+        try:
+            from reranker import CrossEncoderReranker
+            options['reranker'] = CrossEncoderReranker(
+                reranker_name, budget_ms=float(os.environ.get('INTERVIEW_RERANK_BUDGET_MS', 150)))
+        except Exception as e:
+            print(f"✗ 重排模型加载失败，只使用向量匹配: {e}")
+    return options
+
+
+class KnowledgeBaseRegistry:
+    """
+    按名称管理多个知识库 (例如 backend / frontend / hr)
+
+    所有知识库共用同一个 SentenceTransformer 实例，每个知识库有自己的向量、
+    答案存储和匹配缓存，缓存文件放在 cache_dir/<名称>/ 下互不干扰。
+    支持运行时加载、卸载，并估算内存占用。
+    """
+
+    def __init__(self, model_name: str = 'shibing624/text2vec-base-chinese', cache_dir: str = './cache',
+                 default_name: str = DEFAULT_KB_NAME, embedding_cache=None, **matcher_options):
+        """
+        Args:
+            model_name: 共享的语义模型名称
+            cache_dir: 缓存根目录
+            default_name: 未指定知识库时使用的名称
+            embedding_cache: 所有知识库共享的查询向量缓存 (EmbeddingCache)，与共享模型对应
+            **matcher_options: 传给每个 SemanticQuestionMatcher 的其他参数
+        """
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.default_name = default_name
+        self.matcher_options = matcher_options
+        self.embedding_cache = embedding_cache
+        self._model: Optional[SentenceTransformer] = None
+        self._model_bytes = 0
+        self._matchers: Dict[str, SemanticQuestionMatcher] = {}
+        self._paths: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def model(self) -> SentenceTransformer:
+        """共享的语义模型，首次使用时加载"""
+        with self._lock:
+            if self._model is None:
+                print(f"正在加载共享语义模型 '{self.model_name}'...")
+                self._model = SentenceTransformer(self.model_name)
+                self._model_bytes = sum(p.numel() * p.element_size() for p in self._model.parameters())
+                print(f"✓ 共享语义模型加载成功，约 {self._model_bytes / 1024 / 1024:.0f} MB")
+            return self._model
+
+    def load(self, name: str, knowledge_base_path: str) -> SemanticQuestionMatcher:
+        """
+        加载 (或重新加载) 一个知识库
+
+        Args:
+            name: 知识库名称
+            knowledge_base_path: 知识库文件路径
+        """
+        matcher = SemanticQuestionMatcher(
+            knowledge_base_path,
+            model_name=self.model_name,
+            cache_dir=os.path.join(self.cache_dir, name),
+            model=self.model,
+            embedding_cache=self.embedding_cache,
+            **self.matcher_options,
+        )
+        with self._lock:
+            old = self._matchers.get(name)
+            self._matchers[name] = matcher
+            self._paths[name] = knowledge_base_path
+        # 旧匹配器可能还有进行中的匹配在读答案，不主动关闭，最后一个引用释放后由垃圾回收关闭mmap
+        logger.info("✓ 知识库 '%s' 已加载，共 %d 个问题", name, len(matcher.questions))
+        return matcher
+
+    def load_config(self, config: Dict[str, str]) -> List[str]:
+        """按配置批量加载，单个知识库失败不影响其他知识库，返回成功加载的名称"""
+        loaded = []
+        for name, path in config.items():
+            try:
+                self.load(name, path)
+                loaded.append(name)
+            except Exception as e:
+                logger.error("✗ 知识库 '%s' 加载失败: %s", name, e)
+        return loaded
+
+    def unload(self, name: str) -> bool:
+        """卸载知识库，返回是否存在"""
+        with self._lock:
+            matcher = self._matchers.pop(name, None)
+            self._paths.pop(name, None)
+        if matcher is None:
+            return False
+        # 同 load：不关闭仍可能被进行中的匹配使用的答案存储
+        logger.info("✓ 知识库 '%s' 已卸载", name)
+        return True
+
+    def get(self, name: Optional[str] = None) -> Optional[SemanticQuestionMatcher]:
+        """按名称获取知识库，名称为空时返回默认知识库"""
+        with self._lock:
+            return self._matchers.get(name or self.default_name)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._matchers)
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._matchers
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._matchers)
+
+    def memory_usage(self) -> Dict:
+        """共享模型与各知识库的内存估算(字节)"""
+        with self._lock:
+            matchers = dict(self._matchers)
+        per_kb = {name: m.memory_usage() for name, m in matchers.items()}
+        kb_total = sum(usage['total'] for usage in per_kb.values())
+        return {
+            'model': self._model_bytes,
+            'knowledge_bases': per_kb,
+            'total': self._model_bytes + kb_total,
+        }
+
+    def get_stats(self) -> Dict:
+        """各知识库的统计信息"""
+        with self._lock:
+            matchers = dict(self._matchers)
+            paths = dict(self._paths)
+        return {
+            'default': self.default_name,
+            'model_name': self.model_name,
+            'embedding_cache': self.embedding_cache.get_stats() if self.embedding_cache is not None else None,
+            'knowledge_bases': {
+                name: {'path': paths.get(name), 'total_questions': len(m.questions)}
+                for name, m in matchers.items()
+            },
+        }
@@ -0,0 +1,308 @@
+# kb_store.py - 知识库编译产物：一次解析Excel，之后直接读取紧凑二进制
+"""
+编译产物 (.kbc) 格式，小端序:
+
+    头部    magic 'IAKB', 版本 u16, 行数 u32, 列数 u16,
+            源文件大小 u64, 源文件修改时间 u64 (纳秒), 源文件SHA1 20字节
+    列目录  每列: 列名长度 u16, 列名(UTF-8), 字符串区长度 u64
+    偏移表  每列: (行数 + 1) 个 u64 偏移
+    字符串区 每列: 所有单元格UTF-8编码后首尾相接
+
+源文件的大小和修改时间不变时直接复用；修改时间变化但内容哈希一致时也复用。
+CSV/JSONL 源文件逐行流式写入，不会整体读入内存。
+"""
+import csv
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b'IAKB'
+VERSION = 1
+HEADER = struct.Struct('<4sHIHQQ20s')
+REQUIRED_COLUMNS = ('question', 'answer')
+# 可选列：该问题是哪个问题的追问 (填写上一个问题的原文，多个用 | 分隔)
+FOLLOW_UP_COLUMN = 'follow_up_of'
+# 可选列：同一问题的其他说法。variants 列内多个说法用 | 分隔，也可以使用 question_2、question_3 ... 多列
+VARIANTS_COLUMN = 'variants'
+VARIANT_COLUMN_PATTERN = re.compile(r'^question_?\d+$')
+COMPILED_SUFFIX = '.kbc'
+
+
+def file_sha1(path: str) -> bytes:
+    """分块计算文件SHA1"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def _cell(value) -> str:
+    """统一单元格取值：空值为空串，其余转为字符串"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value != value:  # NaN
+        return ''
+    return str(value)
+
+
+def iter_source_rows(path: str) -> Tuple[List[str], Iterator[Dict[str, str]]]:
+    """
+    按源文件类型逐行读取知识库
+
+    Returns:
+        (列名列表, 行迭代器)；CSV/JSONL为流式读取，Excel借助pandas一次读入
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        f = open(path, newline='', encoding='utf-8-sig')
+        reader = csv.DictReader(f)
+        columns = list(reader.fieldnames or [])
+
+        def rows():
+            with f:
+                yield from reader
+        return columns, rows()
+
+    if ext in ('.jsonl', '.ndjson'):
+        f = open(path, encoding='utf-8')
+        first = None
+        for line in f:
+            if line.strip():
+                first = json.loads(line)
+                break
+        columns = list(first.keys()) if first else list(REQUIRED_COLUMNS)
+
+        def rows():
+            with f:
+                if first is not None:
+                    yield first
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        return columns, rows()
+
+    import pandas as pd
+    df = pd.read_excel(path)
+    columns = [str(c) for c in df.columns]
+    return columns, (dict(zip(columns, values)) for values in df.itertuples(index=False, name=None))
+
+
+class CompiledKBWriter:
+    """逐行写入编译产物，各列字符串先写入临时文件，关闭时拼装"""
+
+    def __init__(self, output_path: str, columns: List[str]):
+        self.output_path = output_path
+        self.columns = list(columns)
+        self.rows = 0
+        self._offsets = {c: [0] for c in self.columns}
+        self._blobs = {c: tempfile.TemporaryFile() for c in self.columns}
+
+    def append(self, row: Dict[str, str]) -> None:
+        for column in self.columns:
+            data = _cell(row.get(column)).encode('utf-8')
+            self._blobs[column].write(data)
+            self._offsets[column].append(self._offsets[column][-1] + len(data))
+        self.rows += 1
+
+    def close(self, source_size: int = 0, source_mtime_ns: int = 0, source_sha1: bytes = b'') -> str:
+        tmp_path = self.output_path + '.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, VERSION, self.rows, len(self.columns),
+                                  source_size, source_mtime_ns, source_sha1.ljust(20, b'\0')))
+            for column in self.columns:
+                name = column.encode('utf-8')
+                out.write(struct.pack('<H', len(name)) + name)
+                out.write(struct.pack('<Q', self._offsets[column][-1]))
+            for column in self.columns:
+                out.write(np.asarray(self._offsets[column], dtype='<u8').tobytes())
+            for column in self.columns:
+                blob = self._blobs[column]
+                blob.seek(0)
+                shutil.copyfileobj(blob, out)
+                blob.close()
+        # 先写临时文件再替换，避免并发读取到半成品
+        os.replace(tmp_path, self.output_path)
+        return self.output_path
+
+
+def compile_knowledge_base(source_path: str, output_path: Optional[str] = None) -> str:
+    """
+    将知识库源文件 (xlsx/csv/jsonl) 编译为 .kbc 产物
+
+    问题或答案为空的行会被跳过，其余列原样保留 (例如后续使用的变体列)。
+
+    Returns:
+        产物路径
+    """
+    output_path = output_path or os.path.splitext(source_path)[0] + COMPILED_SUFFIX
+    stat = os.stat(source_path)
+    columns, rows = iter_source_rows(source_path)
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"知识库必须包含 'question' 和 'answer' 两列，缺少: {missing}")
+
+    writer = CompiledKBWriter(output_path, columns)
+    for row in rows:
+        if _cell(row.get('question')).strip() and _cell(row.get('answer')).strip():
+            writer.append(row)
+    return writer.close(stat.st_size, stat.st_mtime_ns, file_sha1(source_path))
+
+
+def _read_header(buf) -> Tuple[dict, List[Tuple[str, int]], int]:
+    magic, version, rows, n_columns, size, mtime_ns, sha1 = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("不是有效的知识库编译文件")
+    if version != VERSION:
+        raise ValueError(f"不支持的知识库编译文件版本: {version}")
+    pos = HEADER.size
+    directory = []
+    for _ in range(n_columns):
+        (name_len,) = struct.unpack_from('<H', buf, pos)
+        pos += 2
+        name = bytes(buf[pos:pos + name_len]).decode('utf-8')
+        pos += name_len
+        (blob_len,) = struct.unpack_from('<Q', buf, pos)
+        pos += 8
+        directory.append((name, blob_len))
+    meta = {'rows': rows, 'source_size': size, 'source_mtime_ns': mtime_ns, 'source_sha1': sha1}
+    return meta, directory, pos
+
+
+def read_compiled_meta(path: str) -> dict:
+    """只读取头部信息"""
+    with open(path, 'rb') as f:
+        head = f.read(HEADER.size)
+    if len(head) < HEADER.size:
+        raise ValueError("知识库编译文件已损坏")
+    magic, version, rows, _, size, mtime_ns, sha1 = HEADER.unpack(head)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("知识库编译文件格式不匹配")
+    return {'rows': rows, 'source_size': size, 'source_mtime_ns': mtime_ns, 'source_sha1': sha1}
+
+
+def compiled_columns(path: str) -> List[str]:
+    """编译产物中的列名"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        _, directory, _ = _read_header(mm)
+    return [name for name, _ in directory]
+
+
+def variant_columns(columns: Iterable[str]) -> List[str]:
+    """列名中表示问题其他说法的列"""
+    return [c for c in columns if c == VARIANTS_COLUMN or VARIANT_COLUMN_PATTERN.match(c)]
+
+
+def _touch_compiled(path: str, source_mtime_ns: int) -> None:
+    """源文件内容未变但修改时间变化时，就地更新头部记录的修改时间"""
+    with open(path, 'r+b') as f:
+        head = f.read(HEADER.size)
+        fields = list(HEADER.unpack(head))
+        fields[5] = source_mtime_ns
+        f.seek(0)
+        f.write(HEADER.pack(*fields))
+
+
+def read_compiled(path: str, columns: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """
+    读取编译产物
+
+    Args:
+        path: .kbc 文件路径
+        columns: 只解码这些列，默认全部
+
+    Returns:
+        列名 -> 字符串列表
+    """
+    wanted = set(columns) if columns is not None else None
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        meta, directory, pos = _read_header(mm)
+        rows = meta['rows']
+        offsets_pos = pos
+        blob_pos = offsets_pos + len(directory) * (rows + 1) * 8
+        result = {}
+        for i, (name, blob_len) in enumerate(directory):
+            if wanted is None or name in wanted:
+                offsets = np.frombuffer(mm, dtype='<u8', count=rows + 1,
+                                        offset=offsets_pos + i * (rows + 1) * 8).tolist()
+                blob = mm[blob_pos:blob_pos + blob_len]
+                result[name] = [blob[offsets[j]:offsets[j + 1]].decode('utf-8') for j in range(rows)]
+            blob_pos += blob_len
+    return result
+
+
+def compiled_path_for(source_path: str, cache_dir: str) -> str:
+    """源文件对应的编译产物路径"""
+    kb_name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(cache_dir, kb_name + COMPILED_SUFFIX)
+
+
+def is_compiled_fresh(source_path: str, compiled_path: str) -> bool:
+    """判断编译产物是否与源文件一致"""
+    if not os.path.exists(compiled_path):
+        return False
+    try:
+        meta = read_compiled_meta(compiled_path)
+    except (OSError, ValueError, struct.error):
+        return False
+    stat = os.stat(source_path)
+    if meta['source_size'] != stat.st_size:
+        return False
+    if meta['source_mtime_ns'] == stat.st_mtime_ns:
+        return True
+    # 仅修改时间变化 (例如被复制或touch)，内容相同仍可复用
+    if meta['source_sha1'] != file_sha1(source_path):
+        return False
+    _touch_compiled(compiled_path, stat.st_mtime_ns)
+    return True
+
+
+def ensure_compiled(source_path: str, cache_dir: str = './cache') -> str:
+    """确保源文件有新鲜的编译产物，返回产物路径"""
+    if source_path.endswith(COMPILED_SUFFIX):
+        return source_path
+    os.makedirs(cache_dir, exist_ok=True)
+    compiled_path = compiled_path_for(source_path, cache_dir)
+    if not is_compiled_fresh(source_path, compiled_path):
+        compile_knowledge_base(source_path, compiled_path)
+    return compiled_path
+
+
+def iter_compiled_column(path: str, column: str) -> Iterator[str]:
+    """逐个解码编译产物中的一列，不构造完整列表"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        meta, directory, pos = _read_header(mm)
+        rows = meta['rows']
+        blob_pos = pos + len(directory) * (rows + 1) * 8
+        for i, (name, blob_len) in enumerate(directory):
+            if name == column:
+                offsets = np.frombuffer(mm, dtype='<u8', count=rows + 1,
+                                        offset=pos + i * (rows + 1) * 8).tolist()
+                for j in range(rows):
+                    yield mm[blob_pos + offsets[j]:blob_pos + offsets[j + 1]].decode('utf-8')
+                return
+            blob_pos += blob_len
+    raise KeyError(column)
+
+
+def load_table(source_path: str, cache_dir: str = './cache',
+               columns: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """
+    加载知识库表格：优先使用新鲜的编译产物，否则从源文件编译后再读取
+
+    Args:
+        source_path: 知识库源文件，也可以直接传入 .kbc 文件
+        cache_dir: 编译产物存放目录
+        columns: 只解码这些列
+
+    Returns:
+        列名 -> 字符串列表
+    """
+    return read_compiled(ensure_compiled(source_path, cache_dir), columns)
@@ -0,0 +1,29 @@
+# lexical_index.py - 基于字符n-gram TF-IDF的廉价匹配，用于高负载时的降级模式
+import numpy as np
+from typing import List
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+class LexicalIndex:
+    """
+    不经过语义模型的字面匹配：中文按单字和双字切分，计算TF-IDF余弦相似度
+
+    一次查询只是一个稀疏矩阵乘法，耗时通常在毫秒以内，但对换一种说法的问题不敏感，
+    因此只作为语义匹配排队过长时的退路。
+    """
+
+    def __init__(self, questions: List[str]):
+        self.vectorizer = TfidfVectorizer(analyzer='char', ngram_range=(1, 2), sublinear_tf=True)
+        # 行已做L2归一化，点积即余弦相似度
+        self.matrix = self.vectorizer.fit_transform(questions)
+
+    def scores(self, text: str) -> np.ndarray:
+        """输入文本与每个问题的相似度"""
+        query = self.vectorizer.transform([text])
+        return (self.matrix @ query.T).toarray().ravel()
+
+    @property
+    def nbytes(self) -> int:
+        m = self.matrix
+        return int(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes)
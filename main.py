@@ -5,85 +5,77 @@ import json
 import os
 import shutil
 import subprocess
+import logging
+import uuid
+import contextvars
+import functools
 from typing import Optional
 from pathlib import Path  # 添加这个导入
 from contextlib import asynccontextmanager  # 添加这个导入
 from vosk import Model, KaldiRecognizer,SetLogLevel
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import asyncio
 
 from matcher import SemanticQuestionMatcher
+from kb_registry import KnowledgeBaseRegistry, load_kb_config, matcher_options_from_env, DEFAULT_KB_NAME
+from vad import VADConfig, StreamingEndpointer
+from audio_protocol import AudioStreamDecoder, ProtocolError, is_framed, SAMPLE_RATES
+from asr_stream import StreamingRecognizer
+from asr_nbest import configure_recognizer, join_segments, hypotheses, merge_cleaned
+from segment_metrics import SegmentLog, extract_words, word_summary
+from session_recorder import SessionRecorder, SessionRecording
+from speculative import (SpeculativeAnswerTracker, ACTION_NEW, ACTION_CONFIRMED,
+                         ACTION_UPDATED, ACTION_RETRACTED)
+from admission import (AdmissionController, Deadline, Overloaded, DeadlineExceeded,
+                       STAGE_ASR, STAGE_MATCH)
+from session_context import SessionContext
+from text_normalizer import RefinedProcessor, processor_from_env
+from embedding_cache import EmbeddingCache, logged_queries
+from encoder import Encoder
+from message_bus import SessionBus, create_bus, DEFAULT_ROOM
+from app_logger import setup_logging, shutdown_logging, get_logger, log_event, session_id_var, Timer
 
-import jieba.analyse
-import jieba.posseg as pseg
-
-#句子清洗功能
-class RefinedProcessor:
-    def __init__(self):
-        self.stop_words=self._load_stop_words()
-        jieba.lcut("预热",cut_all=False)
-        print("✓ 文本处理器初始化完成")
-
-    def _load_stop_words(self):
-        # 实际项目中可以从文件加载更丰富的停用词表
-        return {
-            '的', '了', '呢', '啊', '哦', '嗯', '这个', '那个', '我想','问一下',
-            '请问', '就是', '然后', '其实', '对于', '吧', '呀', '哈', '么','其实','之后','那么'
-        }
-
-    def clean_and_rebuild(self, text: str) -> str:
-        """
-        对文本进行分词，移除停用词，然后重组成一个干净的句子。
-        Args:
-            text: ASR识别出的原始文本
-            
-        Returns:
-            由关键词组成的更干净的文本字符串
-        """
-        if not text:
-            return ""
-        
-        
-        # 1. 使用jieba进行精确模式分词
-        words=jieba.lcut(text.strip(),cut_all=False)
 
-        # 2. 过滤掉停用词 和 单个字符的词 (可以过滤掉很多无意义的词)
-        filtered_words = [word for word in words if word not in self.stop_words and len(word.strip()) > 1]
+logger = get_logger("server")
 
-        # 如果过滤后什么都不剩，可以尝试返回原始文本，或者一个稍微不那么严格的过滤结果
-        if not filtered_words:
-            # 策略：如果严格过滤后为空，放宽条件，只过滤停用词，保留单字符
-            filtered_words = [word for word in words if word not in self.stop_words]
-        
-        # 3. 将过滤后的词重新拼接成句子
-        cleaned_text = "".join(filtered_words)  # 使用""拼接，更像一个句子
-        
-        print(f"原始文本: '{text}' -> 清理后: '{cleaned_text}'")
-        
-        return cleaned_text
+def create_processor() -> RefinedProcessor:
+    """文本清洗器，配置见 text_normalizer.processor_from_env (离线工具使用同样的配置)"""
+    return processor_from_env()
 
 
 # --- 修改点：使用新的lifespan事件处理器 ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global processor
-    processor=RefinedProcessor()
+    global processor, bus, admission, segment_log, session_recorder
+    setup_logging()
+    admission = AdmissionController.from_env()
+    segment_log = SegmentLog.from_env()
+    session_recorder = SessionRecorder.from_env()
+    bus = create_bus(os.environ.get('INTERVIEW_BUS_URL'))
+    await bus.start()
+    # 多worker部署 (serve.py) 时父进程已在fork前加载好模型，这里直接复用
+    if processor is None:
+        processor=create_processor()
     
     # 应用启动时执行
     print("=== 面试辅助工具后端服务启动 ===")
 
     # 首先初始化Vosk模型
-    if init_vosk_model():
+    if vosk_model is not None:
+        print("✓ 复用预加载的Vosk语音识别模型")
+    elif init_vosk_model():
         print("✓ Vosk语音识别模型初始化成功")
     else:
         print("✗ Vosk语音识别模型初始化失败")
         print("注意：语音识别功能将不可用")
     
     # 然后初始化问题匹配器
-    if init_matcher():
+    if registry is not None:
+        print(f"✓ 复用预加载的知识库: {', '.join(registry.names())}")
+    elif init_matcher():
         print("✓ 问题匹配器初始化成功")
         if matcher:
             stats = matcher.get_stats()
@@ -97,6 +89,15 @@ async def lifespan(app: FastAPI):
     
     # 应用关闭时执行的代码可以放在这里
     print("=== 面试辅助工具后端服务关闭 ===")
+    await bus.stop()
+    admission.shutdown()
+    if segment_log is not None:
+        segment_log.close()
+    if session_recorder is not None:
+        session_recorder.close()
+    if registry is not None and registry.embedding_cache is not None:
+        registry.embedding_cache.close()
+    shutdown_logging()
 
 
 app = FastAPI(
@@ -106,9 +107,28 @@ app = FastAPI(
 )
 # 全局变量
 vosk_model: Optional[Model] = None # 用于加载Vosk模型
-matcher: Optional[SemanticQuestionMatcher] = None
-interviewee_ws: Optional[WebSocket] = None
+matcher: Optional[SemanticQuestionMatcher] = None  # 默认知识库
+registry: Optional[KnowledgeBaseRegistry] = None   # 所有知识库，共享同一个语义模型
+# 当前会话选择的知识库名称 (查询参数 kb=名称)，未选择或已卸载时使用默认知识库
+session_kb_var: contextvars.ContextVar = contextvars.ContextVar("session_kb", default=None)
+# 当前会话所在的房间 (查询参数 room=名称)，面试官端的答案发布到该房间，面试者端订阅该房间
+session_room_var: contextvars.ContextVar = contextvars.ContextVar("session_room", default=DEFAULT_ROOM)
+# 当前会话的滚动上下文 (最近几轮识别文本与查询向量)，查询参数 context=0 时关闭
+session_context_var: contextvars.ContextVar = contextvars.ContextVar("session_context", default=None)
+bus: Optional[SessionBus] = None  # 面试官端与面试者端之间的消息总线
+admission: Optional[AdmissionController] = None  # 各阶段有界线程池、截止时间与降级模式
 processor: Optional[RefinedProcessor]=None 
+# ASR n-best：INTERVIEW_ASR_NBEST 为每句输出的候选数 (默认1即只用最佳结果)，
+# 候选置信度按 softmax(解码得分 / INTERVIEW_ASR_TEMPERATURE) 计算，
+# INTERVIEW_ASR_WEIGHT 为置信度在 (候选, 问题) 综合得分中的权重
+ASR_ALTERNATIVES = int(os.environ.get('INTERVIEW_ASR_NBEST', 1))
+ASR_TEMPERATURE = float(os.environ.get('INTERVIEW_ASR_TEMPERATURE', 5.0))
+ASR_WEIGHT = float(os.environ.get('INTERVIEW_ASR_WEIGHT', 0.1))
+# 每个语音段的词级置信度与各阶段延迟 (INTERVIEW_SEGMENT_LOG 指定文件时开启，见 segment_metrics.py)
+segment_log: Optional[SegmentLog] = None
+# 面试官会话录制 (INTERVIEW_RECORD_DIR 指定目录时开启，用 replay.py 重放)
+session_recorder: Optional[SessionRecorder] = None
+session_recording_var: contextvars.ContextVar = contextvars.ContextVar("session_recording", default=None)
 
 def init_vosk_model():
     """在服务启动时加载Vosk离线模型"""
@@ -137,23 +157,113 @@ def init_vosk_model():
         print(f"加载Vosk模型失败: {e}")
         return False
 
+def embedding_cache_from_env(model_name: str) -> Optional[EmbeddingCache]:
+    """
+    所有会话、所有知识库共享的查询向量缓存
+
+    INTERVIEW_EMBED_CACHE_SIZE 为内存LRU容量 (默认4096，0表示关闭)；
+    INTERVIEW_EMBED_CACHE_DB 为持久层SQLite文件 (默认 cache/query_embeddings.sqlite，设为空串只用内存)。
+    """
+    capacity = int(os.environ.get('INTERVIEW_EMBED_CACHE_SIZE', 4096))
+    if capacity <= 0:
+        return None
+    path = os.environ.get('INTERVIEW_EMBED_CACHE_DB', os.path.join('cache', 'query_embeddings.sqlite')) or None
+    try:
+        return EmbeddingCache(model_name, capacity=capacity, path=path)
+    except Exception as e:
+        print(f"✗ 查询向量持久缓存不可用，只使用内存缓存: {e}")
+        return EmbeddingCache(model_name, capacity=capacity)
+
+def warm_embedding_cache(cache: EmbeddingCache, model) -> None:
+    """
+    启动时预热查询向量缓存：先载入持久层中的热门向量，再编码历史日志中
+    (INTERVIEW_EMBED_WARM_LOGS，多个文件用逗号分隔) 尚未缓存的高频提问
+    """
+    loaded = cache.warm_from_disk()
+    paths = [p for p in os.environ.get('INTERVIEW_EMBED_WARM_LOGS', '').split(',') if p.strip()]
+    encoded = 0
+    if paths:
+        try:
+            queries = logged_queries([p.strip() for p in paths], limit=cache.capacity)
+            encoded = cache.warm(queries, Encoder(model).encode)
+        except OSError as e:
+            print(f"✗ 读取历史日志失败: {e}")
+    if loaded or encoded:
+        print(f"✓ 查询向量缓存预热完成：载入 {loaded} 条，新编码 {encoded} 条")
+
 # 初始化问题匹配器
 def init_matcher():
-    global matcher
+    """
+    初始化知识库注册表
+
+    配置文件 (环境变量 INTERVIEW_KB_CONFIG，默认 knowledge_bases.json) 存在时按其中的
+    {"名称": "路径"} 加载多个知识库；否则只加载 knowledge_base.xlsx 作为默认知识库。
+    """
+    global matcher, registry
     knowledge_base_path = 'knowledge_base.xlsx'
+    config = load_kb_config(os.environ.get('INTERVIEW_KB_CONFIG', 'knowledge_bases.json'))
     
-    if not os.path.exists(knowledge_base_path):
-        print(f"警告：未找到知识库文件 {knowledge_base_path}")
-        print("请创建包含 'question' 和 'answer' 列的Excel文件")
-        return False
+    if not config:
+        if not os.path.exists(knowledge_base_path):
+            print(f"警告：未找到知识库文件 {knowledge_base_path}")
+            print("请创建包含 'question' 和 'answer' 列的Excel文件")
+            return False
+        config = {DEFAULT_KB_NAME: knowledge_base_path}
     
     try:
-        matcher= SemanticQuestionMatcher(knowledge_base_path)
-        return True
+        registry = KnowledgeBaseRegistry(**matcher_options_from_env(normalizer=processor))
+        registry.embedding_cache = embedding_cache_from_env(registry.model_name)
+        loaded = registry.load_config(config)
+        if registry.embedding_cache is not None:
+            warm_embedding_cache(registry.embedding_cache, registry.model)
+        if loaded and registry.default_name not in loaded:
+            registry.default_name = loaded[0]
+        matcher = registry.get()
+        return matcher is not None
     except Exception as e:
         print(f"初始化匹配器失败: {e}")
         return False
 
+def current_matcher() -> Optional[SemanticQuestionMatcher]:
+    """当前会话使用的知识库；每次按名称查找，运行时卸载后自动回落到默认知识库"""
+    name = session_kb_var.get()
+    selected = registry.get(name) if registry and name else None
+    return selected or matcher
+
+async def select_session_kb(websocket: WebSocket) -> None:
+    """根据查询参数 kb 为会话选择知识库，名称不存在时提示并使用默认知识库"""
+    name = websocket.query_params.get('kb')
+    if not name:
+        return
+    if not registry or name not in registry:
+        await websocket.send_text(json.dumps({
+            'type': 'error', 'message': f'知识库 {name} 不存在，使用默认知识库'
+        }))
+        return
+    session_kb_var.set(name)
+    logger.info("会话使用知识库 '%s'", name)
+
+def join_room(websocket: WebSocket) -> str:
+    """根据查询参数 room 设置会话所在的房间"""
+    room = websocket.query_params.get('room') or DEFAULT_ROOM
+    session_room_var.set(room)
+    return room
+
+def start_session_context(websocket: WebSocket) -> Optional[SessionContext]:
+    """为会话创建滚动上下文，使追问可以结合上文匹配"""
+    if websocket.query_params.get('context') == '0':
+        return None
+    context = SessionContext()
+    session_context_var.set(context)
+    return context
+
+async def send_to_interviewee(message: str) -> None:
+    """把消息发布到当前会话的房间，由订阅该房间的面试者端接收 (可能在其他节点上)"""
+    recording = session_recording_var.get()
+    if recording is not None:
+        recording.published(message)
+    await bus.publish(session_room_var.get(), message)
+
 # --- 修改后的音频转换函数 ---
 def convert_audio_to_wav(input_bytes: bytes) -> bytes:
     """使用FFmpeg将任意格式的音频字节流转换为WAV格式的字节流"""
@@ -173,10 +283,10 @@ def convert_audio_to_wav(input_bytes: bytes) -> bytes:
         ffmpeg_in_path = shutil.which("ffmpeg")
         if ffmpeg_in_path:
             FFMPEG_CMD = ffmpeg_in_path
-            print(f"使用系统PATH中的ffmpeg: {FFMPEG_CMD}")
+            logger.debug("使用系统PATH中的ffmpeg: %s", FFMPEG_CMD)
         else:
-            print(f"错误：在指定路径和系统PATH中都未找到ffmpeg。")
-            print(f"请检查 FFMPEG_CMD 变量的路径是否正确: '{FFMPEG_CMD}'")
+            logger.error("错误：在指定路径和系统PATH中都未找到ffmpeg。")
+            logger.error("请检查 FFMPEG_CMD 变量的路径是否正确: '%s'", FFMPEG_CMD)
             raise RuntimeError("FFmpeg not found")
     
     command = [
@@ -198,15 +308,15 @@ def convert_audio_to_wav(input_bytes: bytes) -> bytes:
         wav_bytes, err = process.communicate(input=input_bytes)
         
         if process.returncode != 0:
-            print(f"FFmpeg错误: {err.decode(errors='ignore')}")
+            logger.error("FFmpeg错误: %s", err.decode(errors='ignore'))
             return None
         
         return wav_bytes
     except FileNotFoundError:
-        print(f"错误: 无法执行命令 '{FFMPEG_CMD}'。请确保路径正确且文件有执行权限。")
+        logger.error("错误: 无法执行命令 '%s'。请确保路径正确且文件有执行权限。", FFMPEG_CMD)
         return None
     except Exception as e:
-        print(f"FFmpeg转换时发生异常: {e}")
+        logger.error("FFmpeg转换时发生异常: %s", e)
         return None
 
 @app.get("/", response_class=HTMLResponse)
@@ -383,42 +493,93 @@ async def get_interviewer_page():
             matchedCount.textContent = stats.matched;
         }
 
-        // 将Float32Array转换为WAV格式
-        function encodeWAV(samples, sampleRate = 16000) {
-            const buffer = new ArrayBuffer(44 + samples.length * 2);
-            const view = new DataView(buffer);
-            
-            // WAV头部
-            const writeString = (offset, string) => {
-                for (let i = 0; i < string.length; i++) {
-                    view.setUint8(offset + i, string.charCodeAt(i));
-                }
-            };
-            
-            writeString(0, 'RIFF');
-            view.setUint32(4, 36 + samples.length * 2, true);
-            writeString(8, 'WAVE');
-            writeString(12, 'fmt ');
-            view.setUint32(16, 16, true);
-            view.setUint16(20, 1, true);
-            view.setUint16(22, 1, true);
-            view.setUint32(24, sampleRate, true);
-            view.setUint32(28, sampleRate * 2, true);
-            view.setUint16(32, 2, true);
-            view.setUint16(34, 16, true);
-            writeString(36, 'data');
-            view.setUint32(40, samples.length * 2, true);
-            
-            // 写入音频数据
-            const offset = 44;
+        // 二进制分帧协议 (与 audio_protocol.py 保持一致)
+        const PROTOCOL = {
+            VERSION: 1, MSG_AUDIO: 1, MSG_ACK: 2,
+            CODEC_PCM16: 0, CODEC_PCM16_DELTA_ZLIB: 1,
+            FLAG_END_OF_UTTERANCE: 0x01, HEADER_SIZE: 20,
+            FRAME_SAMPLES: 8000  // 每帧0.5秒
+        };
+        const sessionId = Math.floor(Math.random() * 0xFFFFFFFF);
+        const supportsDeflate = typeof CompressionStream !== 'undefined';
+        const pendingFrames = new Map();  // 未确认的帧，断线重连后重发
+        let nextSeq = 0;
+
+        // 将Float32Array转换为16位PCM
+        function floatToPCM16(samples) {
+            const pcm = new Int16Array(samples.length);
             for (let i = 0; i < samples.length; i++) {
                 const sample = Math.max(-1, Math.min(1, samples[i]));
-                view.setInt16(offset + i * 2, sample * 0x7FFF, true);
+                pcm[i] = sample * 0x7FFF;
             }
-            
+            return pcm;
+        }
+
+        // 差分 + deflate 无损压缩，浏览器不支持时退回原始PCM
+        async function encodePayload(pcm) {
+            if (!supportsDeflate) {
+                return {
+                    codec: PROTOCOL.CODEC_PCM16,
+                    payload: new Uint8Array(pcm.buffer, pcm.byteOffset, pcm.byteLength)
+                };
+            }
+            const delta = new Int16Array(pcm.length);
+            let prev = 0;
+            for (let i = 0; i < pcm.length; i++) {
+                delta[i] = pcm[i] - prev;  // Int16Array赋值自动回绕
+                prev = pcm[i];
+            }
+            const stream = new Blob([delta.buffer]).stream().pipeThrough(new CompressionStream('deflate'));
+            const payload = new Uint8Array(await new Response(stream).arrayBuffer());
+            return { codec: PROTOCOL.CODEC_PCM16_DELTA_ZLIB, payload };
+        }
+
+        function packFrame(seq, payload, codec, flags, sampleRate) {
+            const buffer = new ArrayBuffer(PROTOCOL.HEADER_SIZE + payload.length);
+            const view = new DataView(buffer);
+            view.setUint8(0, 0x49);  // 'I'
+            view.setUint8(1, 0x41);  // 'A'
+            view.setUint8(2, PROTOCOL.VERSION);
+            view.setUint8(3, PROTOCOL.MSG_AUDIO);
+            view.setUint8(4, codec);
+            view.setUint8(5, flags);
+            view.setUint32(6, sessionId, true);
+            view.setUint32(10, seq, true);
+            view.setUint16(14, sampleRate, true);
+            view.setUint32(16, payload.length, true);
+            new Uint8Array(buffer, PROTOCOL.HEADER_SIZE).set(payload);
             return buffer;
         }
 
+        // 将一句语音切成若干帧发送，最后一帧带断句标记
+        async function sendUtterance(samples, sampleRate = 16000) {
+            const pcm = floatToPCM16(samples);
+            // 压缩是异步的：先一次性占用本句所有帧的序号，两句重叠发送时序号也不会交错
+            const firstSeq = nextSeq;
+            nextSeq += Math.ceil(pcm.length / PROTOCOL.FRAME_SAMPLES);
+            for (let offset = 0; offset < pcm.length; offset += PROTOCOL.FRAME_SAMPLES) {
+                const chunk = pcm.subarray(offset, offset + PROTOCOL.FRAME_SAMPLES);
+                const { codec, payload } = await encodePayload(chunk);
+                const isLast = offset + PROTOCOL.FRAME_SAMPLES >= pcm.length;
+                const seq = firstSeq + offset / PROTOCOL.FRAME_SAMPLES;
+                const frame = packFrame(seq, payload, codec,
+                                        isLast ? PROTOCOL.FLAG_END_OF_UTTERANCE : 0, sampleRate);
+                pendingFrames.set(seq, frame);
+                if (ws && ws.readyState === WebSocket.OPEN) {
+                    ws.send(frame);
+                }
+            }
+        }
+
+        function handleAck(buffer) {
+            const view = new DataView(buffer);
+            if (buffer.byteLength < PROTOCOL.HEADER_SIZE || view.getUint8(3) !== PROTOCOL.MSG_ACK) return;
+            const ackedSeq = view.getUint32(10, true);
+            for (const seq of pendingFrames.keys()) {
+                if (seq <= ackedSeq) pendingFrames.delete(seq);
+            }
+        }
+
         // 初始化VAD
         async function initializeVAD() {
             try {
@@ -435,21 +596,16 @@ async def get_interviewer_page():
                         console.log(`语音结束，音频长度: ${audio.length} 采样点`);
                         updateVadStatus('处理中...', false);
                         
-                        try {
-                            // 转换为WAV格式
-                            const wavBuffer = encodeWAV(audio);
-                            const audioBlob = new Blob([wavBuffer], { type: 'audio/wav' });
-                            
-                            // 发送给后端
-                            if (ws && ws.readyState === WebSocket.OPEN && audioBlob.size > 1000) {
-                                ws.send(audioBlob);
+                        // 分帧压缩后发送给后端
+                        if (ws && ws.readyState === WebSocket.OPEN && audio.length > 500) {
+                            sendUtterance(audio).then(() => {
                                 stats.sent++;
                                 updateStats();
                                 updateStatus(`发送音频片段 ${stats.sent}`, 'info');
-                            }
-                        } catch (error) {
-                            console.error('音频处理失败:', error);
-                            updateStatus('音频处理失败', 'error');
+                            }).catch(error => {
+                                console.error('音频处理失败:', error);
+                                updateStatus('音频处理失败', 'error');
+                            });
                         }
                         
                         // 重置状态
@@ -529,10 +685,16 @@ async def get_interviewer_page():
         // WebSocket连接
         function connectWebSocket() {
             const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-            const wsUrl = `${protocol}//${window.location.host}/ws/interviewer`;
+            // 页面地址上的查询参数 (如 kb=backend) 原样转发给服务端
+            const wsUrl = `${protocol}//${window.location.host}/ws/interviewer${window.location.search}`;
             ws = new WebSocket(wsUrl);
+            ws.binaryType = 'arraybuffer';
 
             ws.onopen = () => {
+                // 重发断线前未被确认的帧
+                for (const frame of pendingFrames.values()) {
+                    ws.send(frame);
+                }
                 updateStatus('服务器连接成功，正在初始化VAD...', 'success');
                 // 连接成功后初始化VAD
                 initializeVAD().then(success => {
@@ -556,6 +718,10 @@ async def get_interviewer_page():
             };
             
             ws.onmessage = (event) => {
+                if (event.data instanceof ArrayBuffer) {
+                    handleAck(event.data);
+                    return;
+                }
                 try {
                     const data = JSON.parse(event.data);
                     handleServerMessage(data);
@@ -580,6 +746,9 @@ async def get_interviewer_page():
                 case 'error':
                     updateStatus(`错误: ${data.message}`, 'error');
                     break;
+                case 'dropped':
+                    updateStatus(data.message, 'error');
+                    break;
             }
         }
         
@@ -614,128 +783,482 @@ async def get_interviewer_page():
 
 @app.websocket("/ws/interviewee")
 async def interviewee_websocket_endpoint(websocket: WebSocket):
-    """面试者客户端连接点"""
-    global interviewee_ws
+    """面试者客户端连接点：订阅房间 (查询参数 room)，把收到的答案转发给客户端"""
     await websocket.accept()
-    interviewee_ws = websocket
-    print("✓ 面试者客户端已连接")
-    
-    try:
+    room = join_room(websocket)
+    subscription = bus.subscribe(room)
+    logger.info("✓ 面试者客户端已连接 (房间 %s)", room)
+
+    async def forward():
+        async for message in subscription:
+            await websocket.send_text(message)
+
+    async def receive():
         while True:
             # 保持连接，可以接收心跳或命令
             data = await websocket.receive_text()
             if data == "ping":
                 await websocket.send_text("pong")
-    except WebSocketDisconnect:
-        interviewee_ws = None
-        print("✗ 面试者客户端已断开")
+
+    # 转发和接收任一方结束 (客户端断开或发送失败) 都结束整个连接，避免转发失败后连接空挂
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(receive())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is None or isinstance(error, WebSocketDisconnect):
+                logger.info("✗ 面试者客户端已断开 (房间 %s)", room)
+            else:
+                logger.warning("✗ 面试者连接异常，断开 (房间 %s): %s", room, error)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        subscription.close()
 
 @app.websocket("/ws/interviewer")
 async def interviewer_websocket_endpoint(websocket: WebSocket):
-    """面试官手机连接点"""
+    """
+    面试官手机连接点
+
+    支持两种上传方式：
+      1. 分帧协议 (audio_protocol.py)：按帧发送压缩PCM，断句标记处触发识别；
+         查询参数 vad=server 时改为由服务端VAD断句
+      2. 旧版：每条消息是一整段任意格式的音频，经FFmpeg转换后识别
+    """
     await websocket.accept()
-    print("✓ 面试官手机端已连接")
+    session_id = uuid.uuid4().hex[:8]
+    session_id_var.set(session_id)
+    recording: Optional[SessionRecording] = None
+    if session_recorder is not None:
+        recording = session_recorder.open_session(session_id, path=websocket.url.path,
+                                                  query=websocket.url.query)
+        session_recording_var.set(recording)
+        websocket = recording.wrap(websocket)
+    room = join_room(websocket)
+    start_session_context(websocket)
+    logger.info("✓ 面试官手机端已连接 (房间 %s)", room)
+    await select_session_kb(websocket)
+
+    decoder = AudioStreamDecoder()
+    server_vad = websocket.query_params.get('vad') == 'server'
+    # 默认开启预判匹配，speculative=0 关闭
+    tracker = None if websocket.query_params.get('speculative') == '0' else SpeculativeAnswerTracker()
+    endpointer: Optional[StreamingEndpointer] = None
+    recognizer: Optional[StreamingRecognizer] = None
     
     try:
         while True:
             # 接收音频数据
             audio_data = await websocket.receive_bytes()
-            print(f"收到音频数据，大小: {len(audio_data)} 字节")
-            
-            # 在处理前先进行格式转换
-            wav_audio_data = convert_audio_to_wav(audio_data)
-            
-            if wav_audio_data:
-                # 使用转换后的数据进行处理
-                await process_audio(websocket, wav_audio_data)
-            else:
-                print("✗ 音频转换失败，跳过处理")
+            log_event(logger, logging.DEBUG, "audio_received", "收到音频数据",
+                      stage="receive", size=len(audio_data))
+
+            if not is_framed(audio_data):
+                # 旧版整段音频，由process_audio负责格式转换
+                await process_audio(websocket, audio_data)
+                continue
+
+            try:
+                chunks = decoder.feed(audio_data)
+            except ProtocolError as e:
+                logger.warning("✗ 音频帧解析失败: %s", e)
+                await websocket.send_text(json.dumps({'type': 'error', 'message': f'音频帧错误: {e}'}))
+                # 损坏的帧按空音频占位，其后已到达的帧照常处理
+                chunks = decoder.take_ready()
+            if not chunks:
+                continue
+            # 先确认再识别，避免客户端因识别耗时而误判丢帧
+            await websocket.send_bytes(decoder.ack_frame())
+
+            for pcm, end_of_utterance in chunks:
+                if server_vad:
+                    if endpointer is None:
+                        endpointer = StreamingEndpointer(VADConfig(sample_rate=decoder.sample_rate))
+                    for segment in endpointer.feed(pcm):
+                        await recognize_and_match(websocket, segment, decoder.sample_rate)
+                    continue
+
+                # 解码后的PCM直接写入会话的环形缓冲区，边收边识别
+                if not vosk_model:
+                    if end_of_utterance:
+                        await recognize_and_match(websocket, b'')  # 回复模型未加载的错误
+                    continue
+                if recognizer is None or recognizer.sample_rate != decoder.sample_rate:
+                    recognizer = StreamingRecognizer(vosk_model, decoder.sample_rate,
+                                                     max_alternatives=ASR_ALTERNATIVES,
+                                                     words=segment_log is not None)
+                recognizer.write(pcm)
+                if end_of_utterance:
+                    await recognize_and_match(websocket, recognizer=recognizer, tracker=tracker)
+                    if tracker is not None:
+                        if tracker.provisional is not None:
+                            # 最终没有走到匹配 (识别为空等)，撤回已推送的预判答案
+                            await deliver_answer(None, '', tracker)
+                        tracker.reset()
+                elif tracker is not None and admission.allow_speculation():
+                    partial = await admission.try_run(STAGE_ASR, recognizer.drain_partial)
+                    if partial is not None:
+                        await speculate(partial, tracker)
+                else:
+                    # 识别线程忙时跳过，剩余音频在句末 finalize 时一并送入
+                    await admission.try_run(STAGE_ASR, recognizer.drain)
             
     except WebSocketDisconnect:
-        print("✗ 面试官手机端已断开")
+        logger.info("✗ 面试官手机端已断开 (压缩比 %.2f) %s 缓冲区 %s 预判 %s", decoder.compression_ratio,
+                    decoder.stats, recognizer.stats if recognizer else None,
+                    tracker.stats if tracker else None)
     except Exception as e:
-        print(f"处理音频时出错: {e}")
+        logger.error("处理音频时出错: %s", e)
+    finally:
+        if recording is not None:
+            recording.close()
+
+@app.websocket("/ws/interviewer/stream")
+async def interviewer_stream_endpoint(websocket: WebSocket):
+    """
+    连续PCM流连接点：客户端持续发送16位单声道PCM，由服务端VAD断句后识别
+
+    查询参数:
+        sample_rate: 输入采样率，默认16000
+        hangover_ms / min_speech_ms / max_utterance_ms: 覆盖默认的断句参数
+    """
+    await websocket.accept()
+    session_id = uuid.uuid4().hex[:8]
+    session_id_var.set(session_id)
+
+    params = websocket.query_params
+    try:
+        config = VADConfig(
+            sample_rate=int(params.get('sample_rate', 16000)),
+            hangover_ms=int(params.get('hangover_ms', 450)),
+            min_speech_ms=int(params.get('min_speech_ms', 300)),
+            max_utterance_ms=int(params.get('max_utterance_ms', 15000)),
+        )
+    except ValueError:
+        await websocket.close(code=1003)
+        return
+    if config.sample_rate not in SAMPLE_RATES:
+        await websocket.close(code=1003)
+        return
+    endpointer = StreamingEndpointer(config)
+    join_room(websocket)
+    start_session_context(websocket)
+    await select_session_kb(websocket)
+    logger.info("✓ 面试官流式端已连接 (采样率 %d)", config.sample_rate)
+
+    try:
+        while True:
+            chunk = await websocket.receive_bytes()
+            for utterance in endpointer.feed(chunk):
+                log_event(logger, logging.DEBUG, "vad_segment", "VAD断句", stage="vad",
+                          duration_ms=len(utterance) * 500 // config.sample_rate)
+                await recognize_and_match(websocket, utterance, config.sample_rate)
+    except WebSocketDisconnect:
+        utterance = endpointer.flush()
+        if utterance:
+            try:
+                await recognize_and_match(websocket, utterance, config.sample_rate)
+            except Exception as e:
+                logger.debug("断开后处理最后一段语音失败: %s", e)
+        logger.info("✗ 面试官流式端已断开 %s", endpointer.stats)
+    except Exception as e:
+        logger.error("处理音频流时出错: %s", e)
+
+def run_recognition(data: bytes, sample_rate: int = 16000) -> dict:
+    """同步执行一次完整的Vosk识别，结果带 audio_ms / decode_ms (与 StreamingRecognizer.finalize 一致)"""
+    timer = Timer()
+    rec = KaldiRecognizer(vosk_model, sample_rate)
+    configure_recognizer(rec, ASR_ALTERNATIVES, words=segment_log is not None)
+    rec.AcceptWaveform(data)
+    result = join_segments(json.loads(rec.FinalResult()), [])
+    result['audio_ms'] = round(len(data) * 1000 / (sample_rate * 2))
+    result['decode_ms'] = timer.ms()
+    return result
+
+def cleaned_hypotheses(result: dict) -> list:
+    """
+    n-best 识别结果中各候选清洗后的文本及置信度，清洗后相同的候选合并
+
+    Returns:
+        [(清洗后的文本, 置信度)]；未开启 n-best 或清洗后只剩一个候选时返回空列表
+    """
+    if ASR_ALTERNATIVES <= 1 or not result.get('alternatives'):
+        return []
+    merged = merge_cleaned([(processor.clean_and_rebuild(text), confidence)
+                            for text, confidence in hypotheses(result, ASR_TEMPERATURE)])
+    return merged if len(merged) > 1 else []
 
 async def process_audio(websocket: WebSocket, audio_data: bytes):
-    """使用Vosk处理音频识别和匹配"""
+    """将任意格式的音频转换为WAV后识别和匹配"""
     # 检查Vosk模型是否已加载
     if not vosk_model:
-        print("✗ Vosk模型未加载，无法进行识别")
+        logger.error("✗ Vosk模型未加载，无法进行识别")
         await websocket.send_text(json.dumps({
             'type': 'error', 
             'message': 'Vosk语音识别模型未加载'
         }))
         return
 
+    deadline = admission.new_deadline()
     try:
         #异步实现FFmpeg转换
-        wav_audio_data=await asyncio.to_thread(convert_audio_to_wav,audio_data)
+        stage_timer = Timer()
+        wav_audio_data = await admission.run(STAGE_ASR, convert_audio_to_wav, audio_data, deadline=deadline)
+        log_event(logger, logging.DEBUG, "stage_done", stage="convert", latency_ms=stage_timer.ms())
         if not wav_audio_data:
-            print("✗ 音视频转换失败，跳过处理")
+            logger.warning("✗ 音视频转换失败，跳过处理")
             return
+    except (Overloaded, DeadlineExceeded) as e:
+        await drop_segment(websocket, e)
+        return
+    except Exception as e:
+        logger.exception("✗ 音频转换时出错: %s", e)
+        await websocket.send_text(json.dumps({
+            'type': 'error', 'message': f'处理音频时出错: {e}'
+        }))
+        return
 
-        # 将同步的Vosk代码封装在一个函数内
-        def run_recognition(data):
-            rec = KaldiRecognizer(vosk_model, 16000)
-            rec.AcceptWaveform(data)
-            return json.loads(rec.FinalResult())
+    await recognize_and_match(websocket, wav_audio_data, deadline=deadline)
 
-        result = await asyncio.to_thread(run_recognition, wav_audio_data)
-        text = result.get('text', '').replace(' ', '') # 获取文本并移除空格
-        
-        if text:
-            print(f"✓ 离线识别结果: {text}")
-            
-            # 发送识别结果给面试官
-            await websocket.send_text(json.dumps({
-                'type': 'recognition_result',
-                'text': text
-            }))
-
-            # 匹配答案 (这部分逻辑不变)
-            if matcher and processor :
-                
-                #提炼关键词
-                cleaned_text = processor.clean_and_rebuild(text)
-                if cleaned_text:
+def format_answer(match_result: dict) -> str:
+    """面试者端显示的答案文本"""
+    return (f"问题: {match_result['question']}\n\n答案: {match_result['answer']}"
+            f"\n\n(相似度: {match_result['similarity']:.2f})")
 
-                    #异步运行语义匹配
-                    match_result = await asyncio.to_thread(matcher.match, cleaned_text)
+def answer_message(status: str, match_result: dict) -> str:
+    """预判相关的结构化答案消息，面试者端据此显示、确认、更正或撤回"""
+    return json.dumps({
+        'type': 'answer', 'status': status, 'index': match_result['index'],
+        'question': match_result['question'], 'similarity': match_result['similarity'],
+        'text': format_answer(match_result),
+    }, ensure_ascii=False)
 
-                    if match_result:
-                        answer = match_result['answer']
-                        question = match_result['question']
-                        similarity = match_result['similarity']
-                        
-                        print(f"✓ 找到匹配答案，相似度: {similarity:.3f}")
-                        
-                        await websocket.send_text(json.dumps({
-                            'type': 'match_result', 'question': question, 'similarity': similarity
-                        }))
-                        
-                        if interviewee_ws:
-                            formatted_answer = f"问题: {question}\n\n答案: {answer}\n\n(相似度: {similarity:.2f})"
-                            await interviewee_ws.send_text(formatted_answer)
-                            print(f"✓ 已发送答案给面试者: {answer[:30]}...")
-                    else:
-                        print("✗ 未找到匹配的答案")
-                        if interviewee_ws:
-                            await interviewee_ws.send_text(f"未找到匹配答案: {text}")
-            else:
-                print("✗ 问题匹配器未初始化")
+async def speculate(partial_text: str, tracker: SpeculativeAnswerTracker):
+    """对稳定的中间识别结果做预判匹配，置信度足够时先把答案推给面试者"""
+    active_matcher = current_matcher()
+    if not (active_matcher and processor):
+        return
+    stable_text = tracker.observe_partial(partial_text)
+    if not stable_text:
+        return
+    cleaned_text = processor.clean_and_rebuild(stable_text)
+    if not cleaned_text:
+        return
 
-        else:
-            print("✗ 离线识别未能解析出文本")
-            await websocket.send_text(json.dumps({
-                'type': 'error', 'message': '无法理解音频内容'
-            }))
+    stage_timer = Timer()
+    match_result = await admission.try_run(STAGE_MATCH, active_matcher.match, cleaned_text)
+    if match_result is None:
+        return
+    provisional = tracker.offer_provisional(match_result)
+    log_event(logger, logging.DEBUG, "speculative_match", stage="speculate", latency_ms=stage_timer.ms(),
+              partial=stable_text, sent=provisional is not None)
+    if provisional:
+        await send_to_interviewee(answer_message('provisional', provisional))
+
+async def deliver_answer(match_result: Optional[dict], text: str,
+                         tracker: Optional[SpeculativeAnswerTracker] = None):
+    """把最终匹配结果推送给面试者；之前推送过预判答案时改为确认、更正或撤回"""
+    if tracker is not None:
+        action, result = tracker.resolve(match_result)
+    else:
+        action, result = (ACTION_NEW, match_result) if match_result else (None, None)
+
+    if action == ACTION_NEW:
+        await send_to_interviewee(format_answer(result))
+    elif action == ACTION_CONFIRMED:
+        await send_to_interviewee(answer_message('confirmed', result))
+    elif action == ACTION_UPDATED:
+        await send_to_interviewee(answer_message('updated', result))
+    elif action == ACTION_RETRACTED:
+        await send_to_interviewee(answer_message('retracted', result))
+    else:
+        await send_to_interviewee(f"未找到匹配答案: {text}")
+    log_event(logger, logging.DEBUG, "answer_sent", "✓ 已发送答案给面试者",
+              stage="deliver", action=action or 'no_match')
 
+async def drop_segment(websocket: WebSocket, reason: Exception,
+                       recognizer: Optional[StreamingRecognizer] = None):
+    """过载或超时时放弃当前语音段，并告知面试官端"""
+    if recognizer is not None:
+        recognizer.discard()
+    stage = str(reason) or type(reason).__name__
+    admission.record_drop(f"{type(reason).__name__} ({stage})")
+    await websocket.send_text(json.dumps({
+        'type': 'dropped', 'reason': type(reason).__name__, 'stage': stage,
+        'message': '服务繁忙，本段语音已跳过'
+    }))
+
+async def match_with_admission(active_matcher: SemanticQuestionMatcher, cleaned_text: str,
+                               deadline: Deadline, raw_text: str = '',
+                               alternatives: Optional[list] = None) -> Optional[dict]:
+    """
+    在匹配阶段线程池中匹配 (有会话上下文时结合上文)；负载过高时改用字面匹配
+
+    alternatives 为 n-best 候选 (见 cleaned_hypotheses) 时所有候选一次批量编码，
+    按相似度和识别置信度选出最佳组合；降级模式下只用最佳候选。
+    """
+    if admission.check_degraded():
+        admission.stats['degraded_matches'] += 1
+        return await admission.run(STAGE_MATCH, active_matcher.lexical_match, cleaned_text, deadline=deadline)
+    context = session_context_var.get()
+    if alternatives:
+        return await admission.run(STAGE_MATCH, functools.partial(
+            active_matcher.match_hypotheses, alternatives, asr_weight=ASR_WEIGHT, context=context,
+            raw_text=raw_text), deadline=deadline)
+    if context is not None:
+        return await admission.run(STAGE_MATCH, functools.partial(
+            active_matcher.match_in_context, cleaned_text, context, raw_text=raw_text), deadline=deadline)
+    return await admission.run(STAGE_MATCH, active_matcher.match, cleaned_text, deadline=deadline)
+
+async def recognize_and_match(websocket: WebSocket, audio_data: Optional[bytes] = None,
+                              sample_rate: int = 16000,
+                              recognizer: Optional[StreamingRecognizer] = None,
+                              tracker: Optional[SpeculativeAnswerTracker] = None,
+                              deadline: Optional[Deadline] = None):
+    """
+    使用Vosk识别一段PCM/WAV音频并匹配答案
+
+    Args:
+        audio_data: 整段音频；与 recognizer 二选一
+        sample_rate: 音频采样率
+        recognizer: 会话的流式识别器，音频已写入其环形缓冲区，此处只需结束当前句子
+        tracker: 会话的预判状态，用于确认/更正/撤回已推送的预判答案
+        deadline: 该语音段的截止时间，默认从现在开始计算；过期后放弃处理
+    """
+    if not vosk_model:
+        logger.error("✗ Vosk模型未加载，无法进行识别")
+        await websocket.send_text(json.dumps({
+            'type': 'error', 
+            'message': 'Vosk语音识别模型未加载'
+        }))
+        return
+
+    deadline = deadline or admission.new_deadline()
+    try:
+        await process_segment(websocket, audio_data, sample_rate, recognizer, tracker, deadline)
+    except (Overloaded, DeadlineExceeded) as e:
+        record_dropped_segment(f"{type(e).__name__}:{e}", deadline, audio_data, sample_rate)
+        await drop_segment(websocket, e, recognizer)
     except Exception as e:
-        print(f"✗ 离线识别处理时出错: {e}")
+        record_dropped_segment('error', deadline, audio_data, sample_rate)
+        logger.exception("✗ 离线识别处理时出错: %s", e)
         await websocket.send_text(json.dumps({
             'type': 'error', 'message': f'处理音频时出错: {e}'
         }))
 
+async def process_segment(websocket: WebSocket, audio_data: Optional[bytes], sample_rate: int,
+                          recognizer: Optional[StreamingRecognizer],
+                          tracker: Optional[SpeculativeAnswerTracker], deadline: Deadline):
+    """recognize_and_match 的实际流程：识别 -> 清洗 -> 匹配 -> 推送，每个阶段都检查截止时间"""
+    total_timer = Timer()
+    stages = {}
+    match_result = None
+
+    stage_timer = Timer()
+    if recognizer is not None:
+        result = await admission.run(STAGE_ASR, recognizer.finalize, deadline=deadline)
+    else:
+        result = await admission.run(STAGE_ASR, run_recognition, audio_data, sample_rate,
+                                     deadline=deadline)
+    text = result.get('text', '').replace(' ', '') # 获取文本并移除空格
+    stages['asr'] = stage_timer.ms()
+    log_event(logger, logging.INFO, "recognized", "✓ 离线识别结果",
+              stage="asr", latency_ms=stages['asr'], text=text)
+    
+    if text:
+        # 发送识别结果给面试官
+        await websocket.send_text(json.dumps({
+            'type': 'recognition_result',
+            'text': text
+        }))
+
+        # 匹配答案 (这部分逻辑不变)
+        active_matcher = current_matcher()
+        if active_matcher and processor :
+            
+            #提炼关键词
+            stage_timer = Timer()
+            cleaned_text = processor.clean_and_rebuild(text)
+            alternatives = cleaned_hypotheses(result) if cleaned_text else []
+            stages['clean'] = stage_timer.ms()
+            if cleaned_text:
+
+                #异步运行语义匹配
+                stage_timer = Timer()
+                match_result = await match_with_admission(active_matcher, cleaned_text, deadline, text,
+                                                          alternatives)
+                match_ms = stages['match'] = stage_timer.ms()
+
+                if match_result:
+                    question = match_result['question']
+                    similarity = match_result['similarity']
+                    
+                    log_event(logger, logging.INFO, "matched", "✓ 找到匹配答案",
+                              stage="match", latency_ms=match_ms,
+                              cleaned=match_result.get('hypothesis', cleaned_text),
+                              question=question, similarity=round(similarity, 3),
+                              hypotheses=len(alternatives) or 1)
+                    
+                    await websocket.send_text(json.dumps({
+                        'type': 'match_result', 'question': question, 'similarity': similarity,
+                        'degraded': match_result.get('degraded', False),
+                        'hypothesis': match_result.get('hypothesis')
+                    }))
+                else:
+                    log_event(logger, logging.INFO, "no_match", "✗ 未找到匹配的答案",
+                              stage="match", latency_ms=match_ms, cleaned=cleaned_text,
+                              hypotheses=len(alternatives) or 1)
+
+                stage_timer = Timer()
+                await deliver_answer(match_result, text, tracker)
+                stages['deliver'] = stage_timer.ms()
+        else:
+            logger.warning("✗ 问题匹配器未初始化")
+
+    else:
+        logger.info("✗ 离线识别未能解析出文本")
+        await websocket.send_text(json.dumps({
+            'type': 'error', 'message': '无法理解音频内容'
+        }))
+
+    stages['total'] = total_timer.ms()
+    log_event(logger, logging.INFO, "segment_done", stage="total", latency_ms=stages['total'])
+    if segment_log is not None:
+        record_segment(result, text, stages, match_result)
+
+def record_segment(result: dict, text: str, stages: dict, match_result: Optional[dict]) -> None:
+    """
+    记录一个语音段的识别质量和各阶段延迟 (放入 segment_log 的队列，不阻塞)
+
+    decode_lag_ms 为句末 (客户端结束标记或VAD断句) 到拿到最终识别结果的时间，含排队等待；
+    rtf 为识别计算耗时 / 音频时长。
+    """
+    audio_ms = result.get('audio_ms') or 0
+    decode_ms = result.get('decode_ms')
+    segment_log.record(
+        session=session_id_var.get(), kb=session_kb_var.get(), text=text,
+        audio_ms=audio_ms, decode_ms=decode_ms, decode_lag_ms=stages.get('asr'),
+        rtf=round(decode_ms / audio_ms, 4) if audio_ms and decode_ms is not None else None,
+        stages=stages, hypotheses=len(result.get('alternatives') or []) or 1,
+        matched=match_result['index'] if match_result else None,
+        similarity=round(match_result['similarity'], 4) if match_result else None,
+        degraded=bool(match_result and match_result.get('degraded')),
+        **word_summary(extract_words(result)))
+
+def record_dropped_segment(reason: str, deadline: Deadline, audio_data: Optional[bytes],
+                           sample_rate: int) -> None:
+    """
+    记录没能给出结果的语音段 (过载、超时、出错)，total 为到达至放弃的时间
+
+    这些语音段在 analytics.py 中计为未满足SLO，否则SLO只统计了顺利完成的语音段。
+    """
+    if segment_log is None:
+        return
+    audio_ms = round(len(audio_data) * 1000 / (sample_rate * 2)) if audio_data else None
+    segment_log.record(session=session_id_var.get(), kb=session_kb_var.get(), text='', audio_ms=audio_ms,
+                       stages={'total': deadline.elapsed_ms()}, dropped=reason, matched=None)
+
 @app.get("/status")
 async def get_status():
     """获取服务状态"""
@@ -743,10 +1266,71 @@ async def get_status():
         'status': 'running',
         'vosk_model_loaded': vosk_model is not None,
         'matcher_loaded': matcher is not None,
-        'interviewee_connected': interviewee_ws is not None,
-        'knowledge_base_stats': matcher.get_stats() if matcher else None
+        'interviewee_connected': bus.local_subscribers() > 0 if bus else False,
+        'bus': bus.get_stats() if bus else None,
+        'admission': admission.snapshot() if admission else None,
+        'knowledge_base_stats': matcher.get_stats() if matcher else None,
+        'knowledge_bases': registry.get_stats() if registry else None
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """各阶段排队、拒绝、超时丢弃、延迟分位数及降级状态"""
+    return {
+        'admission': admission.snapshot() if admission else None,
+        'bus': bus.get_stats() if bus else None,
+        'segment_log': segment_log.stats if segment_log else None,
+        'session_recorder': dict(session_recorder.stats) if session_recorder else None,
+    }
+
+@app.get("/kb")
+async def list_knowledge_bases():
+    """列出已加载的知识库及内存占用"""
+    if not registry:
+        return {'knowledge_bases': {}, 'memory': None}
+    stats = registry.get_stats()
+    stats['memory'] = registry.memory_usage()
+    return stats
+
+@app.post("/kb/{name}")
+async def load_knowledge_base(name: str, payload: dict):
+    """运行时加载或重新加载知识库，请求体: {"path": "知识库文件路径"}"""
+    global matcher
+    path = payload.get('path')
+    if not registry:
+        raise HTTPException(status_code=503, detail='知识库注册表未初始化')
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=400, detail=f'知识库文件不存在: {path}')
+    try:
+        loaded = await asyncio.to_thread(registry.load, name, path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'加载失败: {e}')
+    if name == registry.default_name:
+        matcher = loaded
+    return {'name': name, 'total_questions': len(loaded.questions), 'memory': loaded.memory_usage()}
+
+@app.delete("/kb/{name}")
+async def unload_knowledge_base(name: str):
+    """运行时卸载知识库 (默认知识库不能卸载)"""
+    if not registry:
+        raise HTTPException(status_code=503, detail='知识库注册表未初始化')
+    if name == registry.default_name:
+        raise HTTPException(status_code=400, detail='默认知识库不能卸载')
+    if not registry.unload(name):
+        raise HTTPException(status_code=404, detail=f'知识库不存在: {name}')
+    return {'name': name, 'unloaded': True}
+
+def preload_models() -> None:
+    """在当前进程中加载所有只读模型和知识库 (供 serve.py 在fork之前调用)"""
+    global processor
+    processor = create_processor()
+    init_vosk_model()
+    init_matcher()
+    # 预热用过的SQLite连接不能跨fork使用：写盘后关闭，各worker首次访问时按pid重新打开
+    if registry is not None and registry.embedding_cache is not None:
+        registry.embedding_cache.close()
+
 if __name__ == "__main__":
     print("启动面试辅助工具后端服务...")
+    # 多核部署请使用: python serve.py --workers N
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
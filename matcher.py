@@ -1,39 +1,115 @@
 # semantic_matcher.py
-import pandas as pd
-from sentence_transformers import SentenceTransformer, util
-import torch
+from sentence_transformers import SentenceTransformer
 import numpy as np
 import os
-import pickle
-from typing import Dict, Optional, List
+import sys
+import shutil
+import logging
+import threading
+import itertools
+import json
+import hashlib
+from typing import Dict, Optional, List, Tuple
 from functools import lru_cache
 
+from app_logger import get_logger, log_event
+from kb_store import (ensure_compiled, read_compiled, read_compiled_meta, iter_compiled_column,
+                      compiled_columns, variant_columns, REQUIRED_COLUMNS, FOLLOW_UP_COLUMN)
+from answer_store import (AnswerStore, build_answer_store, read_store_fingerprint,
+                          versioned_store_path, remove_stale_stores)
+from vector_store import VectorStore, texts_fingerprint, store_versions
+from session_context import SessionContext
+from clustering import ClusterIndex
+from dedup import ensure_deduplicated
+from index_builder import IndexBuilder
+from encoder import Encoder
+import paraphrase
+
+logger = get_logger("matcher")
+
+# 阈值校准结果 (calibrate.py 生成) 在向量索引目录中的名称
+CALIBRATION_NAME = 'calibration'
+
+
+class _NotCached(Exception):
+    """携带不应进入匹配缓存的结果 (重排超时退回向量相似度时)"""
+
+    def __init__(self, result):
+        super().__init__()
+        self.result = result
+
 class SemanticQuestionMatcher:
     def __init__(self, knowledge_base_path: str, model_name: str ='shibing624/text2vec-base-chinese', 
-                 cache_dir: str = './cache'):
+                 cache_dir: str = './cache', lazy_answers: bool = True, answer_cache_size: int = 256,
+                 model: Optional[SentenceTransformer] = None, reranker=None,
+                 rerank_threshold: float = 0.5, rerank_margin: float = 0.1,
+                 generate_paraphrases: bool = False, cluster_min_rows: int = 20000, n_probe: int = 8,
+                 dedup_threshold: Optional[float] = None, build_workers: int = 1,
+                 build_chunk_rows: int = 8192, encoder_max_tokens: int = 8192,
+                 encoder_threads: Optional[int] = None, embedding_cache=None, normalizer=None):
         """
         初始化语义问题匹配器
         
         Args:
-            knowledge_base_path: 知识库Excel文件路径
+            knowledge_base_path: 知识库文件路径 (xlsx/csv/jsonl 或编译后的 .kbc)
             model_name: 预训练模型名称，支持中文的推荐模型：
                        - 'paraphrase-multilingual-MiniLM-L12-v2' (多语言，轻量级)
                        - 'shibing624/text2vec-base-chinese' (中文专用)
                        - 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2' (性能更好但更大)
             cache_dir: 缓存目录，用于存储预计算的向量
+            lazy_answers: 答案是否存放在磁盘上按需读取 (内存中只保留问题和向量)
+            answer_cache_size: 按需读取时热点答案LRU的容量
+            model: 已加载的共享语义模型；多个知识库共用同一个模型时传入，避免重复加载
+            reranker: 可选的 CrossEncoderReranker，对向量检索的前几个候选精排
+            rerank_threshold: 重排分数 (0~1) 达到该值才接受匹配
+            rerank_margin: 向量相似度比阈值低多少以内的候选也参与重排
+            generate_paraphrases: 构建索引时是否用规则为每个问题自动生成几种常见说法
+            cluster_min_rows: 说法数达到该值时启用聚类两级检索 (0 表示不启用)
+            n_probe: 两级检索时检索的聚类数
+            dedup_threshold: 设置时加载前合并相似度不低于该值的重复问题 (结果缓存在编译目录中)
+            build_workers: 构建向量索引的编码进程数 (1 表示在当前进程内用已加载的模型编码)
+            build_chunk_rows: 构建索引时每个分片的行数，中断后按分片继续
+            encoder_max_tokens: 批量编码时每批的token预算 (按长度分桶组批)
+            encoder_threads: 设置时调整PyTorch的线程数
+            embedding_cache: 可选的 EmbeddingCache，按清洗后的文本缓存查询向量 (可在多个知识库间共享)
+            normalizer: 可选的 TextNormalizer；设置时知识库说法先经过与识别文本相同的清洗再编码，
+                        原文仍用于展示和重排
         """
         self.cache_dir = cache_dir
+        self.lazy_answers = lazy_answers
+        self.answer_cache_size = answer_cache_size
         self.model_name = model_name
         self.knowledge_base_path = knowledge_base_path
+        self.reranker = reranker
+        self.rerank_threshold = rerank_threshold
+        self.rerank_margin = rerank_margin
+        self.generate_paraphrases = generate_paraphrases
+        self.cluster_min_rows = cluster_min_rows
+        self.n_probe = n_probe
+        self.dedup_threshold = dedup_threshold
+        self.build_workers = build_workers
+        self.build_chunk_rows = build_chunk_rows
+        self.embedding_cache = embedding_cache
+        self.normalizer = normalizer
         
         # 创建缓存目录
         os.makedirs(cache_dir, exist_ok=True)
+
+        # 每个实例独立的匹配结果缓存，实例卸载后随之释放
+        self._match_cache = lru_cache(maxsize=128)(self._match_cacheable)
+        # 降级模式使用的字面匹配索引，首次使用时构建
+        self._lexical = None
+        self._lexical_lock = threading.Lock()
         
         try:
             # 1. 加载预训练的语义模型
-            print(f"正在加载语义模型 '{model_name}'...")
-            self.model = SentenceTransformer(model_name)
-            print(f"语义模型加载成功！嵌入维度: {self.model.get_sentence_embedding_dimension()}")
+            if model is not None:
+                self.model = model
+            else:
+                print(f"正在加载语义模型 '{model_name}'...")
+                self.model = SentenceTransformer(model_name)
+                print(f"语义模型加载成功！嵌入维度: {self.model.get_sentence_embedding_dimension()}")
+            self.encoder = Encoder(self.model, max_tokens=encoder_max_tokens, threads=encoder_threads)
 
             # 2. 加载知识库
             self._load_knowledge_base()
@@ -49,81 +125,274 @@ class SemanticQuestionMatcher:
             raise
 
     def _load_knowledge_base(self):
-        """加载知识库Excel文件"""
-        df = pd.read_excel(self.knowledge_base_path)
-        
-        # 检查必要的列
-        if 'question' not in df.columns or 'answer' not in df.columns:
-            raise ValueError("Excel文件必须包含 'question' 和 'answer' 两列")
-        
-        # 清理数据
-        df = df.dropna(subset=['question', 'answer'])
+        """
+        加载知识库 (xlsx/csv/jsonl 或已编译的 .kbc)
+
+        源文件只在首次或内容变化时解析一次，之后直接读取缓存目录中的编译产物。
+        """
+        compiled_path = ensure_compiled(self.knowledge_base_path, self.cache_dir)
+        if self.dedup_threshold:
+            compiled_path = ensure_deduplicated(compiled_path, self.dedup_threshold, self.model_name, self._encode)
+        columns = ('question',) if self.lazy_answers else REQUIRED_COLUMNS
+        extra_columns = variant_columns(compiled_columns(compiled_path))
+        table = read_compiled(compiled_path, columns + (FOLLOW_UP_COLUMN,) + tuple(extra_columns))
         
-        self.questions = df['question'].astype(str).tolist()
-        self.answers = df['answer'].astype(str).tolist()
+        self.questions = table['question']
+        self.follow_ups = self._build_follow_up_graph(table.get(FOLLOW_UP_COLUMN))
+        self._build_variants([table[c] for c in extra_columns])
+        # 重新加载时旧的答案存储可能还在被进行中的匹配读取，不主动关闭，由垃圾回收释放
+        self.answers = self._open_answer_store(compiled_path) if self.lazy_answers else table['answer']
         
         if len(self.questions) == 0:
             raise ValueError("知识库中没有有效的问题")
         
         print(f"知识库加载完成！共加载 {len(self.questions)} 个问题")
 
+    def _build_variants(self, variant_columns: List[List[str]]) -> None:
+        """
+        展开每个条目的所有说法：原问题在前，其后是变体列中的说法和自动改写
+
+        结果为 self.variant_texts (按条目连续存放) 和 self.entry_offsets (每个条目第一个说法的位置)。
+        """
+        texts = []
+        offsets = np.empty(len(self.questions), dtype=np.int64)
+        for i, question in enumerate(self.questions):
+            offsets[i] = len(texts)
+            seen = {question}
+            texts.append(question)
+            extra = []
+            for column in variant_columns:
+                extra.extend(v.strip() for v in column[i].split('|'))
+            if self.generate_paraphrases:
+                extra.extend(paraphrase.generate(question))
+            for variant in extra:
+                if variant and variant not in seen:
+                    seen.add(variant)
+                    texts.append(variant)
+        self.variant_texts = texts
+        self.entry_offsets = offsets
+        if len(texts) > len(self.questions):
+            print(f"共 {len(texts)} 个问题说法 (平均每题 {len(texts) / max(len(self.questions), 1):.1f} 个)")
+        self.index_texts = self._normalize_variants() if self.normalizer is not None else texts
+
+    def _normalized_cache_path(self) -> str:
+        kb_name = os.path.splitext(os.path.basename(self.knowledge_base_path))[0]
+        return os.path.join(self.cache_dir, f"{kb_name}_normalized_{self.normalizer.signature[:12]}.json")
+
+    def _normalize_variants(self) -> List[str]:
+        """
+        用查询端的清洗流水线规范化所有说法，得到实际编码的文本
+
+        结果按说法原文的哈希缓存在 cache_dir 中 (文件名带清洗配置指纹)，知识库修改后只处理
+        新增或改动的说法。清洗后为空的说法 (如整句都是停用词) 保留原文。
+        """
+        path = self._normalized_cache_path()
+        try:
+            with open(path, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+
+        keys = [hashlib.sha1(t.encode('utf-8')).hexdigest()[:16] for t in self.variant_texts]
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            print(f"正在清洗 {len(missing)} 个问题说法...")
+            normalized = self.normalizer.normalize_batch(self.variant_texts[i] for i in missing)
+            fresh = dict(zip((keys[i] for i in missing), normalized))
+        else:
+            fresh = {}
+        current = {key: fresh[key] if key in fresh else cached[key] for key in keys}
+        if current.keys() != cached.keys():
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(current, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        return [current[key] or text for key, text in zip(keys, self.variant_texts)]
+
+    def _build_follow_up_graph(self, parents_column: Optional[List[str]]) -> Dict[int, np.ndarray]:
+        """根据 follow_up_of 列建立 上一问下标 -> 追问下标数组 的映射"""
+        if not parents_column:
+            return {}
+        index_of = {q: i for i, q in enumerate(self.questions)}
+        graph: Dict[int, List[int]] = {}
+        for child, parents in enumerate(parents_column):
+            for parent in parents.split('|'):
+                parent_index = index_of.get(parent.strip())
+                if parent_index is not None and parent_index != child:
+                    graph.setdefault(parent_index, []).append(child)
+        return {parent: np.asarray(children, dtype=np.int64) for parent, children in graph.items()}
+
+    def _open_answer_store(self, compiled_path: str) -> AnswerStore:
+        """打开答案文件，知识库内容变化时写入以新指纹命名的文件，并尽力清理旧版本"""
+        fingerprint = read_compiled_meta(compiled_path)['source_sha1']
+        stem = os.path.splitext(compiled_path)[0]
+        store_path = versioned_store_path(stem, fingerprint)
+        if read_store_fingerprint(store_path) != fingerprint:
+            build_answer_store(iter_compiled_column(compiled_path, 'answer'), store_path, fingerprint)
+        store = AnswerStore(store_path, cache_size=self.answer_cache_size)
+        remove_stale_stores(stem, keep=store_path)
+        return store
+
     def _get_cache_path(self):
-        """获取缓存文件路径"""
-        # 基于知识库文件和模型名称生成缓存文件名
+        """获取向量索引名，实际目录为 <索引名>.<内容指纹前12位>"""
+        # 基于知识库文件和模型名称生成目录名
         kb_name = os.path.splitext(os.path.basename(self.knowledge_base_path))[0]
         model_safe_name = self.model_name.replace('/', '_').replace('-', '_')
-        return os.path.join(self.cache_dir, f"{kb_name}_{model_safe_name}_embeddings.pkl")
+        return os.path.join(self.cache_dir, f"{kb_name}_{model_safe_name}_vectors")
+
+    def _encode(self, texts) -> np.ndarray:
+        """
+        编码为L2归一化的float32向量，点积即余弦相似度
+
+        单条查询先查向量缓存；多条文本 (构建索引、批量匹配) 按长度分桶组批，不进入缓存。
+        """
+        if isinstance(texts, str) and self.embedding_cache is not None:
+            return self.embedding_cache.get_or_encode(texts, self.encoder.encode)
+        return self.encoder.encode(texts)
 
     def _load_or_compute_embeddings(self):
-        """加载缓存的向量或重新计算"""
-        cache_path = self._get_cache_path()
-        
+        """
+        加载缓存的向量或重新计算
+
+        向量保存为 .npy 并以只读 mmap 打开，多个 worker 进程共享同一份物理内存。
+        需要重新计算时分块编码并写入分片，中断后再次加载会从已完成的分片继续。
+        """
+        store_dir = self._get_cache_path()
+        # 说法相同但分组不同也要重建，分组边界一并计入指纹
+        fingerprint = texts_fingerprint(
+            itertools.chain(self.index_texts, map(str, self.entry_offsets.tolist())), self.model_name)
+
         # 尝试加载缓存
-        if os.path.exists(cache_path):
-            try:
-                print("正在加载缓存的问题向量...")
-                with open(cache_path, 'rb') as f:
-                    cache_data = pickle.load(f)
-                
-                # 验证缓存数据的有效性
-                if (cache_data.get('questions') == self.questions and 
-                    cache_data.get('model_name') == self.model_name):
-                    self.question_embeddings = cache_data['embeddings']
-                    print("缓存向量加载成功！")
-                    return
-                else:
-                    print("缓存数据已过期，重新计算向量...")
-            except Exception as e:
-                print(f"加载缓存失败: {e}，重新计算向量...")
-        
-        # 重新计算向量
-        print("正在将知识库问题编码为语义向量...")
-        self.question_embeddings = self.model.encode(
-            self.questions, 
-            convert_to_tensor=True, 
-            show_progress_bar=True,
-            batch_size=32  # 批处理以提高效率
-        )
-        
-        # 保存到缓存
-        try:
-            cache_data = {
-                'questions': self.questions,
-                'model_name': self.model_name,
-                'embeddings': self.question_embeddings
-            }
-            with open(cache_path, 'wb') as f:
-                pickle.dump(cache_data, f)
-            print(f"向量已缓存到: {cache_path}")
-        except Exception as e:
-            print(f"保存缓存失败: {e}")
-        
-        print(f"向量计算完成！维度: {self.question_embeddings.shape}")
+        store = VectorStore.open(store_dir, fingerprint)
+        if store is not None:
+            print("缓存向量加载成功！")
+        else:
+            if store_versions(store_dir):
+                print("缓存数据已过期，重新计算向量...")
+            print("正在将知识库问题编码为语义向量...")
+            builder = IndexBuilder(store_dir, self.index_texts, fingerprint, self.model_name,
+                                   entry_offsets=self.entry_offsets, workers=self.build_workers,
+                                   chunk_rows=self.build_chunk_rows, encode=self._encode)
+            store = builder.build()
+            print(f"向量已缓存到: {store.directory}")
+
+        self.vector_store = store
+        self.question_embeddings = store.vectors
+        print(f"向量就绪！维度: {self.question_embeddings.shape}")
+        self._load_calibration()
+        self._load_clusters()
+
+    def _load_calibration(self):
+        """
+        加载逐题阈值校准：每个问题的分数偏移 = 参考阈值 - 该题校准阈值
+
+        加上偏移后，每道题只需与同一个全局阈值比较，排序也按"超出自身阈值多少"进行。
+        """
+        arrays = self.vector_store.load_arrays(CALIBRATION_NAME)
+        self.score_offsets = None
+        if arrays is not None and len(arrays.get('offsets', ())) == len(self.questions):
+            self.score_offsets = arrays['offsets'].astype(np.float32)
+            print(f"已加载阈值校准 (调整了 {int(np.count_nonzero(self.score_offsets))} 个问题的阈值)")
+
+    def _load_clusters(self):
+        """大型知识库加载 (首次时训练) 聚类，单条查询改为两级检索"""
+        self.clusters = None
+        if self.cluster_min_rows and len(self.vector_store) >= self.cluster_min_rows:
+            clusters = ClusterIndex.load(self.vector_store)
+            if clusters is None:
+                print("正在训练问题聚类...")
+                clusters = ClusterIndex.build(self.vector_store)
+            self.clusters = clusters
+            print(f"已启用聚类两级检索: {len(clusters)} 个聚类，每次检索 {self.n_probe} 个")
+
+    def get_clusters(self, k: Optional[int] = None) -> ClusterIndex:
+        """
+        获取问题聚类 (供浏览和重复问题报告)，没有时训练并保存
+
+        Args:
+            k: 聚类数，默认 sqrt(说法数)；与已保存的不同时重新训练
+        """
+        if self.clusters is not None and (k is None or len(self.clusters) == k):
+            return self.clusters
+        return ClusterIndex.load_or_build(self.vector_store, k)
+
+    def _entry_scores(self, queries: np.ndarray) -> np.ndarray:
+        """查询向量与每个条目的相似度 (已应用阈值校准)"""
+        if self.clusters is not None and queries.ndim == 1:
+            scores = self.clusters.search_entries(queries, self.n_probe)
+        elif self.clusters is not None:
+            # 多条查询 (ASR的多个候选、批量匹配) 逐条走两级检索，结果与单条匹配一致
+            scores = np.stack([self.clusters.search_entries(q, self.n_probe) for q in queries])
+        else:
+            scores = self.vector_store.search_entries(queries)
+        if self.score_offsets is not None:
+            scores = scores + self.score_offsets
+        return scores
+
+    def raw_scores(self, texts: List[str]) -> np.ndarray:
+        """未经校准的 (文本数 x 条目数) 相似度矩阵，供离线校准使用"""
+        return self.vector_store.search_entries(self._encode(texts))
+
+    def _select_best(self, text: str, similarities: np.ndarray,
+                     threshold: float) -> Tuple[Optional[Tuple[int, float, Optional[float]]], bool]:
+        """
+        从相似度中选出最佳问题
+
+        配置了重排器时，把向量相似度不低于 (阈值 - rerank_margin) 的前几个候选交给交叉编码器
+        精排，以重排分数决定是否接受；重排超时则退回向量相似度。
+
+        Returns:
+            ((问题下标, 向量相似度, 重排分数或None) 或 None, 是否因重排超时退回了向量相似度)
+        """
+        if self.reranker is not None:
+            candidates = self._rerank_candidates(similarities, threshold)
+            if len(candidates) > 0:
+                rerank_scores = self.reranker.rerank(text, [self.questions[i] for i in candidates])
+                if rerank_scores is not None:
+                    return self._pick_reranked(text, similarities, candidates, rerank_scores), False
+                return self._select_by_similarity(similarities, threshold), True
+        return self._select_by_similarity(similarities, threshold), False
+
+    def _rerank_candidates(self, similarities: np.ndarray, threshold: float) -> np.ndarray:
+        """参与重排的候选：向量相似度前 top_k 个中高于 (阈值 - rerank_margin) 的"""
+        candidates = self.vector_store.top_k(similarities, self.reranker.top_k)
+        return candidates[similarities[candidates] > threshold - self.rerank_margin]
+
+    def _pick_reranked(self, text: str, similarities: np.ndarray, candidates: np.ndarray,
+                       rerank_scores: np.ndarray) -> Optional[Tuple[int, float, Optional[float]]]:
+        """按重排分数选出最佳候选，分数未达到 rerank_threshold 时返回None"""
+        best = int(np.argmax(rerank_scores))
+        best_index = int(candidates[best])
+        log_event(logger, logging.DEBUG, "rerank", stage="rerank", text=text,
+                  question=self.questions[best_index],
+                  rerank_score=round(float(rerank_scores[best]), 3), candidates=len(candidates))
+        if rerank_scores[best] >= self.rerank_threshold:
+            return best_index, float(similarities[best_index]), float(rerank_scores[best])
+        return None
+
+    def _select_by_similarity(self, similarities: np.ndarray,
+                              threshold: float) -> Optional[Tuple[int, float, Optional[float]]]:
+        best_index = int(np.argmax(similarities))
+        max_similarity = float(similarities[best_index])
+        if max_similarity > threshold:
+            return best_index, max_similarity, None
+        return None
+
+    def _result(self, index: int, similarity: float, rerank_score: Optional[float] = None) -> Dict:
+        """匹配结果字典"""
+        result = {
+            'answer': self.answers[index],
+            'question': self.questions[index],
+            'similarity': float(similarity),
+            'index': int(index)
+        }
+        if rerank_score is not None:
+            result['rerank_score'] = rerank_score
+        return result
 
-    @lru_cache(maxsize=128) # 缓存最近128个不同的调用结果
     def match(self, text: str, threshold: float = 0.6, top_k: int = 1) -> Optional[Dict]:
         """
-        匹配最相似的问题（基于语义）
+        匹配最相似的问题（基于语义），缓存最近128个不同的调用结果；重排超时退回向量结果时不缓存
         
         Args:
             text: 输入文本
@@ -133,43 +402,52 @@ class SemanticQuestionMatcher:
         Returns:
             匹配结果字典或None
         """
+        try:
+            return self._match_cache(text, threshold, top_k)
+        except _NotCached as e:
+            return e.result
+
+    def _match_cacheable(self, text: str, threshold: float, top_k: int) -> Optional[Dict]:
+        """供 lru_cache 包装：重排超时退回的结果以异常返回，lru_cache 不缓存异常，下次重新匹配"""
+        result, fallback = self._match_uncached(text, threshold, top_k)
+        if fallback:
+            raise _NotCached(result)
+        return result
+
+    def _match_uncached(self, text: str, threshold: float = 0.6,
+                        top_k: int = 1) -> Tuple[Optional[Dict], bool]:
+        """match 的实际实现，返回 (结果, 是否因重排超时退回了向量相似度)"""
         if not text or not text.strip():
-            return None
+            return None, False
             
         try:
             # 1. 将输入文本编码为向量
-            text_embedding = self.model.encode(text.strip(), convert_to_tensor=True)
+            text_embedding = self._encode(text.strip())
             
             # 2. 计算余弦相似度
-            similarities = util.cos_sim(text_embedding, self.question_embeddings)[0]
+            similarities = self._entry_scores(text_embedding)
             
             # 3. 获取最相似的结果
             if top_k == 1:
-                best_match_index = torch.argmax(similarities)
-                max_similarity = similarities[best_match_index].item()
+                best_match_index = int(np.argmax(similarities))
+                max_similarity = float(similarities[best_match_index])
                 
-                matched_question = self.questions[best_match_index]
-                
-                print(f"识别文本: '{text}'")
-                print(f"最匹配问题: '{matched_question}'")
-                print(f"语义相似度: {max_similarity:.3f}")
+                log_event(logger, logging.DEBUG, "match_candidate", stage="match", text=text,
+                          question=self.questions[best_match_index], similarity=round(max_similarity, 3))
 
-                if max_similarity > threshold:
-                    return {
-                        'answer': self.answers[best_match_index],
-                        'question': matched_question,
-                        'similarity': float(max_similarity),
-                        'index': int(best_match_index)
-                    }
+                selected, fallback = self._select_best(text.strip(), similarities, threshold)
+                if selected:
+                    return self._result(*selected), fallback
                 else:
-                    print(f"相似度 {max_similarity:.3f} 低于阈值 {threshold}，未找到匹配")
+                    logger.debug("相似度 %.3f 低于阈值 %s，未找到匹配", max_similarity, threshold)
+                    return None, fallback
             else:
                 # 返回top_k个结果
-                top_indices = torch.topk(similarities, min(top_k, len(similarities)))[1]
+                top_indices = self.vector_store.top_k(similarities, top_k)
                 results = []
                 
                 for idx in top_indices:
-                    similarity = similarities[idx].item()
+                    similarity = float(similarities[idx])
                     if similarity > threshold:
                         results.append({
                             'answer': self.answers[idx],
@@ -179,16 +457,174 @@ class SemanticQuestionMatcher:
                         })
                 
                 if results:
-                    print(f"识别文本: '{text}'")
-                    print(f"找到 {len(results)} 个匹配结果")
-                    return {'results': results}
+                    logger.debug("识别文本: '%s'，找到 %d 个匹配结果", text, len(results))
+                    return {'results': results}, False
                 else:
-                    print(f"没有找到相似度高于 {threshold} 的匹配")
+                    logger.debug("没有找到相似度高于 %s 的匹配", threshold)
         
         except Exception as e:
-            print(f"匹配时出错: {e}")
+            logger.error("匹配时出错: %s", e)
         
-        return None
+        return None, False
+
+    def match_in_context(self, text: str, context: SessionContext, threshold: float = 0.6,
+                         raw_text: Optional[str] = None, follow_up_boost: float = 0.08) -> Optional[Dict]:
+        """
+        结合会话上下文匹配 (不走结果缓存，因为结果依赖上文)
+
+        追问 (如"那你具体说说") 时把最近几轮的查询向量加权并入当前查询，并给知识库中
+        标注为上一命中问题追问的条目加分；每轮的查询向量记入上下文供后续复用。
+        只有以追问连接词开头、且单独匹配达不到阈值 (本身没有明确主题) 的句子才按追问处理，
+        "所以你是哪年毕业的"这类能单独匹配的问题不与上文混合。
+
+        Args:
+            text: 清洗后的输入文本
+            context: 会话上下文
+            threshold: 相似度阈值
+            raw_text: 清洗前的原始文本，用于判断是否为追问 (清洗会去掉"那"等词)
+            follow_up_boost: 追问图中子问题的加分
+        """
+        if not text or not text.strip():
+            return None
+        context.bind(self)
+
+        try:
+            text_embedding = self._encode(text.strip())
+            similarities = self._entry_scores(text_embedding)
+            follow_up = context.is_follow_up(raw_text or text) and float(similarities.max()) <= threshold
+            if follow_up:
+                similarities = self._entry_scores(context.contextualize(text_embedding))
+
+            last_matched = context.last_matched
+            if follow_up and last_matched is not None:
+                children = self.follow_ups.get(last_matched)
+                if children is not None:
+                    similarities[children] = np.minimum(similarities[children] + follow_up_boost, 1.0)
+
+            best_match_index = int(np.argmax(similarities))
+            max_similarity = float(similarities[best_match_index])
+            log_event(logger, logging.DEBUG, "match_candidate", stage="match", text=text,
+                      question=self.questions[best_match_index], similarity=round(max_similarity, 3),
+                      follow_up=follow_up, context_turns=len(context))
+
+            result = None
+            selected, _ = self._select_best(text.strip(), similarities, threshold)
+            if selected:
+                result = self._result(*selected)
+                result['follow_up'] = follow_up
+            if follow_up:
+                context.stats['follow_ups'] += 1
+            context.add(text, text_embedding, result['index'] if result else None)
+            return result
+
+        except Exception as e:
+            logger.error("上下文匹配时出错: %s", e)
+            return None
+
+    def match_hypotheses(self, hypotheses: List[Tuple[str, float]], threshold: float = 0.6,
+                         asr_weight: float = 0.1, context: Optional[SessionContext] = None,
+                         raw_text: Optional[str] = None,
+                         follow_up_boost: float = 0.08) -> Optional[Dict]:
+        """
+        用ASR的多个候选识别文本匹配，所有候选一次批量编码
+
+        每个候选的最佳问题按 相似度 - asr_weight x (1 - 候选置信度) 排序，依次按阈值 (或重排分数)
+        判断，第一个被接受的即为结果；阈值仍只作用于相似度本身。配置了重排器时，所有候选文本的
+        候选问题合成一批只调用一次交叉编码器。
+
+        Args:
+            hypotheses: [(清洗后的候选文本, 置信度)]，最佳候选在前 (见 asr_nbest.hypotheses)
+            threshold: 相似度阈值
+            asr_weight: 识别置信度在综合得分中的权重
+            context: 会话上下文；提供时与 match_in_context 一样处理追问并记录本轮
+            raw_text: 最佳候选清洗前的文本，用于判断是否为追问
+
+        Returns:
+            与 match 相同结构的结果，额外带 'hypothesis' (采用的候选) 和 'asr_confidence'
+        """
+        hypotheses = [(t.strip(), c) for t, c in hypotheses if t and t.strip()]
+        if not hypotheses:
+            return None
+        texts = [t for t, _ in hypotheses]
+        if context is not None:
+            context.bind(self)
+
+        try:
+            embeddings = self._encode(texts)
+            similarities = self._entry_scores(embeddings)
+            # 与 match_in_context 相同：所有候选单独都达不到阈值时才按追问并入上文
+            follow_up = (context is not None and context.is_follow_up(raw_text or texts[0])
+                         and float(similarities.max()) <= threshold)
+            if follow_up:
+                similarities = self._entry_scores(np.stack([context.contextualize(e) for e in embeddings]))
+
+            if follow_up and context.last_matched is not None:
+                children = self.follow_ups.get(context.last_matched)
+                if children is not None:
+                    similarities[:, children] = np.minimum(similarities[:, children] + follow_up_boost, 1.0)
+
+            best_indices = np.argmax(similarities, axis=1)
+            best_similarities = similarities[np.arange(len(texts)), best_indices]
+            confidences = np.asarray([c for _, c in hypotheses], dtype=np.float32)
+            combined = best_similarities - asr_weight * (1.0 - confidences)
+            log_event(logger, logging.DEBUG, "match_hypotheses", stage="match", hypotheses=texts,
+                      similarities=[round(float(x), 3) for x in best_similarities],
+                      confidences=[round(float(x), 3) for x in confidences])
+
+            order = [int(h) for h in np.argsort(-combined, kind='stable')]
+            # 有重排器时，所有候选文本各自的候选问题合成一批，一次交给交叉编码器
+            reranked = self._rerank_hypotheses(texts, similarities, threshold) if self.reranker is not None else None
+
+            result = None
+            chosen = 0
+            for h in order:
+                if reranked is not None:
+                    candidates, rerank_scores = reranked[h]
+                    selected = (self._pick_reranked(texts[h], similarities[h], candidates, rerank_scores)
+                                if len(candidates) > 0 else None)
+                elif best_similarities[h] > threshold:
+                    selected = self._select_by_similarity(similarities[h], threshold)
+                else:
+                    continue
+                if selected:
+                    chosen = h
+                    result = self._result(*selected)
+                    result['hypothesis'] = texts[h]
+                    result['asr_confidence'] = hypotheses[h][1]
+                    break
+
+            if context is not None:
+                if result is not None:
+                    result['follow_up'] = follow_up
+                if follow_up:
+                    context.stats['follow_ups'] += 1
+                context.add(texts[chosen], embeddings[chosen], result['index'] if result else None)
+            return result
+
+        except Exception as e:
+            logger.error("多候选匹配时出错: %s", e)
+            return None
+
+    def _rerank_hypotheses(self, texts: List[str], similarities: np.ndarray,
+                           threshold: float) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        一次重排所有候选文本的候选问题
+
+        Returns:
+            每个候选文本的 (候选问题下标, 重排分数)；重排超时时返回None (调用方退回向量相似度)
+        """
+        candidates = [self._rerank_candidates(similarities[h], threshold) for h in range(len(texts))]
+        pairs = [(texts[h], self.questions[i]) for h in range(len(texts)) for i in candidates[h]]
+        scores = self.reranker.rerank_pairs(pairs)
+        if scores is None:
+            return None
+        result = []
+        offset = 0
+        for h in range(len(texts)):
+            n = len(candidates[h])
+            result.append((candidates[h], scores[offset:offset + n]))
+            offset += n
+        return result
 
     def batch_match(self, texts: List[str], threshold: float = 0.6) -> List[Optional[Dict]]:
         """
@@ -206,15 +642,16 @@ class SemanticQuestionMatcher:
         
         try:
             # 批量编码输入文本
-            text_embeddings = self.model.encode(texts, convert_to_tensor=True, show_progress_bar=True)
+            text_embeddings = self._encode(texts)
             
             # 计算所有文本与知识库的相似度
-            similarities = util.cos_sim(text_embeddings, self.question_embeddings)
+            similarities = self._entry_scores(text_embeddings)
+            best_indices = np.argmax(similarities, axis=1)
             
             results = []
             for i, text in enumerate(texts):
-                best_match_index = torch.argmax(similarities[i])
-                max_similarity = similarities[i][best_match_index].item()
+                best_match_index = int(best_indices[i])
+                max_similarity = float(similarities[i, best_match_index])
                 
                 if max_similarity > threshold:
                     results.append({
@@ -230,7 +667,7 @@ class SemanticQuestionMatcher:
             return results
             
         except Exception as e:
-            print(f"批量匹配时出错: {e}")
+            logger.error("批量匹配时出错: %s", e)
             return [None] * len(texts)
 
     def find_similar_questions(self, text: str, threshold: float = 0.5, max_results: int = 5) -> List[Dict]:
@@ -249,23 +686,23 @@ class SemanticQuestionMatcher:
             return []
             
         try:
-            text_embedding = self.model.encode(text.strip(), convert_to_tensor=True)
-            similarities = util.cos_sim(text_embedding, self.question_embeddings)[0]
+            text_embedding = self._encode(text.strip())
+            similarities = self._entry_scores(text_embedding)
             
             # 获取所有高于阈值的结果
-            valid_indices = torch.where(similarities > threshold)[0]
+            valid_indices = np.flatnonzero(similarities > threshold)
             
             if len(valid_indices) == 0:
                 return []
             
             # 按相似度排序
             valid_similarities = similarities[valid_indices]
-            sorted_indices = torch.argsort(valid_similarities, descending=True)
+            sorted_indices = np.argsort(-valid_similarities, kind='stable')
             
             results = []
             for i in range(min(max_results, len(sorted_indices))):
-                idx = valid_indices[sorted_indices[i]]
-                similarity = similarities[idx].item()
+                idx = int(valid_indices[sorted_indices[i]])
+                similarity = float(similarities[idx])
                 
                 results.append({
                     'question': self.questions[idx],
@@ -277,26 +714,60 @@ class SemanticQuestionMatcher:
             return results
             
         except Exception as e:
-            print(f"查找相似问题时出错: {e}")
+            logger.error("查找相似问题时出错: %s", e)
             return []
 
+    def lexical_match(self, text: str, threshold: float = 0.35) -> Optional[Dict]:
+        """
+        不经过语义模型的字面匹配 (字符n-gram TF-IDF)，供高负载时的降级模式使用
+
+        Returns:
+            与 match 相同结构的结果，额外带 'degraded': True；未达到阈值时返回None
+        """
+        if not text or not text.strip():
+            return None
+        with self._lexical_lock:
+            if self._lexical is None:
+                from lexical_index import LexicalIndex
+                # 查询是清洗后的文本，启用知识库清洗时也按清洗后的原问题建立索引
+                self._lexical = LexicalIndex([self.index_texts[i] for i in self.entry_offsets])
+        similarities = self._lexical.scores(text.strip())
+        best_match_index = int(np.argmax(similarities))
+        max_similarity = float(similarities[best_match_index])
+        if max_similarity <= threshold:
+            return None
+        return {
+            'answer': self.answers[best_match_index],
+            'question': self.questions[best_match_index],
+            'similarity': max_similarity,
+            'index': best_match_index,
+            'degraded': True
+        }
+
     def get_stats(self) -> Dict:
         """获取知识库统计信息"""
         return {
             'total_questions': len(self.questions),
+            'total_variants': len(self.variant_texts),
+            'normalized': self.normalizer is not None,
             'embedding_dimension': self.model.get_sentence_embedding_dimension(),
             'model_name': self.model_name,
             'cache_dir': self.cache_dir,
-            'device': str(self.model.device)
+            'device': str(self.model.device),
+            'answer_store': dict(self.answers.stats) if isinstance(self.answers, AnswerStore) else None,
+            'reranker': self.reranker.get_stats() if self.reranker is not None else None,
+            'encoder': self.encoder.get_stats(),
+            'embedding_cache': self.embedding_cache.get_stats() if self.embedding_cache is not None else None,
+            'clusters': len(self.clusters) if self.clusters is not None else None
         }
 
     def clear_cache(self):
         """清理缓存文件"""
-        cache_path = self._get_cache_path()
-        if os.path.exists(cache_path):
-            os.remove(cache_path)
+        cache_paths = store_versions(self._get_cache_path())
+        for cache_path in cache_paths:
+            shutil.rmtree(cache_path)
             print(f"缓存文件已删除: {cache_path}")
-        else:
+        if not cache_paths:
             print("没有找到缓存文件")
 
     def update_knowledge_base(self, knowledge_base_path: str):
@@ -304,8 +775,38 @@ class SemanticQuestionMatcher:
         self.knowledge_base_path = knowledge_base_path
         self._load_knowledge_base()
         self._load_or_compute_embeddings()
+        self._match_cache.cache_clear()
+        self._lexical = None
         print("知识库更新完成！")
 
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        估算该知识库自身占用的内存(字节)，不含共享的语义模型
+
+        向量通过mmap映射，多个进程共享同一份页缓存，这里按映射大小计算。
+        """
+        embedding_bytes = self.vector_store.nbytes
+        # variant_texts 包含原问题本身 (同一批字符串对象)
+        question_bytes = sum(sys.getsizeof(q) for q in self.variant_texts)
+        if self.index_texts is not self.variant_texts:
+            question_bytes += sum(sys.getsizeof(q) for q in self.index_texts)
+        if isinstance(self.answers, AnswerStore):
+            answer_bytes = self.answers.resident_bytes
+        else:
+            answer_bytes = sum(sys.getsizeof(a) for a in self.answers)
+        return {
+            'embeddings': embedding_bytes,
+            'questions': question_bytes,
+            'answers': answer_bytes,
+            'total': embedding_bytes + question_bytes + answer_bytes,
+        }
+
+    def close(self):
+        """释放答案文件句柄和匹配缓存"""
+        self._match_cache.cache_clear()
+        if isinstance(self.answers, AnswerStore):
+            self.answers.close()
+
 
 # 使用示例
 if __name__ == "__main__":
@@ -0,0 +1,348 @@
+# message_bus.py - 按房间的发布/订阅：识别匹配节点与面试者显示节点解耦
+"""
+面试官端 (识别+匹配) 把答案发布到房间，面试者端订阅同一房间。两端可以连接在
+不同的进程甚至不同的机器上，中间通过消息总线转发。
+
+实现:
+    InProcessBus  单进程内直接分发 (默认)
+    TcpBus        连接 BusBroker，按行传输JSON；进程内仍按房间本地分发，
+                  同一房间只向代理订阅一次
+
+总线地址由环境变量 INTERVIEW_BUS_URL 指定:
+    memory://             进程内 (默认)
+    tcp://主机:端口         连接消息代理
+
+启动本地消息代理:
+    python message_bus.py --port 8765
+"""
+import argparse
+import asyncio
+import json
+from collections import defaultdict
+from typing import Dict, Optional, Set
+from urllib.parse import urlsplit
+
+from app_logger import get_logger
+
+logger = get_logger("bus")
+
+DEFAULT_ROOM = 'default'
+DEFAULT_BROKER_PORT = 8765
+# 单条消息最大长度 (答案文本一般远小于此)
+MAX_LINE = 1024 * 1024
+
+
+class Subscription:
+    """
+    一个订阅者的接收队列
+
+    显示端处理太慢时丢弃最旧的消息，避免拖慢发布方。
+    """
+
+    def __init__(self, bus: 'SessionBus', room: str, maxsize: int = 64):
+        self.bus = bus
+        self.room = room
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, message: str) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(message)
+
+    async def get(self) -> str:
+        return await self._queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        return await self.get()
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class SessionBus:
+    """总线接口，同时提供进程内按房间分发的公共逻辑"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self.stats = {'published': 0, 'delivered': 0}
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def subscribe(self, room: str = DEFAULT_ROOM) -> Subscription:
+        """订阅房间，用完后调用 Subscription.close()"""
+        subscription = Subscription(self, room)
+        self._subscribers[room].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.room)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.room]
+
+    async def publish(self, room: str, message: str) -> None:
+        raise NotImplementedError
+
+    def _dispatch(self, room: str, message: str) -> int:
+        """投递给本进程中该房间的订阅者，返回投递数"""
+        subscribers = self._subscribers.get(room, ())
+        for subscription in subscribers:
+            subscription.put(message)
+        self.stats['delivered'] += len(subscribers)
+        return len(subscribers)
+
+    def local_subscribers(self, room: Optional[str] = None) -> int:
+        """本进程中的订阅者数量"""
+        if room is not None:
+            return len(self._subscribers.get(room, ()))
+        return sum(len(s) for s in self._subscribers.values())
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, backend=type(self).__name__, rooms=len(self._subscribers),
+                    subscribers=self.local_subscribers())
+
+
+class InProcessBus(SessionBus):
+    """单进程部署：发布即本地分发"""
+
+    async def publish(self, room: str, message: str) -> None:
+        self.stats['published'] += 1
+        self._dispatch(room, message)
+
+
+def encode_line(payload: dict) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+class TcpBus(SessionBus):
+    """
+    通过 BusBroker 跨进程/跨机器转发
+
+    与代理的连接断开后自动重连并重新订阅；断线期间发布的消息会被丢弃并计数。
+    """
+
+    def __init__(self, host: str, port: int = DEFAULT_BROKER_PORT, reconnect_delay: float = 1.0):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+        self.stats.update({'dropped': 0, 'reconnects': 0})
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        try:
+            # 启动时尽量等到连接建立，连不上也不阻塞服务启动
+            await asyncio.wait_for(self._connected.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("✗ 暂时无法连接消息代理 %s:%d，后台继续重试", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._close_writer()
+
+    def _close_writer(self) -> None:
+        self._connected.clear()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_LINE)
+            except OSError as e:
+                logger.debug("连接消息代理失败: %s", e)
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            self._writer = writer
+            for room in list(self._subscribers):
+                writer.write(encode_line({'op': 'sub', 'room': room}))
+            self._connected.set()
+            logger.info("✓ 已连接消息代理 %s:%d", self.host, self.port)
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    payload = json.loads(line)
+                    if payload.get('op') == 'msg':
+                        self._dispatch(payload['room'], payload['msg'])
+            except (ConnectionError, ValueError, asyncio.LimitOverrunError) as e:
+                logger.warning("消息代理连接异常: %s", e)
+            self._close_writer()
+            self.stats['reconnects'] += 1
+            logger.warning("✗ 与消息代理的连接已断开，%.0f 秒后重连", self.reconnect_delay)
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _send(self, payload: dict) -> bool:
+        if self._writer is None or not self._connected.is_set():
+            return False
+        self._writer.write(encode_line(payload))
+        return True
+
+    def subscribe(self, room: str = DEFAULT_ROOM) -> Subscription:
+        first = room not in self._subscribers
+        subscription = super().subscribe(room)
+        if first:
+            self._send({'op': 'sub', 'room': room})
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        super().unsubscribe(subscription)
+        if subscription.room not in self._subscribers:
+            self._send({'op': 'unsub', 'room': subscription.room})
+
+    async def publish(self, room: str, message: str) -> None:
+        self.stats['published'] += 1
+        if not self._send({'op': 'pub', 'room': room, 'msg': message}):
+            self.stats['dropped'] += 1
+            logger.warning("✗ 消息代理未连接，丢弃发往房间 %s 的消息", room)
+            return
+        writer = self._writer
+        try:
+            await writer.drain()
+        except ConnectionError as e:
+            # 连接在写入时断开：消息计为丢弃，关闭连接让 _run 重连，不影响发布方的会话
+            self.stats['dropped'] += 1
+            logger.warning("✗ 向消息代理发送失败，丢弃发往房间 %s 的消息: %s", room, e)
+            if self._writer is writer:
+                self._close_writer()
+
+
+def create_bus(url: Optional[str] = None) -> SessionBus:
+    """按地址创建总线，未指定时使用进程内实现"""
+    if not url or url.startswith('memory://'):
+        return InProcessBus()
+    parts = urlsplit(url)
+    if parts.scheme != 'tcp' or not parts.hostname:
+        raise ValueError(f"不支持的消息总线地址: {url}")
+    return TcpBus(parts.hostname, parts.port or DEFAULT_BROKER_PORT)
+
+
+class _BrokerConnection:
+    """
+    代理端的一个连接：发往该连接的消息先进入有界队列，由单独的任务写出
+
+    与 Subscription 一样，对端读得太慢 (或半开连接) 时丢弃最旧的消息，
+    不会让发布方等待某一个慢速的显示节点。
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, maxsize: int = 256):
+        self.writer = writer
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task = asyncio.create_task(self._run())
+
+    def send(self, line: bytes) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(line)
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                line = await self._queue.get()
+                self.writer.write(line)
+                await self.writer.drain()
+        except ConnectionError as e:
+            logger.debug("代理向订阅方写入失败: %s", e)
+            self.writer.close()
+
+    async def close(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.writer.close()
+
+
+class BusBroker:
+    """
+    最简的消息代理：每个连接可以订阅若干房间，发布的消息转发给订阅该房间的所有连接
+
+    只用于开发、测试和小规模部署；消息不落盘。
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, Set[_BrokerConnection]] = {}
+        self.stats = {'connections': 0, 'published': 0, 'forwarded': 0, 'dropped': 0}
+
+    def _leave(self, room: str, connection: _BrokerConnection) -> None:
+        members = self._rooms.get(room)
+        if members is None:
+            return
+        members.discard(connection)
+        if not members:
+            del self._rooms[room]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats['connections'] += 1
+        connection = _BrokerConnection(writer)
+        rooms: Set[str] = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                payload = json.loads(line)
+                op, room = payload.get('op'), payload.get('room', DEFAULT_ROOM)
+                if op == 'sub':
+                    rooms.add(room)
+                    self._rooms.setdefault(room, set()).add(connection)
+                elif op == 'unsub':
+                    rooms.discard(room)
+                    self._leave(room, connection)
+                elif op == 'pub':
+                    self._forward(room, payload.get('msg', ''))
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError) as e:
+            logger.debug("代理连接异常: %s", e)
+        finally:
+            for room in rooms:
+                self._leave(room, connection)
+            self.stats['connections'] -= 1
+            self.stats['dropped'] += connection.dropped
+            await connection.close()
+
+    def _forward(self, room: str, message: str) -> None:
+        """放入每个订阅连接的发送队列，不等待写出"""
+        self.stats['published'] += 1
+        line = encode_line({'op': 'msg', 'room': room, 'msg': message})
+        for target in self._rooms.get(room, ()):
+            target.send(line)
+            self.stats['forwarded'] += 1
+
+    async def serve(self, host: str = '127.0.0.1', port: int = DEFAULT_BROKER_PORT) -> None:
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        print(f"✓ 消息代理监听 {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="面试辅助工具消息代理")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_BROKER_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(BusBroker().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("消息代理已停止")
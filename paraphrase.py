@@ -0,0 +1,81 @@
+# paraphrase.py - 基于规则的本地问句改写，构建索引时为每个问题生成几种常见说法
+"""
+面试官的提问方式很多："什么是Redis" / "Redis是什么" / "介绍一下Redis" / "说说Redis吧"。
+知识库每行只写一种说法时，召回完全依赖这一种说法的向量。这里用规则把问题还原为
+主题词，再套用常见问法模板生成变体，全部离线完成，不需要额外模型。
+"""
+import re
+from typing import List
+
+# 问句前缀 (客套/引导词)，按长度从长到短匹配
+PREFIXES = sorted([
+    '请问', '请你', '请', '你能不能', '你能', '能不能', '可以', '麻烦',
+    '简单介绍一下', '介绍一下', '介绍下', '说一下', '说一说', '说说', '讲一下', '讲讲',
+    '谈一谈', '谈谈', '解释一下', '聊聊', '你了解', '你知道', '你怎么看',
+], key=len, reverse=True)
+SUFFIXES = ('吗', '呢', '吧', '啊', '？', '?', '。', '！', '!')
+# 含人称代词或疑问词的句子 (如"介绍一下你自己") 不是主题词，不能套用通用问法
+NOT_A_TOPIC = re.compile(r'[你我您他她]|什么|怎么|为什么|哪|吗|多少')
+
+# (匹配模式, 改写模板列表)，模板中的 {0} {1} 对应模式中的分组
+PATTERNS = [
+    (re.compile(r'^什么是(.+)$'), ['{0}是什么', '介绍一下{0}', '说说{0}']),
+    (re.compile(r'^(.+)是什么$'), ['什么是{0}', '介绍一下{0}', '说说{0}']),
+    (re.compile(r'^(?:如何|怎么|怎样|怎么样)(.+)$'), ['如何{0}', '怎么{0}', '{0}的方法']),
+    (re.compile(r'^为什么(.+)$'), ['{0}的原因', '为什么会{0}']),
+    (re.compile(r'^(.+?)(?:和|与|跟)(.+?)的(?:区别|不同|差异)$'),
+     ['{0}和{1}有什么区别', '{0}与{1}有什么不同', '比较一下{0}和{1}']),
+    (re.compile(r'^(.+?)(?:和|与|跟)(.+?)有(?:什么|哪些)(?:区别|不同)$'),
+     ['{0}和{1}的区别', '比较一下{0}和{1}']),
+    (re.compile(r'^(.+)的(?:原理|实现原理)$'), ['{0}是怎么实现的', '{0}的工作原理', '说说{0}的原理']),
+    (re.compile(r'^(.+)的(?:优缺点|优点和缺点)$'), ['{0}有什么优缺点', '{0}的优势和不足']),
+]
+
+
+def strip_question(text: str) -> str:
+    """去掉首尾的客套词和语气词，得到问题主干"""
+    core = text.strip()
+    changed = True
+    while changed and core:
+        changed = False
+        for suffix in SUFFIXES:
+            if core.endswith(suffix):
+                core = core[:-len(suffix)].rstrip()
+                changed = True
+        for prefix in PREFIXES:
+            if core.startswith(prefix) and len(core) > len(prefix):
+                core = core[len(prefix):].lstrip()
+                changed = True
+                break
+    return core
+
+
+def generate(question: str, max_variants: int = 4) -> List[str]:
+    """
+    生成问题的改写
+
+    Returns:
+        不含原句、去重后的改写列表，最多 max_variants 个
+    """
+    core = strip_question(question)
+    is_topic = bool(core) and NOT_A_TOPIC.search(core) is None
+    candidates = [core] if is_topic else []
+    for pattern, templates in PATTERNS:
+        m = pattern.match(core)
+        if m:
+            candidates.extend(t.format(*m.groups()) for t in templates)
+            break
+    else:
+        if is_topic and len(core) <= 20:
+            # 没有明显问法时，当作主题词套用最常见的两种问法
+            candidates.extend([f'介绍一下{core}', f'{core}是什么'])
+
+    seen = {question.strip()}
+    variants = []
+    for candidate in candidates:
+        if candidate and candidate not in seen:
+            seen.add(candidate)
+            variants.append(candidate)
+        if len(variants) >= max_variants:
+            break
+    return variants
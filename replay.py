@@ -0,0 +1,251 @@
+# replay.py - 重放录制的面试官会话，对比输出与时延
+"""
+读取 session_recorder.py 录制的会话，按原始到达时间 (可加速) 把音频帧重新发给本地服务的
+/ws/interviewer，同时以面试者身份订阅同一房间，收集服务端的全部输出，然后与录制时的输出对比:
+
+  - 内容差异：发给面试官端的消息、发布给面试者端的答案 (unified diff)
+  - 时延：每条输出相对于其前最后一帧音频的响应时间，录制时 vs 重放时的分位数和变化最大的消息
+
+重放默认使用独立的房间 (replay-<会话ID>)，不会把答案推给正在使用的面试者端。
+
+用法:
+
+    python replay.py recordings/2024-05-01/3fa2c1d0.rec --server ws://127.0.0.1:8000
+    python replay.py recordings/2024-05-01 --speed 4 --show-diff     # 整个目录，4倍速
+    python replay.py session.rec --speed 0                            # 不等待，尽快发送
+"""
+import argparse
+import asyncio
+import difflib
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import numpy as np
+import websockets
+
+from session_recorder import (read_records, KIND_META, KIND_IN_BYTES, KIND_IN_TEXT, KIND_OUT_TEXT,
+                              KIND_OUT_BYTES, KIND_PUBLISHED, KIND_END)
+
+# (距开始的秒数, 类型, 数据)
+Event = Tuple[float, int, bytes]
+
+
+def load_recording(path: str) -> Dict:
+    """把录制文件拆分为 meta、incoming、outgoing (发给面试官端)、published (发给面试者端)"""
+    recording = {'path': path, 'meta': {}, 'end': None, 'incoming': [], 'outgoing': [], 'published': []}
+    for kind, offset, data in read_records(path):
+        if kind == KIND_META:
+            recording['meta'] = json.loads(data)
+        elif kind == KIND_END:
+            recording['end'] = json.loads(data)
+        elif kind in (KIND_IN_BYTES, KIND_IN_TEXT):
+            recording['incoming'].append((offset, kind, data))
+        elif kind in (KIND_OUT_TEXT, KIND_OUT_BYTES):
+            recording['outgoing'].append((offset, kind, data))
+        elif kind == KIND_PUBLISHED:
+            recording['published'].append((offset, kind, data))
+    return recording
+
+
+def recording_paths(paths: List[str]) -> List[str]:
+    """展开目录 (递归查找 .rec 文件)"""
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                result.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.rec'))
+        else:
+            result.append(path)
+    return result
+
+
+def _round_floats(value):
+    if isinstance(value, float):
+        return round(value, 3)
+    if isinstance(value, dict):
+        return {k: _round_floats(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round_floats(v) for v in value]
+    return value
+
+
+def normalize(kind: int, data: bytes) -> str:
+    """用于对比的消息文本：JSON按键排序、浮点数保留3位；二进制消息用长度和摘要表示"""
+    if kind == KIND_OUT_BYTES:
+        return f"<binary {len(data)}B {hashlib.sha1(data).hexdigest()[:8]}>"
+    text = data.decode('utf-8', errors='replace')
+    try:
+        return json.dumps(_round_floats(json.loads(text)), ensure_ascii=False, sort_keys=True)
+    except ValueError:
+        return text
+
+
+def response_latencies(incoming: List[Event], outputs: List[Event]) -> List[float]:
+    """每条输出距其前最后一条输入的时间 (毫秒)"""
+    times = np.asarray([t for t, _, _ in incoming], dtype=np.float64)
+    latencies = []
+    for t, _, _ in outputs:
+        i = int(np.searchsorted(times, t, side='right')) - 1
+        latencies.append(round((t - times[i]) * 1000, 1) if i >= 0 else None)
+    return latencies
+
+
+async def replay_session(recording: Dict, server: str, speed: float = 1.0, room: Optional[str] = None,
+                         settle: float = 2.0) -> Dict:
+    """
+    重放一个会话
+
+    Args:
+        server: 服务地址，如 ws://127.0.0.1:8000
+        speed: 加速倍数；0 表示不按时间间隔等待
+        room: 重放使用的房间，默认 replay-<会话ID>
+        settle: 全部帧发送后，连续多少秒没有新输出即结束
+
+    Returns:
+        与 load_recording 相同结构的重放结果 (incoming 为实际发送时间)
+    """
+    meta = recording['meta']
+    params = dict(parse_qsl(meta.get('query', '')))
+    params['room'] = room or f"replay-{meta.get('session', 'session')}"
+    server = server.rstrip('/')
+    result = {'path': recording['path'], 'meta': meta, 'incoming': [], 'outgoing': [], 'published': []}
+    loop = asyncio.get_running_loop()
+    last_output = [loop.time()]
+
+    async def collect(ws, kind_text: int, target: List[Event], start: float):
+        try:
+            async for message in ws:
+                now = loop.time()
+                last_output[0] = now
+                if isinstance(message, str):
+                    target.append((now - start, kind_text, message.encode('utf-8')))
+                else:
+                    target.append((now - start, KIND_OUT_BYTES, message))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async with websockets.connect(f"{server}/ws/interviewee?{urlencode({'room': params['room']})}") as listener, \
+            websockets.connect(f"{server}{meta.get('path', '/ws/interviewer')}?{urlencode(params)}",
+                               max_size=None) as ws:
+        start = loop.time()
+        tasks = [asyncio.create_task(collect(ws, KIND_OUT_TEXT, result['outgoing'], start)),
+                 asyncio.create_task(collect(listener, KIND_PUBLISHED, result['published'], start))]
+        for offset, kind, data in recording['incoming']:
+            if speed > 0:
+                delay = start + offset / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await ws.send(data.decode('utf-8') if kind == KIND_IN_TEXT else data)
+            result['incoming'].append((loop.time() - start, kind, b''))
+
+        last_output[0] = loop.time()
+        while loop.time() - last_output[0] < settle:
+            await asyncio.sleep(min(settle, 0.2))
+        await ws.close()
+        await listener.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return result
+
+
+def _percentiles(values: List[Optional[float]]) -> Dict[str, Optional[float]]:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {'p50': None, 'p95': None, 'max': None}
+    p50, p95 = np.percentile(values, (50, 95))
+    return {'p50': round(float(p50), 1), 'p95': round(float(p95), 1), 'max': round(float(max(values)), 1)}
+
+
+def compare_stream(name: str, original: Dict, replayed: Dict, key: str, top: int = 5) -> Dict:
+    """
+    对比一路输出 (outgoing 或 published)
+
+    Returns:
+        diff (unified diff 行)、identical、两边的响应时间分位数、变化最大的几条消息
+    """
+    before = [normalize(kind, data) for _, kind, data in original[key]]
+    after = [normalize(kind, data) for _, kind, data in replayed[key]]
+    diff = list(difflib.unified_diff(before, after, f'{name} (录制)', f'{name} (重放)', lineterm=''))
+
+    before_latency = response_latencies(original['incoming'], original[key])
+    after_latency = response_latencies(replayed['incoming'], replayed[key])
+    # 内容相同的消息逐条比较响应时间
+    changes = []
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            i, j = block.a + k, block.b + k
+            if before_latency[i] is not None and after_latency[j] is not None:
+                changes.append((after_latency[j] - before_latency[i], before[i], before_latency[i], after_latency[j]))
+    changes.sort(key=lambda c: -abs(c[0]))
+    return {
+        'identical': not diff,
+        'diff': diff,
+        'messages': (len(before), len(after)),
+        'latency_recorded': _percentiles(before_latency),
+        'latency_replayed': _percentiles(after_latency),
+        'largest_changes': [{'delta_ms': round(d, 1), 'message': m[:80], 'recorded_ms': a, 'replayed_ms': b}
+                            for d, m, a, b in changes[:top]],
+    }
+
+
+def print_comparison(recording: Dict, report: Dict, show_diff: bool) -> None:
+    end = recording.get('end') or {}
+    print(f"\n会话 {recording['meta'].get('session', '?')} ({recording['path']})，"
+          f"{len(recording['incoming'])} 条输入，录制时长 {end.get('duration', '?')} 秒")
+    if end.get('dropped'):
+        print(f"  ⚠ 录制时丢弃了 {end['dropped']} 条记录，重放结果可能不一致")
+    for name, stream in report.items():
+        state = '一致' if stream['identical'] else '不一致'
+        before, after = stream['latency_recorded'], stream['latency_replayed']
+        print(f"  {name}: {stream['messages'][0]} -> {stream['messages'][1]} 条消息，内容{state}")
+        print(f"    响应时间 录制 p50 {before['p50']}ms p95 {before['p95']}ms | "
+              f"重放 p50 {after['p50']}ms p95 {after['p95']}ms")
+        for change in stream['largest_changes']:
+            if change['delta_ms']:
+                print(f"    {change['delta_ms']:+.1f}ms ({change['recorded_ms']} -> {change['replayed_ms']})  "
+                      f"{change['message']}")
+        if show_diff and stream['diff']:
+            for line in stream['diff']:
+                print(f"    {line}")
+
+
+async def run(args) -> int:
+    differs = 0
+    summaries = []
+    for path in recording_paths(args.recordings):
+        recording = load_recording(path)
+        replayed = await replay_session(recording, args.server, args.speed, args.room, args.settle)
+        report = {name: compare_stream(name, recording, replayed, key, args.top)
+                  for name, key in (('面试官端', 'outgoing'), ('面试者端', 'published'))}
+        differs += sum(1 for stream in report.values() if not stream['identical'])
+        if args.json:
+            summaries.append({'path': path, 'session': recording['meta'].get('session'), 'report': report})
+        else:
+            print_comparison(recording, report, args.show_diff)
+    if args.json:
+        print(json.dumps(summaries, ensure_ascii=False, indent=2))
+    return 1 if differs else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重放录制的面试官会话并对比输出与时延")
+    parser.add_argument('recordings', nargs='+', help='录制文件或目录 (INTERVIEW_RECORD_DIR)')
+    parser.add_argument('--server', default='ws://127.0.0.1:8000', help='服务地址')
+    parser.add_argument('--speed', type=float, default=1.0, help='加速倍数，0 表示不等待')
+    parser.add_argument('--room', default=None, help='重放使用的房间，默认 replay-<会话ID>')
+    parser.add_argument('--settle', type=float, default=2.0, help='发送完后无新输出多少秒即结束')
+    parser.add_argument('--top', type=int, default=5, help='列出响应时间变化最大的几条消息')
+    parser.add_argument('--show-diff', action='store_true', help='显示内容差异')
+    parser.add_argument('--json', action='store_true', help='输出JSON')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
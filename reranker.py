@@ -0,0 +1,165 @@
+# reranker.py - 交叉编码器重排：只对向量检索的前几个候选精排，受时间预算约束
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sentence_transformers import CrossEncoder
+
+from app_logger import get_logger
+
+logger = get_logger("reranker")
+
+
+class _Request:
+    __slots__ = ('pairs', 'future', 'expires_at')
+
+    def __init__(self, pairs: List[Tuple[str, str]], expires_at: float):
+        self.pairs = pairs
+        self.future: Future = Future()
+        self.expires_at = expires_at
+
+
+class CrossEncoderReranker:
+    """
+    交叉编码器把 (查询, 候选问题) 成对输入模型打分，比向量余弦更能区分似是而非的匹配，
+    但代价随候选数线性增长，因此只用于向量检索后的前 top_k 个候选。
+
+    所有会话的重排请求进入同一个队列，由后台线程凑批后一次推理；每个请求有硬性的
+    时间预算，超时的请求直接放弃重排 (调用方退回向量分数)，不会拖慢整体延迟。
+    """
+
+    def __init__(self, model_name: str = 'BAAI/bge-reranker-base', budget_ms: float = 150,
+                 top_k: int = 5, max_batch_pairs: int = 64, batch_wait_ms: float = 5,
+                 max_length: int = 128):
+        """
+        Args:
+            model_name: 交叉编码器模型名称
+            budget_ms: 单次查询等待重排结果的最长时间
+            top_k: 参与重排的候选数
+            max_batch_pairs: 一次推理最多包含的 (查询, 候选) 对数
+            batch_wait_ms: 凑批时最多等待的时间
+            max_length: 输入截断长度
+        """
+        print(f"正在加载重排模型 '{model_name}'...")
+        self.model = CrossEncoder(model_name, max_length=max_length)
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.top_k = top_k
+        self.max_batch_pairs = max_batch_pairs
+        self.batch_wait_ms = batch_wait_ms
+        self.stats = {'requests': 0, 'reranked': 0, 'timeouts': 0, 'expired_in_queue': 0,
+                      'batches': 0, 'pairs': 0}
+        self._worker_pid = None
+        self._ensure_worker()
+        print("✓ 重排模型加载成功")
+
+    def _ensure_worker(self) -> None:
+        """启动后台推理线程；fork出的子进程中线程不存在，首次使用时重新启动"""
+        if self._worker_pid == os.getpid():
+            return
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._worker, args=(self._queue,), name="reranker", daemon=True)
+        self._thread.start()
+        self._worker_pid = os.getpid()
+
+    def rerank(self, query: str, candidates: List[str], budget_ms: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        为候选问题打分
+
+        Returns:
+            与 candidates 等长的相关性分数 (0~1)；超过时间预算时返回None
+        """
+        return self.rerank_pairs([(query, c) for c in candidates], budget_ms)
+
+    def rerank_pairs(self, pairs: List[Tuple[str, str]], budget_ms: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        为多组 (查询, 候选问题) 一次打分，例如同一段语音的多个识别候选各自的候选问题
+
+        Returns:
+            与 pairs 等长的相关性分数；超过时间预算时返回None
+        """
+        if not pairs:
+            return np.empty(0, dtype=np.float32)
+        self._ensure_worker()
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        request = _Request(pairs, time.monotonic() + budget)
+        with self._lock:
+            self.stats['requests'] += 1
+        self._queue.put(request)
+        try:
+            scores = request.future.result(timeout=budget)
+        except FutureTimeout:
+            request.future.cancel()
+            with self._lock:
+                self.stats['timeouts'] += 1
+            return None
+        except Exception as e:
+            logger.warning("重排失败，退回向量分数: %s", e)
+            return None
+        with self._lock:
+            self.stats['reranked'] += 1
+        return scores
+
+    def _collect_batch(self, requests: queue.Queue) -> List[_Request]:
+        """取出一批请求：至少一个，之后在等待窗口内尽量凑满"""
+        batch = [requests.get()]
+        pairs = len(batch[0].pairs)
+        deadline = time.monotonic() + self.batch_wait_ms / 1000
+        while pairs < self.max_batch_pairs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            pairs += len(request.pairs)
+        return batch
+
+    def _worker(self, requests: queue.Queue) -> None:
+        while True:
+            batch = self._collect_batch(requests)
+            now = time.monotonic()
+            live = []
+            for request in batch:
+                # 排队期间已超时或调用方已放弃的请求不再推理
+                if request.expires_at <= now or not request.future.set_running_or_notify_cancel():
+                    with self._lock:
+                        self.stats['expired_in_queue'] += 1
+                    continue
+                live.append(request)
+            if not live:
+                continue
+
+            pairs = [pair for r in live for pair in r.pairs]
+            try:
+                scores = np.asarray(self.model.predict(pairs, batch_size=len(pairs),
+                                                       show_progress_bar=False), dtype=np.float32)
+                # 单标签交叉编码器默认经过Sigmoid输出0~1；多标签时取"相关"一列
+                if scores.ndim > 1:
+                    scores = scores[:, -1]
+            except Exception as e:
+                logger.error("重排推理失败: %s", e)
+                for request in live:
+                    request.future.set_exception(e)
+                continue
+
+            with self._lock:
+                self.stats['batches'] += 1
+                self.stats['pairs'] += len(pairs)
+            offset = 0
+            for request in live:
+                n = len(request.pairs)
+                request.future.set_result(scores[offset:offset + n])
+                offset += n
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, model_name=self.model_name, budget_ms=self.budget_ms,
+                        top_k=self.top_k, queued=self._queue.qsize())
@@ -0,0 +1,180 @@
+# ring_buffer.py - 预分配的音频环形缓冲区
+import threading
+from typing import Iterator, List, Optional
+
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_ERROR = 'error'
+
+
+class BufferOverflowError(BufferError):
+    """写入数据超过缓冲区剩余空间 (overflow='error' 时抛出)"""
+
+
+class AudioRingBuffer:
+    """
+    单生产者/单消费者的字节环形缓冲区
+
+    写入方把网络收到的数据直接拷贝进预分配内存，读取方通过 memoryview
+    拿到连续的数据片段交给识别器，整个过程不再产生中间 bytes 对象。
+    读写位置使用单调递增的绝对偏移，便于用 mark() 标记一句话的起止。
+    """
+
+    def __init__(self, capacity: int = 16000 * 2 * 30, overflow: str = OVERFLOW_DROP_OLDEST,
+                 buffer=None):
+        """
+        Args:
+            capacity: 容量(字节)，默认可容纳30秒16kHz 16位音频
+            overflow: 溢出策略，drop_oldest / drop_newest / error
+            buffer: 可选的外部可写缓冲区 (如 SharedMemory.buf)，为空时自行分配
+        """
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_ERROR):
+            raise ValueError(f"未知的溢出策略: {overflow}")
+        if buffer is None:
+            buffer = bytearray(capacity)
+        self._view = memoryview(buffer).cast('B')
+        self.capacity = len(self._view)
+        self.overflow = overflow
+        self._read_pos = 0
+        self._write_pos = 0
+        self._lock = threading.Lock()
+        # 回绕时拼接连续片段用的复用缓冲区
+        self._scratch = bytearray()
+        self.stats = {'written': 0, 'read': 0, 'dropped': 0, 'overflows': 0, 'high_water': 0}
+
+    def __len__(self) -> int:
+        return self._write_pos - self._read_pos
+
+    @property
+    def free(self) -> int:
+        return self.capacity - len(self)
+
+    @property
+    def read_position(self) -> int:
+        return self._read_pos
+
+    def mark(self) -> int:
+        """返回当前写入位置的绝对偏移，用于标记片段边界"""
+        return self._write_pos
+
+    def write(self, data) -> int:
+        """
+        写入数据，返回实际写入的字节数
+
+        Args:
+            data: bytes / bytearray / memoryview
+        """
+        src = memoryview(data).cast('B')
+        n = len(src)
+        if n == 0:
+            return 0
+
+        with self._lock:
+            if n > self.free:
+                self.stats['overflows'] += 1
+                if self.overflow == OVERFLOW_ERROR:
+                    raise BufferOverflowError(f"环形缓冲区溢出: 需要 {n} 字节，剩余 {self.free} 字节")
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.stats['dropped'] += n - self.free
+                    src = src[:self.free]
+                    n = len(src)
+                else:
+                    if n > self.capacity:
+                        # 单次写入就超过容量，只保留最新的部分
+                        self.stats['dropped'] += n - self.capacity
+                        src = src[n - self.capacity:]
+                        n = self.capacity
+                    overflow_bytes = n - self.free
+                    if overflow_bytes > 0:
+                        self._read_pos += overflow_bytes
+                        self.stats['dropped'] += overflow_bytes
+
+            start = self._write_pos % self.capacity
+            first = min(n, self.capacity - start)
+            self._view[start:start + first] = src[:first]
+            if first < n:
+                self._view[:n - first] = src[first:]
+            self._write_pos += n
+            self.stats['written'] += n
+            self.stats['high_water'] = max(self.stats['high_water'], len(self))
+        return n
+
+    def peek_views(self, size: Optional[int] = None) -> List[memoryview]:
+        """返回最多两个指向未读数据的视图(回绕时为两段)，不移动读位置"""
+        available = len(self)
+        size = available if size is None else min(size, available)
+        if size <= 0:
+            return []
+        start = self._read_pos % self.capacity
+        first = min(size, self.capacity - start)
+        views = [self._view[start:start + first]]
+        if first < size:
+            views.append(self._view[:size - first])
+        return views
+
+    def consume(self, size: int) -> None:
+        """将读位置前移 size 字节"""
+        with self._lock:
+            size = min(size, len(self))
+            self._read_pos += size
+            self.stats['read'] += size
+
+    def _advance(self, start: int, size: int) -> None:
+        """
+        读完从绝对偏移 start 开始的 size 字节后前移读位置
+
+        读取期间 drop_oldest 可能已经把读位置推过这段数据 (被覆盖的部分已计入 dropped)，
+        只前移到 start + size，也只把尚未被覆盖的部分计为已读。
+        """
+        with self._lock:
+            end = start + size
+            if end > self._read_pos:
+                self.stats['read'] += end - self._read_pos
+                self._read_pos = end
+
+    def read_chunks(self, chunk_size: int = 8000, limit: Optional[int] = None) -> Iterator[memoryview]:
+        """
+        逐块读取未读数据并前移读位置
+
+        每块都是连续内存：不回绕时直接返回缓冲区视图，回绕的那一块拼接到复用的
+        临时缓冲区中。调用方必须在取下一块之前用完当前块；使用期间若被 drop_oldest
+        覆盖，读位置只前移到这一块的末尾，不会额外跳过后面未读的数据。
+
+        Args:
+            chunk_size: 每块字节数
+            limit: 最多读取到的绝对偏移 (配合 mark() 使用)
+        """
+        while True:
+            end = len(self) if limit is None else min(len(self), limit - self._read_pos)
+            if end <= 0:
+                return
+            start = self._read_pos
+            views = self.peek_views(min(chunk_size, end))
+            if len(views) == 1:
+                chunk = views[0]
+            else:
+                total = len(views[0]) + len(views[1])
+                if len(self._scratch) < total:
+                    self._scratch = bytearray(total)
+                scratch = memoryview(self._scratch)
+                scratch[:len(views[0])] = views[0]
+                scratch[len(views[0]):total] = views[1]
+                chunk = scratch[:total]
+            yield chunk
+            self._advance(start, len(chunk))
+
+    def read_into(self, dest) -> int:
+        """把未读数据拷贝到调用方提供的缓冲区，返回拷贝的字节数"""
+        target = memoryview(dest).cast('B')
+        copied = 0
+        start = self._read_pos
+        for view in self.peek_views(len(target)):
+            target[copied:copied + len(view)] = view
+            copied += len(view)
+        self._advance(start, copied)
+        return copied
+
+    def clear(self) -> None:
+        """丢弃所有未读数据"""
+        with self._lock:
+            self._read_pos = self._write_pos
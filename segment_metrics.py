@@ -0,0 +1,117 @@
+# segment_metrics.py - 每个语音段的识别质量与各阶段延迟记录
+"""
+开启后 (INTERVIEW_SEGMENT_LOG=文件路径) 识别器输出词级时间戳和置信度 (SetWords)，
+每处理完一个语音段追加一行JSON：
+
+    {"ts": 结束时间, "session": ..., "pid": ..., "audio_ms": 音频时长, "decode_ms": 识别计算耗时,
+     "rtf": 实时率, "stages": {"asr": ..., "clean": ..., "match": ..., "deliver": ..., "total": ...},
+     "words": [[词, 开始秒, 结束秒, 置信度], ...], "mean_conf": ..., "min_conf": ..., "matched": ...}
+
+因过载、超时或出错被放弃的语音段只有 session、kb、audio_ms、stages.total (到达至放弃的时间)
+和 dropped (原因)。
+
+写入由后台线程完成：调用方只把记录放入有界队列，队列满时丢弃并计数，不阻塞事件循环。
+多个worker进程可以写同一个文件 (每条记录一次追加写入)。汇总分析见 analytics.py。
+"""
+import json
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+# 词置信度低于该值视为低置信度词
+LOW_CONFIDENCE = 0.6
+
+_STOP = object()
+
+
+def extract_words(result: Dict) -> List[Dict]:
+    """
+    识别结果中的词级信息 (需 SetWords(True))
+
+    普通结果在 'result' 中，n-best 结果取最佳候选的 'result' (n-best 模式下Vosk不给出词置信度)
+    """
+    words = result.get('result')
+    if words is None and result.get('alternatives'):
+        words = result['alternatives'][0].get('result')
+    return list(words or [])
+
+
+def word_summary(words: List[Dict], low_confidence: float = LOW_CONFIDENCE) -> Dict:
+    """
+    词级统计
+
+    Returns:
+        words (紧凑的 [词, 开始秒, 结束秒, 置信度或None])、speech_ms (第一个词开始到最后一个词结束)、
+        mean_conf / min_conf (没有置信度时为None)、low_conf_words
+    """
+    compact = [[w.get('word', ''), round(float(w.get('start', 0.0)), 2), round(float(w.get('end', 0.0)), 2),
+                round(float(w['conf']), 3) if 'conf' in w else None] for w in words]
+    confidences = [w[3] for w in compact if w[3] is not None]
+    return {
+        'words': compact,
+        'speech_ms': round((compact[-1][2] - compact[0][1]) * 1000) if compact else 0,
+        'mean_conf': round(sum(confidences) / len(confidences), 3) if confidences else None,
+        'min_conf': min(confidences) if confidences else None,
+        'low_conf_words': sum(1 for c in confidences if c < low_confidence),
+    }
+
+
+class SegmentLog:
+    """追加写入的语音段记录，由后台线程写盘"""
+
+    def __init__(self, path: str, queue_size: int = 10000):
+        """
+        Args:
+            path: JSONL文件路径 (追加写入)
+            queue_size: 队列容量，满时丢弃新记录
+        """
+        self.path = path
+        self.dropped = 0
+        self.written = 0
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='segment-log', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> Optional['SegmentLog']:
+        path = os.environ.get('INTERVIEW_SEGMENT_LOG')
+        return cls(path) if path else None
+
+    def record(self, **fields) -> None:
+        """记录一个语音段 (非阻塞)；自动补充结束时间和进程号"""
+        fields.setdefault('ts', round(time.time(), 3))
+        fields.setdefault('pid', os.getpid())
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        # O_APPEND + 每条记录一次 write：多个进程写同一文件时记录不会交错
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                os.write(fd, (json.dumps(item, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+                self.written += 1
+        finally:
+            os.close(fd)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """写完队列中剩余的记录后停止后台线程"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    @property
+    def stats(self) -> Dict:
+        return {'path': self.path, 'written': self.written, 'dropped': self.dropped}
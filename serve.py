@@ -0,0 +1,218 @@
+# serve.py - 多worker部署：父进程预加载只读模型后fork，按房间粘性转发连接
+"""
+用法:
+
+    python serve.py --workers 4 --port 8000
+
+父进程先加载 Vosk 模型、语义模型和知识库，再 fork 出多个 worker。子进程与父进程
+共享这些只读内存页 (写时复制)，知识库向量本身以 mmap 方式映射，因此无论多少个
+worker，模型和向量在物理内存中都只有一份。
+
+每个 worker 在 127.0.0.1 的独立端口上运行 uvicorn；父进程在公开端口上做一层很薄的
+TCP 转发：读取HTTP请求行，按查询参数 room 的哈希选择 worker，同一房间的面试官端和
+被面试者端连接总是落在同一个 worker 上 (未带 room 的连接全部交给第一个 worker，
+与单进程行为一致)。设置 INTERVIEW_BUS_URL 使用消息代理后，两端可以在不同worker上。
+
+注意：
+  - 仅支持提供 os.fork 的平台 (Linux/macOS)。
+  - 运行时加载/卸载知识库 (POST/DELETE /kb/...) 只作用于处理该请求的 worker。
+"""
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import sys
+import zlib
+from typing import List
+from urllib.parse import parse_qs, urlsplit
+
+import uvicorn
+
+import main
+from app_logger import setup_logging, shutdown_logging, get_logger
+
+logger = get_logger("serve")
+
+# 请求行最大长度，超过视为非法请求
+MAX_REQUEST_LINE = 16 * 1024
+
+
+def worker_for(request_line: bytes, workers: int) -> int:
+    """根据请求行中的 room 参数选择 worker 下标"""
+    try:
+        target = request_line.split(b' ')[1].decode('latin-1')
+    except IndexError:
+        return 0
+    room = parse_qs(urlsplit(target).query).get('room', [''])[0]
+    if not room:
+        return 0
+    return zlib.crc32(room.encode('utf-8')) % workers
+
+
+def limit_torch_threads(threads: int) -> None:
+    """
+    在父进程使用PyTorch之前限制线程数
+
+    线程池在第一次计算时创建，fork后子进程继承的是父进程的设置；在子进程里再调整
+    (OpenMP线程池已在父进程初始化) 可能卡死，因此只能在加载模型之前设置。
+    匹配器按 INTERVIEW_TORCH_THREADS 设置线程数，这里写入同一个值，避免加载时被改掉。
+    """
+    os.environ['INTERVIEW_TORCH_THREADS'] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def run_worker(index: int, port: int, log_level: str) -> None:
+    """子进程入口：在本地端口上运行uvicorn"""
+    print(f"worker {index} (pid {os.getpid()}) 监听 127.0.0.1:{port}")
+    config = uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level=log_level)
+    uvicorn.Server(config).run()
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """单向转发字节，直到对端关闭"""
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+class AffinityProxy:
+    """公开端口上的转发器，HTTP与WebSocket连接按房间粘到固定worker"""
+
+    def __init__(self, worker_ports: List[int]):
+        self.worker_ports = worker_ports
+        self.connections = [0] * len(worker_ports)
+
+    async def handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await client_reader.readuntil(b'\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+
+        index = worker_for(request_line, len(self.worker_ports))
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                '127.0.0.1', self.worker_ports[index])
+        except OSError as e:
+            logger.error("无法连接 worker %d: %s", index, e)
+            client_writer.write(b'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n')
+            client_writer.close()
+            return
+
+        self.connections[index] += 1
+        try:
+            upstream_writer.write(request_line)
+            await asyncio.gather(pipe(client_reader, upstream_writer),
+                                 pipe(upstream_reader, client_writer))
+        finally:
+            self.connections[index] -= 1
+
+
+async def run_proxy(host: str, port: int, worker_ports: List[int], pids: List[int]) -> int:
+    """运行转发器，任一worker退出时停止并返回退出码"""
+    proxy = AffinityProxy(worker_ports)
+    server = await asyncio.start_server(proxy.handle, host, port, limit=MAX_REQUEST_LINE)
+    print(f"✓ 转发器监听 {host}:{port}，共 {len(worker_ports)} 个worker")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    exit_code = 0
+    async with server:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            # worker异常退出时整体退出，交给外部的进程管理器 (systemd等) 重启
+            for pid in pids:
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if done:
+                    logger.error("worker (pid %d) 意外退出，状态 %d", pid, status)
+                    exit_code = 1
+                    stop.set()
+    return exit_code
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="面试辅助工具多worker部署")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--worker-base-port', type=int, default=None,
+                        help='worker本地端口起点，默认为 --port + 1')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='每个worker的计算线程数，默认 CPU核数 / worker数')
+    parser.add_argument('--log-level', default='info')
+    return parser.parse_args()
+
+
+def main_entry() -> int:
+    if not hasattr(os, 'fork'):
+        print("当前平台不支持fork，请直接运行 python main.py")
+        return 1
+
+    args = parse_args()
+    workers = max(1, args.workers)
+    base_port = args.worker_base_port or args.port + 1
+    threads = (args.threads or int(os.environ.get('INTERVIEW_TORCH_THREADS') or 0)
+               or max(1, (os.cpu_count() or 1) // workers))
+
+    print("=== 预加载模型 (所有worker共享) ===")
+    limit_torch_threads(threads)
+    main.preload_models()
+
+    # 冻结现有对象，避免垃圾回收在子进程中改写对象头导致共享页被复制
+    gc.collect()
+    gc.freeze()
+
+    worker_ports = [base_port + i for i in range(workers)]
+    pids = []
+    for index, port in enumerate(worker_ports):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(index, port, args.log_level)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+
+    # 日志队列线程只在父进程fork之后启动
+    setup_logging()
+    try:
+        exit_code = asyncio.run(run_proxy(args.host, args.port, worker_ports, pids))
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        shutdown_logging()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main_entry())
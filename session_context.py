@@ -0,0 +1,102 @@
+# session_context.py - 会话内的滚动上下文，用于理解"那你具体说说"之类的追问
+import re
+import weakref
+import numpy as np
+from collections import deque
+from typing import List, Optional
+
+# 句首的追问连接词/套话：指代上文，本身几乎不含主题信息。只看句首，句中出现"为什么""具体"
+# 之类的词不算；是否真的按追问处理还要看句子单独匹配的分数 (见 matcher.match_in_context)
+FOLLOW_UP_PATTERN = re.compile(
+    r'^(那么?|那你|然后|还有|另外|接着|所以|具体|详细|展开|举个例子|举例|为啥|为什么呢|怎么做到的|原理是)'
+)
+
+
+class SessionContext:
+    """
+    保存会话最近N轮的 (识别文本, 查询向量, 命中的问题下标)
+
+    查询向量在匹配时已经算过，这里直接复用，合成上下文向量不需要再次编码。
+    """
+
+    def __init__(self, window: int = 4, decay: float = 0.5, context_weight: float = 0.6,
+                 follow_up_max_chars: int = 12):
+        """
+        Args:
+            window: 保留的轮数
+            decay: 越早的轮次权重越低，第k轮之前的权重为 decay**k
+            context_weight: 追问时上下文向量相对于当前查询的权重
+            follow_up_max_chars: 不超过该长度且带追问特征的句子视为追问
+        """
+        self.window = window
+        self.decay = decay
+        self.context_weight = context_weight
+        self.follow_up_max_chars = follow_up_max_chars
+        self._texts = deque(maxlen=window)
+        self._embeddings = deque(maxlen=window)
+        self._matched = deque(maxlen=window)
+        self._context_vector: Optional[np.ndarray] = None
+        self._owner = None
+        self.stats = {'turns': 0, 'follow_ups': 0}
+
+    def bind(self, owner) -> None:
+        """绑定到某个知识库；知识库切换后下标失去意义，清空上下文"""
+        current = self._owner() if self._owner is not None else None
+        if current is not owner:
+            self.clear()
+            self._owner = weakref.ref(owner)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def add(self, text: str, embedding: np.ndarray, matched_index: Optional[int]) -> None:
+        """记录一轮对话"""
+        self._texts.append(text)
+        self._embeddings.append(np.asarray(embedding, dtype=np.float32))
+        self._matched.append(matched_index)
+        self._context_vector = None
+        self.stats['turns'] += 1
+
+    def is_follow_up(self, text: str) -> bool:
+        """有上文且句子短、以追问连接词开头时视为可能的追问"""
+        if not self._texts or not text:
+            return False
+        text = text.strip()
+        return len(text) <= self.follow_up_max_chars and FOLLOW_UP_PATTERN.search(text) is not None
+
+    @property
+    def last_matched(self) -> Optional[int]:
+        """最近一次命中的问题下标"""
+        for index in reversed(self._matched):
+            if index is not None:
+                return index
+        return None
+
+    @property
+    def recent_texts(self) -> List[str]:
+        return list(self._texts)
+
+    def context_vector(self) -> Optional[np.ndarray]:
+        """最近几轮查询向量的加权平均 (已归一化)，结果缓存到下一次 add"""
+        if not self._embeddings:
+            return None
+        if self._context_vector is None:
+            stacked = np.stack(self._embeddings)
+            weights = self.decay ** np.arange(len(stacked) - 1, -1, -1, dtype=np.float32)
+            pooled = weights @ stacked
+            self._context_vector = pooled / max(float(np.linalg.norm(pooled)), 1e-12)
+        return self._context_vector
+
+    def contextualize(self, query_embedding: np.ndarray) -> np.ndarray:
+        """把上下文向量按权重并入当前查询向量"""
+        context = self.context_vector()
+        if context is None:
+            return query_embedding
+        combined = query_embedding + self.context_weight * context
+        return combined / max(float(np.linalg.norm(combined)), 1e-12)
+
+    def clear(self) -> None:
+        self._texts.clear()
+        self._embeddings.clear()
+        self._matched.clear()
+        self._context_vector = None
@@ -0,0 +1,252 @@
+# session_recorder.py - 面试官会话录制：收到的音频帧与发出的消息，供 replay.py 重放
+"""
+开启后 (INTERVIEW_RECORD_DIR=目录) 每个面试官连接写一个录制文件 <目录>/<开始日期>/<会话ID>.rec，
+记录连接参数、收到的每一帧 (含到达时间)、发给面试官端的消息和发布给面试者端的答案。
+
+文件格式 (只追加):
+
+    MAGIC
+    记录*:  struct '<BdI' (类型, 距会话开始的秒数, 长度) + 数据
+
+类型见 KIND_*；KIND_META / KIND_END 的数据为JSON。
+
+录制不在热路径上做任何IO：调用方只记下时间戳并把 (会话, 类型, 时间, 数据) 放入有界队列，
+由一个后台线程批量写入带缓冲的文件。文件路径在会话开始时确定并随每条记录入队，跨过午夜或
+空闲关闭后重新打开的会话仍追加到同一个文件。队列满时丢弃并计数 (结束记录中注明丢弃数，重放结果
+不再可信)。关闭请求同样不等待队列；没能入队的关闭和长时间没有新记录的文件由写线程关闭。
+"""
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from typing import BinaryIO, Dict, Iterator, Optional, Set, Tuple
+
+MAGIC = b'IVREC1\n'
+RECORD_HEADER = struct.Struct('<BdI')
+
+KIND_META = 0          # 会话开始：路径、查询参数、开始时间
+KIND_IN_BYTES = 1      # 收到的二进制消息 (音频帧)
+KIND_IN_TEXT = 2       # 收到的文本消息
+KIND_OUT_TEXT = 3      # 发给面试官端的文本消息
+KIND_OUT_BYTES = 4     # 发给面试官端的二进制消息 (帧确认)
+KIND_PUBLISHED = 5     # 发布给面试者端 (房间) 的消息
+KIND_END = 9           # 会话结束：时长、丢弃数
+
+_CLOSE = object()
+
+
+def read_records(path: str) -> Iterator[Tuple[int, float, bytes]]:
+    """依次读出录制文件中的 (类型, 时间, 数据)；文件末尾不完整的记录 (进程被杀) 忽略"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是会话录制文件: {path}")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            kind, offset, length = RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield kind, offset, data
+
+
+class SessionRecording:
+    """一个会话的录制句柄；所有方法只入队，不做IO"""
+
+    def __init__(self, recorder: 'SessionRecorder', session_id: str, path: str):
+        self.recorder = recorder
+        self.session_id = session_id
+        self.path = path
+        self.start = time.monotonic()
+        self.dropped = 0
+        self.closed = False
+
+    def _put(self, kind: int, data: bytes) -> None:
+        if self.closed:
+            return
+        if not self.recorder._enqueue((self.path, kind, time.monotonic() - self.start, data)):
+            self.dropped += 1
+
+    def incoming(self, data) -> None:
+        if isinstance(data, str):
+            self._put(KIND_IN_TEXT, data.encode('utf-8'))
+        else:
+            self._put(KIND_IN_BYTES, bytes(data))
+
+    def outgoing(self, data) -> None:
+        if isinstance(data, str):
+            self._put(KIND_OUT_TEXT, data.encode('utf-8'))
+        else:
+            self._put(KIND_OUT_BYTES, bytes(data))
+
+    def published(self, message: str) -> None:
+        self._put(KIND_PUBLISHED, message.encode('utf-8'))
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        end = json.dumps({'duration': round(time.monotonic() - self.start, 3), 'dropped': self.dropped})
+        self._put(KIND_END, end.encode('utf-8'))
+        self.closed = True
+        # 在事件循环中调用，不能阻塞；队列满时交给写线程按空闲超时关闭文件
+        if not self.recorder._enqueue((self.path, _CLOSE, 0.0, b'')):
+            self.recorder._closing.add(self.path)
+
+    def wrap(self, websocket) -> 'RecordingWebSocket':
+        return RecordingWebSocket(websocket, self)
+
+
+class RecordingWebSocket:
+    """包装 FastAPI WebSocket：收发的消息同时交给录制句柄，其他属性原样转发"""
+
+    def __init__(self, websocket, recording: SessionRecording):
+        self._websocket = websocket
+        self.recording = recording
+
+    def __getattr__(self, name):
+        return getattr(self._websocket, name)
+
+    async def receive_bytes(self) -> bytes:
+        data = await self._websocket.receive_bytes()
+        self.recording.incoming(data)
+        return data
+
+    async def receive_text(self) -> str:
+        data = await self._websocket.receive_text()
+        self.recording.incoming(data)
+        return data
+
+    async def send_text(self, data: str) -> None:
+        self.recording.outgoing(data)
+        await self._websocket.send_text(data)
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.recording.outgoing(data)
+        await self._websocket.send_bytes(data)
+
+
+class SessionRecorder:
+    """所有会话共用一个后台写线程"""
+
+    def __init__(self, directory: str, queue_size: int = 20000, buffer_size: int = 1 << 18,
+                 flush_interval: float = 1.0, idle_timeout: float = 300.0):
+        """
+        Args:
+            directory: 录制目录，按日期分子目录
+            queue_size: 队列容量 (条)，满时丢弃新记录
+            buffer_size: 每个录制文件的写缓冲大小
+            flush_interval: 空闲时最长多久刷一次盘 (秒)
+            idle_timeout: 多久没有新记录的文件由写线程关闭 (秒)，之后再有记录会重新以追加方式打开
+        """
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.stats = {'sessions': 0, 'records': 0, 'bytes': 0, 'dropped': 0}
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        # 以下均以录制文件路径为键
+        self._files: Dict[str, BinaryIO] = {}
+        self._last_write: Dict[str, float] = {}
+        # 关闭请求没能入队的会话，写线程在队列清空后关闭其文件
+        self._closing: Set[str] = set()
+        self._thread = threading.Thread(target=self._run, name='session-recorder', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> Optional['SessionRecorder']:
+        directory = os.environ.get('INTERVIEW_RECORD_DIR')
+        return cls(directory) if directory else None
+
+    def open_session(self, session_id: str, **meta) -> SessionRecording:
+        """开始录制一个会话，meta (路径、查询参数等) 写入文件开头"""
+        path = os.path.join(self.directory, time.strftime('%Y-%m-%d'), f'{session_id}.rec')
+        recording = SessionRecording(self, session_id, path)
+        meta = dict(meta, session=session_id, started=round(time.time(), 3))
+        recording._put(KIND_META, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+        self.stats['sessions'] += 1
+        return recording
+
+    def _enqueue(self, item) -> bool:
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+
+    def _open_file(self, path: str) -> BinaryIO:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, 'ab', buffering=self.buffer_size)
+        if f.tell() == 0:
+            f.write(MAGIC)
+        return f
+
+    def _close_file(self, path: str) -> None:
+        self._last_write.pop(path, None)
+        f = self._files.pop(path, None)
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                self.stats['dropped'] += 1
+
+    def _close_idle(self) -> None:
+        """
+        关闭待关闭的和长时间没有新记录的文件，其余刷盘
+
+        待关闭的会话如果还有记录在队列中，写入时会以追加方式重新打开，内容不受影响。
+        """
+        now = time.monotonic()
+        closing, self._closing = self._closing, set()
+        for path in list(self._files):
+            if path in closing or now - self._last_write[path] > self.idle_timeout:
+                self._close_file(path)
+        for f in self._files.values():
+            f.flush()
+
+    def _run(self) -> None:
+        last_check = time.monotonic()
+        while True:
+            # 队列一直不空时也定期检查，避免持续负载下文件永不关闭
+            if time.monotonic() - last_check >= self.flush_interval:
+                self._close_idle()
+                last_check = time.monotonic()
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._close_idle()
+                last_check = time.monotonic()
+                continue
+            if item is _CLOSE:
+                break
+            path, kind, offset, data = item
+            try:
+                if kind is _CLOSE:
+                    self._close_file(path)
+                    continue
+                f = self._files.get(path)
+                if f is None:
+                    f = self._files[path] = self._open_file(path)
+                self._last_write[path] = time.monotonic()
+                f.write(RECORD_HEADER.pack(kind, offset, len(data)))
+                f.write(data)
+                self.stats['records'] += 1
+                self.stats['bytes'] += RECORD_HEADER.size + len(data)
+            except OSError:
+                # 磁盘错误不影响服务，计为丢弃
+                self.stats['dropped'] += 1
+        for path in list(self._files):
+            self._close_file(path)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """写完队列中剩余的记录并关闭所有文件"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_CLOSE, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
@@ -0,0 +1,101 @@
+# speculative.py - 基于中间识别结果的预判匹配
+from typing import Dict, List, Optional, Tuple
+
+# 最终结果相对预判答案的处理方式
+ACTION_NEW = 'new'              # 之前没有预判，正常发送
+ACTION_CONFIRMED = 'confirmed'  # 与预判一致，只需确认，不重复发送答案
+ACTION_UPDATED = 'updated'      # 与预判不同，发送新答案替换
+ACTION_RETRACTED = 'retracted'  # 最终未匹配，撤回预判答案
+ACTION_NONE = 'none'            # 没有预判也没有匹配
+
+
+class SpeculativeAnswerTracker:
+    """
+    单个会话的预判状态
+
+    Vosk 的 PartialResult 在说话过程中不断变化，只有连续若干次保持不变
+    (或只在末尾追加) 的部分才视为"稳定"，稳定文本才送去匹配；相似度超过
+    预判阈值时先把答案推给面试者，最终结果出来后再确认、更新或撤回。
+    """
+
+    def __init__(self, stable_updates: int = 2, min_chars: int = 6,
+                 provisional_threshold: float = 0.72):
+        """
+        Args:
+            stable_updates: 中间结果连续多少次保持不变才算稳定
+            min_chars: 稳定文本的最少字数，太短的片段不做预判
+            provisional_threshold: 预判答案需要达到的相似度 (应高于最终匹配阈值)
+        """
+        self.stable_updates = stable_updates
+        self.min_chars = min_chars
+        self.provisional_threshold = provisional_threshold
+        self._history: List[str] = []
+        self._last_matched_text: Optional[str] = None
+        self.provisional: Optional[Dict] = None
+        self.stats = {'partials': 0, 'speculative_matches': 0, 'provisional_sent': 0,
+                      'confirmed': 0, 'updated': 0, 'retracted': 0}
+
+    def observe_partial(self, partial_text: str) -> Optional[str]:
+        """
+        记录一次中间识别结果，返回需要预判匹配的稳定文本 (没有则返回None)
+        """
+        text = partial_text.replace(' ', '')
+        if not text:
+            return None
+        self.stats['partials'] += 1
+        self._history.append(text)
+        del self._history[:-self.stable_updates]
+        if len(self._history) < self.stable_updates:
+            return None
+
+        # 取最近几次中间结果的公共前缀作为稳定部分
+        stable = self._history[0]
+        for other in self._history[1:]:
+            i = 0
+            limit = min(len(stable), len(other))
+            while i < limit and stable[i] == other[i]:
+                i += 1
+            stable = stable[:i]
+
+        if len(stable) < self.min_chars or stable == self._last_matched_text:
+            return None
+        self._last_matched_text = stable
+        self.stats['speculative_matches'] += 1
+        return stable
+
+    def offer_provisional(self, match_result: Optional[Dict]) -> Optional[Dict]:
+        """
+        提交一次预判匹配结果，返回需要推送给面试者的预判答案；
+        相似度不够或与已推送的答案相同时返回None (去重)
+        """
+        if not match_result or match_result['similarity'] < self.provisional_threshold:
+            return None
+        if self.provisional and self.provisional['index'] == match_result['index']:
+            return None
+        self.provisional = match_result
+        self.stats['provisional_sent'] += 1
+        return match_result
+
+    def resolve(self, final_result: Optional[Dict]) -> Tuple[str, Optional[Dict]]:
+        """
+        用最终匹配结果收尾，返回 (处理方式, 需要发送的结果)，并重置本句状态
+        """
+        provisional = self.provisional
+        self.reset()
+
+        if provisional is None:
+            return (ACTION_NEW, final_result) if final_result else (ACTION_NONE, None)
+        if final_result is None:
+            self.stats['retracted'] += 1
+            return ACTION_RETRACTED, provisional
+        if final_result['index'] == provisional['index']:
+            self.stats['confirmed'] += 1
+            return ACTION_CONFIRMED, final_result
+        self.stats['updated'] += 1
+        return ACTION_UPDATED, final_result
+
+    def reset(self) -> None:
+        """开始新的一句话"""
+        self._history = []
+        self._last_matched_text = None
+        self.provisional = None
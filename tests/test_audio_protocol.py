@@ -0,0 +1,71 @@
+# test_audio_protocol.py - 分帧音频协议的编解码与损坏帧处理
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_protocol import (AudioStreamDecoder, ProtocolError, CODEC_PCM16, CODEC_PCM16_DELTA_ZLIB,
+                            FLAG_END_OF_UTTERANCE, pack_frame, split_into_frames)
+
+
+def _pcm(samples: int = 16000) -> bytes:
+    rng = np.random.default_rng(0)
+    return rng.integers(-32768, 32767, samples, dtype=np.int16).astype('<i2').tobytes()
+
+
+@pytest.mark.parametrize('codec', [CODEC_PCM16, CODEC_PCM16_DELTA_ZLIB])
+def test_round_trip_with_reordering(codec):
+    pcm = _pcm()
+    frames = split_into_frames(pcm, session=7, start_seq=0, codec=codec, frame_ms=100)
+    decoder = AudioStreamDecoder()
+    # 交换第2、3帧，并重发一帧
+    delivered = []
+    for frame in [frames[0], frames[2], frames[1]] + frames[3:] + [frames[3]]:
+        delivered.extend(decoder.feed(frame))
+    assert b''.join(chunk for chunk, _ in delivered) == pcm
+    assert [end for _, end in delivered] == [False] * (len(frames) - 1) + [True]
+    assert decoder.stats['duplicates'] == 1
+
+
+@pytest.mark.parametrize('payload, codec', [
+    (b'garbage!!', CODEC_PCM16_DELTA_ZLIB),
+    (b'\x00\x01\x02', CODEC_PCM16),
+])
+def test_corrupt_frame_does_not_block_stream(payload, codec):
+    decoder = AudioStreamDecoder()
+    good = _pcm(1600)
+    with pytest.raises(ProtocolError):
+        decoder.feed(pack_frame(1, 0, payload, codec=codec, flags=FLAG_END_OF_UTTERANCE))
+    # 损坏帧按空音频占位并保留断句标记，后续帧照常交付
+    assert decoder.take_ready() == [(b'', True)]
+    assert decoder.feed(pack_frame(1, 1, good)) == [(good, False)]
+    assert decoder.stats['corrupt'] == 1
+
+
+def test_odd_length_inflated_payload_rejected():
+    import zlib
+    decoder = AudioStreamDecoder()
+    with pytest.raises(ProtocolError):
+        decoder.feed(pack_frame(1, 0, zlib.compress(b'\x01\x02\x03'), codec=CODEC_PCM16_DELTA_ZLIB))
+
+
+def test_decompression_bomb_rejected():
+    import zlib
+    decoder = AudioStreamDecoder()
+    bomb = zlib.compress(b'\x00' * (64 << 20), 9)
+    with pytest.raises(ProtocolError):
+        decoder.feed(pack_frame(1, 0, bomb, codec=CODEC_PCM16_DELTA_ZLIB))
+    assert decoder.take_ready() == [(b'', False)]
+
+
+def test_unsupported_sample_rate_rejected():
+    decoder = AudioStreamDecoder()
+    with pytest.raises(ProtocolError):
+        decoder.feed(pack_frame(1, 0, _pcm(160), sample_rate=1))
+    assert decoder.sample_rate == 16000
+    good = _pcm(800)
+    assert decoder.feed(pack_frame(1, 1, good, sample_rate=8000)) == [(b'', False), (good, False)]
+    assert decoder.sample_rate == 8000
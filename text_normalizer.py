@@ -0,0 +1,310 @@
+# text_normalizer.py - 识别文本与知识库问题共用的文本规范化流水线
+"""
+步骤 (每步可单独关闭):
+
+  1. 全角转半角        预编译的 str.translate 表
+  2. 繁体转简体        安装了 opencc 时使用 opencc，否则使用内置的常用字表
+  3. 去除口头语        Aho-Corasick 自动机一次扫描去掉所有口头语 ("嗯嗯"、"就是说"、"我想问一下"...)
+  4. 数字规范化        "二零二三年" -> "2023年"，"三十二" -> "32"；逐位读的数字串只在后接"年""端口"等时转换，
+                       "一三五号上班"、单个汉字数字 ("一下"、"三次") 保持不变
+  5. 分词去停用词      jieba 精确模式分词，一次遍历同时得到严格/宽松两种过滤结果
+
+停用词和口头语可以从文件加载 (每行一个，# 开头为注释)。同一段文本的结果会被缓存，
+normalize_batch 对批量文本去重后逐条处理。
+"""
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import jieba
+
+from app_logger import get_logger
+
+try:
+    import opencc
+    OPENCC_AVAILABLE = True
+except ImportError:
+    OPENCC_AVAILABLE = False
+
+logger = get_logger("normalizer")
+
+# 规范化规则本身 (而非词表) 变化时递增，使已缓存的结果失效
+PIPELINE_VERSION = '2'
+
+DEFAULT_STOP_WORDS = {
+    '的', '了', '呢', '啊', '哦', '嗯', '这个', '那个', '我想', '问一下',
+    '请问', '就是', '然后', '其实', '对于', '吧', '呀', '哈', '么', '之后', '那么'
+}
+DEFAULT_FILLERS = [
+    '嗯嗯', '嗯', '呃', '那个那个', '就是说', '怎么说呢', '我想问一下', '想问一下', '请问一下', '你能不能说一下',
+]
+
+# 全角ASCII (！到～) 与全角空格转为半角
+FULL_TO_HALF = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+FULL_TO_HALF[0x3000] = 0x20
+
+# 内置的常用繁简字对照 (未安装 opencc 时使用)，覆盖面试场景的常见用字
+_TRADITIONAL_PAIRS = (
+    '們们 個个 說说 這这 對对 為为 麼么 樣样 與与 來来 時时 會会 過过 還还 發发 問问 題题 點点 開开 關关 '
+    '係系 資资 庫库 網网 絡络 體体 驗验 務务 級级 線线 統统 計计 數数 據据 結结 構构 設设 實实 現现 優优 '
+    '區区 別别 應应 該该 請请 談谈 軟软 機机 學学 習习 類类 記记 憶忆 處处 錯错 誤误 測测 試试 環环 變变 '
+    '連连 載载 輸输 檔档 檢检 顯显 語语 經经 項项 團团 隊队 負负 責责 溝沟 壓压 職职 業业 規规 劃划 離离 '
+    '擇择 績绩 進进 間间 異异 鎖锁 緩缓 並并 併并 佈布 頁页 碼码 響响 專专 長长 協协 議议 態态 條条 辦办 '
+    '從从 讓让 給给 嗎吗 聽听 講讲 讀读 寫写 單单 雙双 復复 雜杂 簡简 歷历 紹绍 認认 識识 裡里 後后 東东 '
+    '車车 書书 號号 電电 腦脑 執执 強强 調调 創创 產产 總总 確确 證证 權权 儲储 熱热 備备 麼么 們们 將将 '
+    '並并 門门 當当 無无 爲为 於于 師师 們们 萬万 億亿 兩两 幾几 擴扩 盤盘 讀读 舊旧 鍵键 值值'
+)
+TRADITIONAL_TO_SIMPLIFIED = {ord(pair[0]): pair[1] for pair in _TRADITIONAL_PAIRS.split() if pair[0] != pair[1]}
+
+_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_UNITS = {'十': 10, '百': 100, '千': 1000, '万': 10000}
+# 以数字或"十"开头的汉字数字串 (不匹配"万一"、"千万"这类以单位开头的词)
+_NUMBER_RUN = re.compile(r'[零〇一二三四五六七八九十][零〇一二两三四五六七八九十百千万]*')
+# 逐位读的数字串 (不含十百千万) 只有后接这些字时才当作数字 ("二零二三年"、"八零八零端口")。
+# 个、次、号 不在其中：逐位读再接它们多是约数或列举 ("三四五个"、"一三五号")，
+# 真正的数量会带单位读出 ("三十一号"、"一百个")，走带单位的分支
+_NUMERIC_CLASSIFIERS = frozenset('年端版届期')
+
+
+def parse_chinese_number(text: str) -> Optional[int]:
+    """把汉字数字串解析为整数，无法解析时返回None"""
+    if all(c in _DIGITS for c in text):
+        # 逐位读法：二零二三
+        return int(''.join(str(_DIGITS[c]) for c in text))
+    total, section, digit = 0, 0, None
+    for c in text:
+        if _DIGITS.get(c) == 0:
+            continue  # "一百零五" 中的零只是占位
+        if c in _DIGITS:
+            if digit is not None:
+                return None  # 连续两个数字 (如"三四十") 是约数，不转换
+            digit = _DIGITS[c]
+        elif c == '万':
+            total += (section + (digit or 0)) * 10000
+            section, digit = 0, None
+        else:
+            section += (1 if digit is None else digit) * _UNITS[c]
+            digit = None
+    return total + section + (digit or 0)
+
+
+def _replace_number(match: 're.Match') -> str:
+    text = match.group(0)
+    # 单个汉字数字 ("一下"、"三次") 保持原样
+    if len(text) < 2:
+        return text
+    if not any(c in _UNITS for c in text):
+        # 逐位读的数字串 ("一一对应"、"一三五号") 多是列举或成语，后接量词 ("二零二三年") 才转换
+        following = match.string[match.end():match.end() + 1]
+        if len(text) < 3 or following not in _NUMERIC_CLASSIFIERS:
+            return text
+    value = parse_chinese_number(text)
+    return text if value is None else str(value)
+
+
+def load_word_file(path: str) -> List[str]:
+    """读取词表文件：每行一个词，忽略空行和 # 开头的注释"""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class AhoCorasick:
+    """多模式串匹配自动机，一次扫描找出所有口头语的位置"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态上结束的所有模式串长度
+        self._out: List[Tuple[int, ...]] = [()]
+        for pattern in patterns:
+            if pattern:
+                self._insert(pattern)
+        self._build()
+
+    def _insert(self, pattern: str) -> None:
+        state = 0
+        for c in pattern:
+            nxt = self._goto[state].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] += (len(pattern),)
+
+    def _build(self) -> None:
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for c, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(c, 0)
+                self._fail[nxt] = candidate if candidate != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def remove(self, text: str) -> str:
+        """去掉所有匹配 (最左最长、互不重叠)"""
+        matches = []
+        state = 0
+        for i, c in enumerate(text):
+            while state and c not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(c, 0)
+            for length in self._out[state]:
+                matches.append((i + 1 - length, i + 1))
+        if not matches:
+            return text
+        matches.sort(key=lambda span: (span[0], -span[1]))
+        pieces = []
+        pos = 0
+        for start, end in matches:
+            if start >= pos:
+                pieces.append(text[pos:start])
+                pos = end
+        pieces.append(text[pos:])
+        return ''.join(pieces)
+
+
+class TextNormalizer:
+    """可配置的文本规范化流水线，查询和知识库问题使用同一个实例保证一致"""
+
+    def __init__(self, stop_words: Optional[Iterable[str]] = None, stop_words_path: Optional[str] = None,
+                 fillers: Optional[Iterable[str]] = None, fillers_path: Optional[str] = None,
+                 full_width: bool = True, to_simplified: bool = True, remove_fillers: bool = True,
+                 normalize_numbers: bool = True, cache_size: int = 4096):
+        """
+        Args:
+            stop_words: 停用词，默认 DEFAULT_STOP_WORDS
+            stop_words_path: 停用词文件，设置时替换 stop_words
+            fillers: 口头语，默认 DEFAULT_FILLERS
+            fillers_path: 口头语文件，设置时替换 fillers
+            full_width: 是否全角转半角
+            to_simplified: 是否繁体转简体
+            remove_fillers: 是否去除口头语
+            normalize_numbers: 是否把汉字数字串转为阿拉伯数字
+            cache_size: 结果缓存的条数
+        """
+        if stop_words_path:
+            stop_words = load_word_file(stop_words_path)
+        if fillers_path:
+            fillers = load_word_file(fillers_path)
+        self.stop_words: Set[str] = set(DEFAULT_STOP_WORDS if stop_words is None else stop_words)
+        self.filler_words = list(DEFAULT_FILLERS if fillers is None else fillers) if remove_fillers else []
+        self.fillers = AhoCorasick(self.filler_words) if remove_fillers else None
+        self.full_width = full_width
+        self.normalize_numbers = normalize_numbers
+        self._t2s = None
+        if to_simplified:
+            self._t2s = self._create_opencc() or TRADITIONAL_TO_SIMPLIFIED
+        self._cached = lru_cache(maxsize=cache_size)(self._normalize)
+        jieba.lcut("预热", cut_all=False)
+
+    @property
+    def signature(self) -> str:
+        """配置指纹：词表或步骤变化时，按旧配置缓存的规范化结果失效"""
+        digest = hashlib.sha1(PIPELINE_VERSION.encode('utf-8'))
+        for part in (sorted(self.stop_words), sorted(self.filler_words),
+                     [self.full_width, type(self._t2s).__name__, self.normalize_numbers]):
+            digest.update(json.dumps(part, ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _create_opencc():
+        if not OPENCC_AVAILABLE:
+            return None
+        for config in ('t2s', 't2s.json'):
+            try:
+                return opencc.OpenCC(config)
+            except Exception:
+                continue
+        return None
+
+    def normalize_chars(self, text: str) -> str:
+        """字符级规范化 (全角、繁简、口头语、数字)，不分词"""
+        text = text.strip()
+        if self.full_width:
+            text = text.translate(FULL_TO_HALF)
+        if self._t2s is not None:
+            text = text.translate(self._t2s) if isinstance(self._t2s, dict) else self._t2s.convert(text)
+        if self.fillers:
+            text = self.fillers.remove(text)
+        if self.normalize_numbers:
+            text = _NUMBER_RUN.sub(_replace_number, text)
+        return text
+
+    def _normalize(self, text: str) -> str:
+        chars = self.normalize_chars(text)
+        words = jieba.lcut(chars, cut_all=False)
+        # 一次遍历：宽松结果只去停用词和空白，严格结果再去掉单字
+        loose, strict = [], []
+        for word in words:
+            if word in self.stop_words or word.isspace():
+                continue
+            loose.append(word)
+            if len(word) > 1:
+                strict.append(word)
+        # 严格过滤后为空时 (如"为什么呢")，退回只去停用词的结果
+        return ''.join(strict or loose)
+
+    def normalize(self, text: str) -> str:
+        """
+        规范化一段文本
+
+        Args:
+            text: ASR识别出的原始文本或知识库问题
+
+        Returns:
+            由关键词组成的更干净的文本
+        """
+        if not text or not text.strip():
+            return ""
+        cleaned = self._cached(text)
+        logger.debug("原始文本: '%s' -> 清理后: '%s'", text, cleaned)
+        return cleaned
+
+    def normalize_batch(self, texts: Iterable[str]) -> List[str]:
+        """批量规范化，重复文本只处理一次"""
+        texts = list(texts)
+        results = {text: self.normalize(text) for text in dict.fromkeys(texts)}
+        return [results[text] for text in texts]
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+class RefinedProcessor(TextNormalizer):
+    """识别文本清洗 (保留原有接口)：clean_and_rebuild 即 normalize"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        print("✓ 文本处理器初始化完成")
+
+    def clean_and_rebuild(self, text: str) -> str:
+        """
+        对文本进行规范化、分词，移除停用词，然后重组成一个干净的句子。
+        Args:
+            text: ASR识别出的原始文本
+
+        Returns:
+            由关键词组成的更干净的文本字符串
+        """
+        return self.normalize(text)
+
+
+def processor_from_env() -> RefinedProcessor:
+    """
+    服务端与离线工具共用的文本清洗器：停用词和口头语可以用 INTERVIEW_STOP_WORDS / INTERVIEW_FILLERS
+    指定词表文件 (每行一个词)；知识库问题构建索引时使用同样的配置。
+    """
+    return RefinedProcessor(stop_words_path=os.environ.get('INTERVIEW_STOP_WORDS') or None,
+                            fillers_path=os.environ.get('INTERVIEW_FILLERS') or None)
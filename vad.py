@@ -0,0 +1,186 @@
+# vad.py - 服务端语音活动检测(VAD)与断句
+import numpy as np
+from collections import deque
+from typing import List, Optional
+
+
+class VADConfig:
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 30, margin_db: float = 12.0,
+                 min_energy_db: float = -55.0, flatness_max: float = 0.45, hangover_ms: int = 450,
+                 min_speech_ms: int = 300, max_utterance_ms: int = 15000, pre_roll_ms: int = 210,
+                 start_frames: int = 3, noise_window_ms: int = 3000, noise_rise: float = 0.02):
+        """
+        VAD参数
+
+        Args:
+            sample_rate: 输入PCM采样率 (16位单声道)
+            frame_ms: 分帧长度(毫秒)
+            margin_db: 能量需高出噪声基底多少dB才算语音
+            min_energy_db: 绝对能量下限(dBFS)，低于此值一律视为静音
+            flatness_max: 频谱平坦度上限，噪声接近1，语音明显更低
+            hangover_ms: 语音结束后持续静音多久才断句
+            min_speech_ms: 有效语音最短时长，更短的片段被丢弃
+            max_utterance_ms: 单句最长时长，超过后强制断句
+            pre_roll_ms: 断句时向前保留的音频，避免吞掉首字
+            start_frames: 连续多少帧语音才触发开始
+            noise_window_ms: 最小值统计窗口，窗口内能量最低的帧高于噪声基底时说明环境变吵了
+            noise_rise: 噪声基底向窗口最小值靠拢的每帧比例
+        """
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.margin_db = margin_db
+        self.min_energy_db = min_energy_db
+        self.flatness_max = flatness_max
+        self.hangover_ms = hangover_ms
+        self.min_speech_ms = min_speech_ms
+        self.max_utterance_ms = max_utterance_ms
+        self.pre_roll_ms = pre_roll_ms
+        self.start_frames = start_frames
+        self.noise_window_ms = noise_window_ms
+        self.noise_rise = noise_rise
+
+    @property
+    def frame_samples(self) -> int:
+        return self.sample_rate * self.frame_ms // 1000
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.frame_samples * 2
+
+    def frames_for(self, ms: int) -> int:
+        return max(1, ms // self.frame_ms)
+
+
+def classify_frames(frames: np.ndarray, noise_floor_db: float, config: VADConfig):
+    """
+    对一批帧做向量化的语音判定
+
+    Args:
+        frames: 形状为 (帧数, 每帧采样数) 的int16数组
+        noise_floor_db: 当前噪声基底(dBFS)
+        config: VAD参数
+
+    Returns:
+        (是否语音的布尔数组, 每帧能量dB数组)
+    """
+    x = frames.astype(np.float32) / 32768.0
+    energy_db = 10.0 * np.log10(np.mean(x * x, axis=1) + 1e-10)
+
+    # 频谱平坦度 = 几何平均 / 算术平均，白噪声接近1，浊音远小于1
+    window = np.hanning(frames.shape[1]).astype(np.float32)
+    power = np.abs(np.fft.rfft(x * window, axis=1)) ** 2 + 1e-10
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+    is_speech = ((energy_db > noise_floor_db + config.margin_db)
+                 & (energy_db > config.min_energy_db)
+                 & (flatness < config.flatness_max))
+    return is_speech, energy_db
+
+
+class StreamingEndpointer:
+    """
+    将连续的PCM流切分为一句一句的语音片段
+
+    使用方式：不断调用 feed() 送入任意长度的PCM字节，返回已完成的语音片段；
+    流结束时调用 flush() 取出最后一段。
+    """
+
+    def __init__(self, config: Optional[VADConfig] = None):
+        self.config = config or VADConfig()
+        self.noise_floor_db = -60.0
+        self._pending = bytearray()
+        self._pre_roll = deque(maxlen=self.config.frames_for(self.config.pre_roll_ms))
+        self._utterance = bytearray()
+        self._in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._speech_frames = 0
+        self._recent_energy = deque(maxlen=self.config.frames_for(self.config.noise_window_ms))
+        self.stats = {'frames': 0, 'speech_frames': 0, 'utterances': 0, 'discarded': 0}
+
+    def feed(self, pcm: bytes) -> List[bytes]:
+        """送入PCM数据，返回本次完成的语音片段列表"""
+        cfg = self.config
+        self._pending.extend(pcm)
+        n_frames = len(self._pending) // cfg.frame_bytes
+        if n_frames == 0:
+            return []
+
+        usable = n_frames * cfg.frame_bytes
+        chunk = bytes(self._pending[:usable])
+        del self._pending[:usable]
+        frames = np.frombuffer(chunk, dtype='<i2').reshape(n_frames, cfg.frame_samples)
+        is_speech, energy_db = classify_frames(frames, self.noise_floor_db, cfg)
+
+        # 用非语音帧缓慢更新噪声基底，适应环境噪声变化
+        noise = energy_db[~is_speech]
+        if noise.size:
+            self.noise_floor_db = 0.9 * self.noise_floor_db + 0.1 * float(np.median(noise))
+        # 噪声变大后所有帧都被判为语音，上面的更新不再发生，句子永远不结束；
+        # 因此再看最近一个窗口内能量最低的帧 (说话总有停顿)，它高于基底时让基底缓慢上移
+        self._recent_energy.extend(energy_db.tolist())
+        if len(self._recent_energy) == self._recent_energy.maxlen:
+            window_min = min(self._recent_energy)
+            if window_min > self.noise_floor_db:
+                rise = 1.0 - (1.0 - cfg.noise_rise) ** n_frames
+                self.noise_floor_db += rise * (window_min - self.noise_floor_db)
+
+        view = memoryview(chunk)
+        frame_views = [view[i * cfg.frame_bytes:(i + 1) * cfg.frame_bytes] for i in range(n_frames)]
+
+        self.stats['frames'] += n_frames
+        self.stats['speech_frames'] += int(is_speech.sum())
+
+        completed = []
+        for frame, speech in zip(frame_views, is_speech):
+            utterance = self._step(frame, bool(speech))
+            if utterance is not None:
+                completed.append(utterance)
+        return completed
+
+    def _step(self, frame: memoryview, speech: bool) -> Optional[bytes]:
+        cfg = self.config
+        if not self._in_speech:
+            self._pre_roll.append(frame)
+            self._speech_run = self._speech_run + 1 if speech else 0
+            if self._speech_run >= cfg.start_frames:
+                self._in_speech = True
+                self._utterance = bytearray().join(self._pre_roll)
+                self._pre_roll.clear()
+                self._speech_frames = self._speech_run
+                self._silence_run = 0
+            return None
+
+        self._utterance.extend(frame)
+        if speech:
+            self._speech_frames += 1
+            self._silence_run = 0
+        else:
+            self._silence_run += 1
+
+        too_long = len(self._utterance) // cfg.frame_bytes >= cfg.frames_for(cfg.max_utterance_ms)
+        if self._silence_run >= cfg.frames_for(cfg.hangover_ms) or too_long:
+            return self._finish()
+        return None
+
+    def _finish(self) -> Optional[bytes]:
+        cfg = self.config
+        utterance = bytes(self._utterance)
+        speech_frames = self._speech_frames
+        self._utterance = bytearray()
+        self._in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._speech_frames = 0
+
+        if speech_frames < cfg.frames_for(cfg.min_speech_ms):
+            self.stats['discarded'] += 1
+            return None
+        self.stats['utterances'] += 1
+        return utterance
+
+    def flush(self) -> Optional[bytes]:
+        """流结束时取出尚未断句的最后一段语音"""
+        if not self._in_speech:
+            return None
+        return self._finish()
@@ -0,0 +1,268 @@
+# vector_store.py - 磁盘上的只读向量索引
+"""
+目录结构 (<目录> 实际为 <索引名>.<内容指纹前12位>，重建时写入新目录，不覆盖仍被mmap的旧目录):
+
+    <目录>/embeddings.npy   已L2归一化的 float32 矩阵 (行数 x 维度)
+    <目录>/entries.npy      可选，每个条目第一行的行号 (一个条目有多个说法时)
+    <目录>/meta.json        模型名称、行数、条目数、维度、内容指纹
+
+每一行是一个问题说法，同一条目 (同一个答案) 的多个说法在矩阵中连续存放，
+条目的相似度取其所有说法相似度的最大值。
+
+以 mmap 方式加载：多个worker进程打开同一份文件时共享操作系统的页缓存，
+物理内存中只有一份向量；fork之前在父进程打开的映射同样被子进程共享。
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+ENTRIES_FILE = 'entries.npy'
+META_FILE = 'meta.json'
+
+
+def texts_fingerprint(texts: Iterable[str], model_name: str) -> str:
+    """问题文本 + 模型名称的内容指纹，任一变化都需要重新编码"""
+    digest = hashlib.sha1(model_name.encode('utf-8'))
+    for text in texts:
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def version_dir(directory: str, fingerprint: str) -> str:
+    """按内容指纹命名的索引目录 <directory>.<指纹前12位>"""
+    return f"{directory}.{fingerprint[:12]}"
+
+
+def store_versions(directory: str) -> List[str]:
+    """同一索引名下已有的全部版本目录 (含未带版本号的旧目录)"""
+    versions = glob.glob(glob.escape(directory) + '.' + '[0-9a-f]' * 12)
+    if os.path.isdir(directory):
+        versions.append(directory)
+    return versions
+
+
+def remove_stale_versions(directory: str, keep: str):
+    """尽力删除旧版本目录，仍被映射 (Windows) 等无法删除的留待下次重建"""
+    for path in store_versions(directory):
+        if os.path.abspath(path) != os.path.abspath(keep):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2归一化，之后点积即为余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorStore:
+    """只读的向量矩阵，提供向量化的相似度计算"""
+
+    def __init__(self, directory: str, vectors: np.ndarray, meta: dict,
+                 entry_offsets: Optional[np.ndarray] = None):
+        self.directory = directory
+        self.vectors = vectors
+        self.meta = meta
+        # 为None时每行就是一个条目
+        self.entry_offsets = entry_offsets
+
+    @classmethod
+    def open(cls, directory: str, fingerprint: Optional[str] = None,
+             mmap: bool = True) -> Optional['VectorStore']:
+        """
+        打开已有的向量索引
+
+        Args:
+            directory: 索引名 (不含版本号)
+            fingerprint: 期望的内容指纹，据此定位版本目录；为None时直接打开 directory
+            mmap: 是否以只读mmap方式加载
+
+        Returns:
+            VectorStore；不存在、损坏或过期时返回None
+        """
+        if fingerprint is not None:
+            directory = version_dir(directory, fingerprint)
+        meta_path = os.path.join(directory, META_FILE)
+        vectors_path = os.path.join(directory, EMBEDDINGS_FILE)
+        if not (os.path.exists(meta_path) and os.path.exists(vectors_path)):
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if fingerprint is not None and meta.get('fingerprint') != fingerprint:
+                return None
+            vectors = np.load(vectors_path, mmap_mode='r' if mmap else None)
+            entries_path = os.path.join(directory, ENTRIES_FILE)
+            entry_offsets = np.load(entries_path) if os.path.exists(entries_path) else None
+        except (OSError, ValueError):
+            return None
+        if vectors.shape != (meta.get('count'), meta.get('dim')):
+            return None
+        if entry_offsets is not None and len(entry_offsets) != meta.get('entries'):
+            return None
+        return cls(directory, vectors, meta, entry_offsets)
+
+    @classmethod
+    def create(cls, directory: str, vectors: np.ndarray, fingerprint: str, model_name: str,
+               entry_offsets: Optional[np.ndarray] = None, mmap: bool = True, **extra_meta) -> 'VectorStore':
+        """
+        写入新的向量索引 (先写临时目录再改名为版本目录) 并重新打开
+
+        Args:
+            entry_offsets: 每个条目第一行的行号 (严格递增、从0开始)；每行一个条目时传None
+        """
+        vectors = normalize_rows(vectors)
+        tmp_dir = cls._make_tmp_dir(version_dir(directory, fingerprint))
+        np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), vectors)
+        dim = int(vectors.shape[1]) if vectors.ndim == 2 else 0
+        return cls._commit(tmp_dir, directory, int(vectors.shape[0]), dim, fingerprint, model_name,
+                           entry_offsets, mmap, extra_meta)
+
+    @classmethod
+    def create_from_shards(cls, directory: str, shard_paths: List[str], fingerprint: str, model_name: str,
+                           entry_offsets: Optional[np.ndarray] = None, mmap: bool = True,
+                           **extra_meta) -> 'VectorStore':
+        """
+        把按顺序编号的 .npy 分片拼接为向量索引，同一时间内存中只有一个分片
+
+        Args:
+            shard_paths: 分片路径，按行顺序排列
+        """
+        shapes = [np.load(path, mmap_mode='r').shape for path in shard_paths]
+        count = sum(shape[0] for shape in shapes)
+        dim = int(shapes[0][1]) if shapes else 0
+        tmp_dir = cls._make_tmp_dir(version_dir(directory, fingerprint))
+        out = np.lib.format.open_memmap(os.path.join(tmp_dir, EMBEDDINGS_FILE), mode='w+',
+                                        dtype=np.float32, shape=(count, dim))
+        row = 0
+        for path in shard_paths:
+            shard = normalize_rows(np.load(path))
+            out[row:row + len(shard)] = shard
+            row += len(shard)
+        out.flush()
+        del out
+        return cls._commit(tmp_dir, directory, count, dim, fingerprint, model_name,
+                           entry_offsets, mmap, extra_meta)
+
+    @staticmethod
+    def _make_tmp_dir(directory: str) -> str:
+        tmp_dir = directory + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        return tmp_dir
+
+    @classmethod
+    def _commit(cls, tmp_dir: str, directory: str, count: int, dim: int, fingerprint: str, model_name: str,
+                entry_offsets: Optional[np.ndarray], mmap: bool, extra_meta: dict) -> 'VectorStore':
+        """写入条目分组和元数据，把临时目录改名为本指纹的版本目录后重新打开，并尽力清理旧版本"""
+        entries = count
+        if entry_offsets is not None:
+            entry_offsets = np.asarray(entry_offsets, dtype=np.int64)
+            entries = len(entry_offsets)
+            if entries != count:  # 每个条目只有一个说法时不需要分组文件
+                np.save(os.path.join(tmp_dir, ENTRIES_FILE), entry_offsets)
+        meta = {
+            'model_name': model_name,
+            'count': count,
+            'entries': entries,
+            'dim': dim,
+            'fingerprint': fingerprint,
+        }
+        meta.update(extra_meta)
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        target = version_dir(directory, fingerprint)
+        # 同一指纹的目录只会是上次写到一半或已损坏的，没有人在使用
+        shutil.rmtree(target, ignore_errors=True)
+        os.rename(tmp_dir, target)
+        store = cls.open(directory, fingerprint, mmap=mmap)
+        remove_stale_versions(directory, keep=target)
+        return store
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    @property
+    def entry_count(self) -> int:
+        return len(self.entry_offsets) if self.entry_offsets is not None else len(self)
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.vectors.nbytes)
+
+    @property
+    def shape(self):
+        return self.vectors.shape
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        计算余弦相似度
+
+        Args:
+            queries: 已归一化的查询向量，一维 (维度,) 或二维 (查询数, 维度)
+
+        Returns:
+            一维 (行数,) 或二维 (查询数, 行数) 的相似度
+        """
+        return np.asarray(queries, dtype=np.float32) @ self.vectors.T
+
+    def entry_scores(self, scores: np.ndarray) -> np.ndarray:
+        """
+        把按行 (说法) 的相似度汇总为按条目的相似度：每个条目取其所有说法中的最大值
+
+        Args:
+            scores: scores() 的结果，一维或二维
+        """
+        if self.entry_offsets is None:
+            return scores
+        return np.maximum.reduceat(scores, self.entry_offsets, axis=-1)
+
+    def search_entries(self, queries: np.ndarray) -> np.ndarray:
+        """查询向量与每个条目的相似度"""
+        return self.entry_scores(self.scores(queries))
+
+    def save_arrays(self, name: str, **arrays) -> str:
+        """
+        在索引目录中保存附属数组 (阈值校准、聚类等)
+
+        同时记录当前索引的指纹，索引重建后旧的附属数据自动失效。
+        """
+        path = os.path.join(self.directory, name + '.npz')
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, fingerprint=np.array(self.meta['fingerprint']), **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    def load_arrays(self, name: str) -> Optional[Dict[str, np.ndarray]]:
+        """读取附属数组，不存在或与当前索引不匹配时返回None"""
+        path = os.path.join(self.directory, name + '.npz')
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if str(data['fingerprint']) != self.meta['fingerprint']:
+                    return None
+                return {key: data[key] for key in data.files if key != 'fingerprint'}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """一维相似度中最高的k个下标，按相似度降序"""
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k == scores.shape[0]:
+            candidates = np.arange(k)
+        else:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        return candidates[np.argsort(-scores[candidates], kind='stable')]